@@ -6,25 +6,44 @@ web interface with Gradio, and handles the interaction between the user and
 the agent.
 """
 
+import threading
+
 import gradio as gr
 from dotenv import load_dotenv
 
 # We must load environment variables (like API keys) at the very start.
 load_dotenv()
 
-# Import the function that builds our compiled agent.
-from src.agent.graph import get_agent_runnable
+from src.core.singleflight import SingleFlight
 
 # --- 1. Agent Initialization ---
 
-# Create the compiled LangGraph agent. This is a stateful, runnable object.
-# This happens once when the application starts.
-try:
-    agent_runnable = get_agent_runnable()
-    print("✅ Agent runnable compiled successfully.")
-except Exception as e:
-    print(f"🔥 Failed to compile agent runnable: {e}")
-    agent_runnable = None
+# The compiled LangGraph agent is built on first use rather than on import:
+# the graph pulls in LangGraph and the tools, and its LLM client is itself
+# only created on the first request (see `src.agent.llm`).
+_agent_runnable = None
+_agent_failed = False
+_agent_lock = threading.Lock()
+
+def get_agent():
+    """Returns the compiled agent, building it on the first call. None if that failed."""
+    global _agent_runnable, _agent_failed
+    if _agent_runnable is None and not _agent_failed:
+        with _agent_lock:
+            if _agent_runnable is None and not _agent_failed:
+                try:
+                    from src.agent.checkpoints import get_checkpointer
+                    from src.agent.graph import get_agent_runnable
+                    # Checkpoints let a retried request resume its failed run.
+                    _agent_runnable = get_agent_runnable(checkpointer=get_checkpointer())
+                    print("✅ Agent runnable compiled successfully.")
+                except Exception as e:
+                    print(f"🔥 Failed to compile agent runnable: {e}")
+                    _agent_failed = True
+    return _agent_runnable
+
+# Identical requests submitted at the same time share one graph execution.
+request_flights = SingleFlight()
 
 # --- 2. Core Application Logic ---
 
@@ -33,6 +52,7 @@ def run_unfold_quest(user_request: str):
     This function is the primary interface between the Gradio UI and the agent.
     It takes the user's text input, invokes the agent, and streams the output.
     """
+    agent_runnable = get_agent()
     if not agent_runnable:
         return "❌ **System Error**: The agent failed to initialize. Please check the logs and try again."
 
@@ -40,19 +60,31 @@ def run_unfold_quest(user_request: str):
     if not user_request or not user_request.strip():
         return "📝 **Please enter your quest**: Describe where you'd like to go in Riga!"
 
-    # The initial state for the graph is a dictionary with the input key.
-    initial_state = {"original_user_request": user_request.strip()}
-    
-    # We use `stream` instead of `invoke` to get intermediate steps, which is
-    # great for showing the "thought process" in a more advanced UI later.
-    # For now, we'll just process the stream to get the final state.
-    print(f"\n🚀 Invoking agent for request: '{user_request}'")
-    final_state = None
-    try:
+    from src.agent.checkpoints import stream_with_resume
+    from src.agent.graph import normalize_request
+    request_key = normalize_request(user_request)
+
+    def run_graph():
+        # We use `stream` instead of `invoke` to get intermediate steps, which is
+        # great for showing the "thought process" in a more advanced UI later.
+        # For now, we'll just process the stream to get the final state.
+        print(f"\n🚀 Invoking agent for request: '{user_request}'")
+        final_state = None
         # The `stream` method yields the state after each node completes.
         # We iterate through them but only care about the very last one.
-        for state_update in agent_runnable.stream(initial_state):
+        # Runs are checkpointed: a retry of the same normalized request after a
+        # failure resumes where the failed run stopped instead of starting over.
+        for state_update in stream_with_resume(agent_runnable, user_request.strip(), request_key):
             final_state = state_update
+        return final_state
+
+    try:
+        # Concurrent duplicates (same normalized text) wait for one execution
+        # and share its final state; the response is built per caller below.
+        final_state, shared = request_flights.do(request_key, run_graph)
+        if shared:
+            print(f"🔗 Shared the result of an identical in-flight request: '{user_request}'")
+        final_state = dict(final_state) if final_state else final_state
 
         # The final state contains the `final_response` we want to display.
         if final_state and "final_response" in final_state:
@@ -182,10 +214,16 @@ with gr.Blocks(
 # --- 4. Application Launch ---
 
 if __name__ == "__main__":
-    if agent_runnable is None:
+    if get_agent() is None:
         print("❌ Could not start the application because the agent failed to initialize.")
         print("🔍 Please check your environment variables and dependencies.")
     else:
+        # Load the data, fault in the indexes and prepare the LLM client before
+        # accepting traffic, so the first request is not slower than the rest.
+        from src.agent.warmup import is_ready, warm_up
+        warm_up()
+        print(f"🔥 Worker warmed up (ready: {is_ready()}).")
+
         print("🚀 Launching Gradio UI...")
         print("🌍 Agent powered by Gemini 2.5 Flash")
         print("📍 Ready to create quests in Riga!")
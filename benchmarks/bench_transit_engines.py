@@ -0,0 +1,154 @@
+"""
+Benchmark comparing the journey planning engines of `TransitPlanner`.
+
+Runs the same set of random depart-at and arrive-by queries through the
+merge-based engine and the Connection Scan (CSA) engine and reports load time,
+peak memory, mean query latency and how often each engine found a journey.
+Each engine runs in a fresh subprocess so peak memory is measured separately.
+
+By default the GTFS feed in `data/gtfs` is used. Since `stop_times.txt` is not
+checked into the repository, a synthetic feed can be generated instead:
+
+    python -m benchmarks.bench_transit_engines --synthetic
+    python -m benchmarks.bench_transit_engines --synthetic --trips-per-route 600
+    python -m benchmarks.bench_transit_engines --gtfs-dir path/to/feed --queries 200
+"""
+
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+import random
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from src.core.models import Coordinates
+from src.tools import transit_planner
+
+# --- Synthetic Feed Generation ---
+
+def write_synthetic_feed(target_dir: str, num_routes: int = 40, stops_per_route: int = 25,
+                         trips_per_route: int = 60, seed: int = 7):
+    """
+    Writes a grid-like GTFS feed where routes share stops, so that journeys
+    with transfers exist. Trips run every 15 minutes from 06:00, or more
+    often when needed to fit all trips into an 18 hour service day.
+    """
+    rng = random.Random(seed)
+    headway_s = min(900, 18 * 3600 // trips_per_route)
+    grid = 30
+    stops = [(f"s{x}_{y}", 56.90 + y * 0.003, 24.00 + x * 0.005) for x in range(grid) for y in range(grid)]
+
+    with open(os.path.join(target_dir, 'stops.txt'), 'w') as f:
+        f.write("stop_id,stop_name,stop_lat,stop_lon\n")
+        for stop_id, lat, lon in stops:
+            f.write(f"{stop_id},Stop {stop_id},{lat:.5f},{lon:.5f}\n")
+
+    with open(os.path.join(target_dir, 'routes.txt'), 'w') as f:
+        f.write("route_id,route_short_name,route_type\n")
+        for r in range(num_routes):
+            f.write(f"route_{r},{r + 1},{rng.choice([0, 3, 800])}\n")
+
+    with open(os.path.join(target_dir, 'trips.txt'), 'w') as trips_f, \
+            open(os.path.join(target_dir, 'stop_times.txt'), 'w') as times_f:
+        trips_f.write("route_id,service_id,trip_id,trip_headsign\n")
+        times_f.write("trip_id,arrival_time,departure_time,stop_id,stop_sequence\n")
+        for r in range(num_routes):
+            # A random monotone walk over the grid gives each route its stop pattern.
+            x, y = rng.randrange(grid), rng.randrange(grid)
+            pattern = []
+            for _ in range(stops_per_route):
+                pattern.append(f"s{x}_{y}")
+                if rng.random() < 0.5:
+                    x = min(grid - 1, x + 1)
+                else:
+                    y = min(grid - 1, y + 1)
+            for t in range(trips_per_route):
+                trip_id = f"trip_{r}_{t}"
+                trips_f.write(f"route_{r},weekday,{trip_id},Terminal {r}\n")
+                clock = 6 * 3600 + t * headway_s + rng.randrange(300)
+                for seq, stop_id in enumerate(pattern, start=1):
+                    hhmmss = f"{clock // 3600:02d}:{(clock % 3600) // 60:02d}:{clock % 60:02d}"
+                    times_f.write(f"{trip_id},{hhmmss},{hhmmss},{stop_id},{seq}\n")
+                    clock += 90 + rng.randrange(60)
+
+# --- Benchmark Harness ---
+
+def _random_queries(gtfs_dir: str, count: int, seed: int):
+    """
+    Draws random (start, end, time, arrive_by) queries. Both endpoints lie on
+    the same trip, so that the direct-only merge engine has something to find.
+    """
+    rng = random.Random(seed)
+    coords = pd.read_csv(os.path.join(gtfs_dir, 'stops.txt'), dtype={'stop_id': str}).set_index('stop_id')
+    stop_times = pd.read_csv(os.path.join(gtfs_dir, 'stop_times.txt'), dtype={'trip_id': str, 'stop_id': str},
+                             usecols=['trip_id', 'stop_id', 'stop_sequence'])
+    patterns = stop_times.sort_values('stop_sequence').groupby('trip_id')['stop_id'].apply(list).tolist()
+    queries = []
+    for _ in range(count):
+        pattern = rng.choice(patterns)
+        a, b = sorted(rng.sample(range(len(pattern)), 2))
+        start = Coordinates(latitude=float(coords.loc[pattern[a], 'stop_lat']), longitude=float(coords.loc[pattern[a], 'stop_lon']))
+        end = Coordinates(latitude=float(coords.loc[pattern[b], 'stop_lat']), longitude=float(coords.loc[pattern[b], 'stop_lon']))
+        minutes = rng.randrange(7 * 60, 20 * 60)
+        queries.append((start, end, f"{minutes // 60:02d}:{minutes % 60:02d}", rng.random() < 0.5))
+    return queries
+
+def run_benchmark(engine: str, gtfs_dir: str, queries_count: int, seed: int) -> dict:
+    """Loads a planner with the given engine and times the query workload."""
+    transit_planner.GTFS_DATA_DIR = gtfs_dir
+    with contextlib.redirect_stdout(io.StringIO()):
+        load_start = time.perf_counter()
+        planner = transit_planner.TransitPlanner(engine=engine)
+        load_s = time.perf_counter() - load_start
+        # ru_maxrss is in kilobytes on Linux.
+        peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+        queries = _random_queries(gtfs_dir, queries_count, seed)
+        found = 0
+        query_start = time.perf_counter()
+        for start, end, time_str, arrive_by in queries:
+            if arrive_by:
+                plan = planner.plan_journey(start, end, arrival_time_str=time_str)
+            else:
+                plan = planner.plan_journey(start, end, departure_time_str=time_str)
+            found += plan is not None
+        query_s = time.perf_counter() - query_start
+
+    return {
+        'engine': engine,
+        'load_s': load_s,
+        'peak_mb': peak_mb,
+        'mean_query_ms': 1000 * query_s / max(len(queries), 1),
+        'found': found,
+        'queries': len(queries),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark TransitPlanner engines.")
+    parser.add_argument('--gtfs-dir', default=transit_planner.GTFS_DATA_DIR, help="Directory with the GTFS .txt files.")
+    parser.add_argument('--synthetic', action='store_true', help="Generate and use a synthetic feed.")
+    parser.add_argument('--trips-per-route', type=int, default=60, help="Size of the synthetic feed.")
+    parser.add_argument('--queries', type=int, default=100, help="Number of random queries per engine.")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        gtfs_dir = tmp_dir if args.synthetic else args.gtfs_dir
+        if args.synthetic:
+            write_synthetic_feed(tmp_dir, trips_per_route=args.trips_per_route)
+
+        print(f"{'engine':<8}{'load (s)':>10}{'peak (MB)':>11}{'query (ms)':>12}{'found':>10}")
+        for engine in transit_planner.ENGINES:
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                result = pool.submit(run_benchmark, engine, gtfs_dir, args.queries, args.seed).result()
+            print(f"{result['engine']:<8}{result['load_s']:>10.2f}{result['peak_mb']:>11.1f}"
+                  f"{result['mean_query_ms']:>12.2f}{result['found']:>6}/{result['queries']}")
+
+if __name__ == "__main__":
+    main()
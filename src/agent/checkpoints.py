@@ -0,0 +1,243 @@
+"""
+Checkpointed execution of the agent graph, to resume after failures.
+
+Without checkpoints, a request whose quest synthesis fails (or whose LLM call
+times out) is retried from scratch, re-running the request parsing, transit
+planning and POI search. With a checkpointer, LangGraph saves the state after
+every node, and `stream_with_resume` uses it on a retry of the same request:
+- if the previous run stopped with an exception, it continues from the node
+  that raised, keeping the outputs of the nodes before it,
+- if the previous run completed but its quest synthesis failed (the node
+  records `failed_node`), it runs again from the checkpoint taken just before
+  `synthesize_quest`, reusing the transit plan and the POIs found.
+
+Every run gets a thread of its own. A run that completes successfully deletes
+its thread; a failed run's thread is remembered per request key (at most
+FAILED_THREADS_MAX of them) next to the checkpoints, for the next retry to
+resume: in a table of the SQLite database, where the other processes using it
+find it too, or in memory with the in-memory checkpointer. Runs still in
+progress are therefore never resumed. A failed run whose checkpoint is older
+than CHECKPOINT_RESUME_MAX_AGE_S is not resumed either: the retry starts afresh.
+
+The checkpoints are kept in a local SQLite database (GRAPH_CHECKPOINT_PATH)
+when langgraph-checkpoint-sqlite is installed, otherwise in memory.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+from langgraph.checkpoint.memory import MemorySaver
+
+try:
+    from langgraph.checkpoint.sqlite import SqliteSaver
+except ImportError:  # Optional dependency: checkpoints are then kept in memory.
+    SqliteSaver = None
+
+from .state import AgentState
+
+# --- Constants and Configuration ---
+
+GRAPH_CHECKPOINT_PATH = os.getenv(
+    "GRAPH_CHECKPOINT_PATH",
+    os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'checkpoints', 'graph.sqlite3'))
+
+# Older checkpoints are not resumed: the request's "now" has moved on.
+CHECKPOINT_RESUME_MAX_AGE_S = float(os.getenv("CHECKPOINT_RESUME_MAX_AGE_S", "3600"))
+
+# The node a failed synthesis is retried from.
+RESUME_NODE = "synthesize_quest"
+
+# How many failed runs are remembered for resuming; the oldest are deleted beyond it.
+FAILED_THREADS_MAX = int(os.getenv("FAILED_THREADS_MAX", "256"))
+
+# --- Checkpointer ---
+
+_checkpointer_instance = None
+
+def get_checkpointer() -> Any:
+    """Returns the shared checkpointer: SQLite-backed if available, in-memory otherwise."""
+    global _checkpointer_instance
+    if _checkpointer_instance is None:
+        if SqliteSaver is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(GRAPH_CHECKPOINT_PATH)), exist_ok=True)
+            connection = sqlite3.connect(GRAPH_CHECKPOINT_PATH, check_same_thread=False)
+            _checkpointer_instance = SqliteSaver(connection)
+        else:
+            print("Warning: langgraph-checkpoint-sqlite is not installed; keeping graph checkpoints in memory.")
+            _checkpointer_instance = MemorySaver()
+    return _checkpointer_instance
+
+# --- Resumable Execution ---
+
+def fresh_state(user_request: str) -> Dict[str, Any]:
+    """The input of a new run: the request, with every other field of the state unset."""
+    state: Dict[str, Any] = {name: None for name in AgentState.__annotations__}
+    state["original_user_request"] = user_request
+    return state
+
+def _is_recent(snapshot: Any) -> bool:
+    created_at = getattr(snapshot, 'created_at', None)
+    if not created_at:
+        return False
+    age = datetime.now(timezone.utc) - datetime.fromisoformat(created_at)
+    return age.total_seconds() <= CHECKPOINT_RESUME_MAX_AGE_S
+
+def resume_config(agent: Any, thread_id: str) -> Optional[Dict[str, Any]]:
+    """
+    The checkpoint to resume a thread's failed run from, or None to start afresh.
+
+    Returns:
+        A config pointing at the checkpoint, for `agent.stream(None, config)`.
+    """
+    config = {"configurable": {"thread_id": thread_id}}
+    snapshot = agent.get_state(config)
+    if not snapshot.values or not _is_recent(snapshot):
+        return None
+    if snapshot.next:
+        # The run stopped with an exception in one of the `next` nodes.
+        return snapshot.config
+    if snapshot.values.get('failed_node') == RESUME_NODE:
+        for earlier in agent.get_state_history(config):
+            if earlier.next == (RESUME_NODE,):
+                return earlier.config
+    return None
+
+# --- Failed Runs ---
+
+class FailedThreads:
+    """Request key -> thread of its latest failed run, kept in memory next to a MemorySaver's checkpoints."""
+
+    def __init__(self):
+        self._threads: "OrderedDict[str, str]" = OrderedDict()  # Oldest first
+        self._lock = threading.Lock()
+
+    def remember(self, request_key: str, thread_id: str) -> List[str]:
+        """Records the thread of a failed run. Returns the threads it replaces or pushes out."""
+        with self._lock:
+            dropped = [self._threads.pop(request_key, None)]
+            self._threads[request_key] = thread_id
+            while len(self._threads) > FAILED_THREADS_MAX:
+                dropped.append(self._threads.popitem(last=False)[1])
+        return [dropped_thread_id for dropped_thread_id in dropped if dropped_thread_id is not None]
+
+    def take(self, request_key: str) -> Optional[str]:
+        """Removes and returns the thread of the request's latest failed run, if any."""
+        with self._lock:
+            return self._threads.pop(request_key, None)
+
+class SqliteFailedThreads:
+    """
+    Request key -> thread of its latest failed run, kept in a table of the
+    checkpointer's SQLite database, so that the processes sharing the
+    checkpoints also share their failed runs.
+    """
+
+    def __init__(self, connection: sqlite3.Connection, lock: Optional[Any] = None):
+        self._connection = connection
+        self._lock = lock or threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS failed_threads ("
+                "request_key TEXT PRIMARY KEY, thread_id TEXT NOT NULL, failed_at REAL NOT NULL)")
+
+    def remember(self, request_key: str, thread_id: str) -> List[str]:
+        """Records the thread of a failed run. Returns the threads it replaces or pushes out."""
+        with self._lock, self._connection:
+            dropped = self._connection.execute(
+                "DELETE FROM failed_threads WHERE request_key = ? RETURNING thread_id",
+                (request_key,)).fetchall()
+            self._connection.execute(
+                "INSERT INTO failed_threads (request_key, thread_id, failed_at) VALUES (?, ?, ?)",
+                (request_key, thread_id, time.time()))
+            dropped += self._connection.execute(
+                "DELETE FROM failed_threads WHERE request_key IN ("
+                "SELECT request_key FROM failed_threads ORDER BY failed_at DESC LIMIT -1 OFFSET ?) "
+                "RETURNING thread_id", (FAILED_THREADS_MAX,)).fetchall()
+        return [dropped_thread_id for dropped_thread_id, in dropped]
+
+    def take(self, request_key: str) -> Optional[str]:
+        """Removes and returns the thread of the request's latest failed run, if any."""
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "DELETE FROM failed_threads WHERE request_key = ? RETURNING thread_id",
+                (request_key,)).fetchone()
+        return row[0] if row else None
+
+# The failed runs of each checkpointer, created on first use.
+_failed_threads: "weakref.WeakKeyDictionary[Any, Any]" = weakref.WeakKeyDictionary()
+_failed_threads_lock = threading.Lock()
+
+def get_failed_threads(checkpointer: Any) -> Any:
+    """Returns the failed runs kept next to the checkpointer's checkpoints: in its SQLite database if it has one."""
+    with _failed_threads_lock:
+        failed_threads = _failed_threads.get(checkpointer)
+        if failed_threads is None:
+            connection = getattr(checkpointer, 'conn', None)
+            if isinstance(connection, sqlite3.Connection):
+                failed_threads = SqliteFailedThreads(connection, getattr(checkpointer, 'lock', None))
+            else:
+                failed_threads = FailedThreads()
+            _failed_threads[checkpointer] = failed_threads
+        return failed_threads
+
+def _delete_thread(agent: Any, thread_id: str):
+    """Deletes the checkpoints of a thread, if the checkpointer supports it."""
+    delete_thread = getattr(getattr(agent, 'checkpointer', None), 'delete_thread', None)
+    if delete_thread is None:
+        return
+    try:
+        delete_thread(thread_id)
+    except Exception as e:
+        print(f"Warning: Failed to delete checkpoint thread {thread_id}: {e}")
+
+def _remember_failed(agent: Any, request_key: str, thread_id: str):
+    """Remembers the thread of a failed run, deleting the threads it replaces or pushes out."""
+    for dropped_thread_id in get_failed_threads(agent.checkpointer).remember(request_key, thread_id):
+        if dropped_thread_id != thread_id:
+            _delete_thread(agent, dropped_thread_id)
+
+def _take_failed(agent: Any, request_key: str) -> Optional[str]:
+    """Removes and returns the thread of the request's latest failed run, if any."""
+    return get_failed_threads(agent.checkpointer).take(request_key)
+
+def stream_with_resume(agent: Any, user_request: str, request_key: str) -> Iterator[Dict[str, Any]]:
+    """
+    Streams a run of a checkpointed agent, resuming the request's failed previous run if there is one.
+
+    Args:
+        agent: The agent compiled with a checkpointer (see `get_agent_runnable`).
+        user_request: The user's request.
+        request_key: Identifies the request across retries, e.g. its normalized text.
+
+    Yields:
+        The updates of the nodes that run, as `agent.stream` does.
+    """
+    thread_id = _take_failed(agent, request_key)
+    config = resume_config(agent, thread_id) if thread_id is not None else None
+    if config is not None:
+        print(f"Resuming the failed previous run of '{request_key}' from its last checkpoint.")
+        stream = agent.stream(None, config)
+    else:
+        if thread_id is not None:
+            _delete_thread(agent, thread_id)
+        thread_id = uuid.uuid4().hex
+        stream = agent.stream(fresh_state(user_request), {"configurable": {"thread_id": thread_id}})
+
+    # A run that raised (or was not consumed to the end) counts as failed.
+    failed = True
+    try:
+        yield from stream
+        final_state = agent.get_state({"configurable": {"thread_id": thread_id}})
+        failed = bool(final_state.values.get('failed_node'))
+    finally:
+        if failed:
+            _remember_failed(agent, request_key, thread_id)
+        else:
+            _delete_thread(agent, thread_id)
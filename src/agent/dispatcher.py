@@ -0,0 +1,337 @@
+"""
+Shared dispatcher for the agent's LLM calls.
+
+Calling the LLM directly from every request means that under load all Gradio
+workers hit the provider at once, run into its rate limits and stall
+together. All LLM calls of the graph therefore go through one `LLMDispatcher`,
+which turns overload into orderly queueing:
+- a token bucket limits the call rate (LLM_RATE_PER_SECOND, LLM_BURST),
+- at most LLM_MAX_IN_FLIGHT calls run at a time,
+- waiting calls are admitted by priority lane, then in arrival order, so
+  cheap EFFICIENCY requests are not stuck behind DISCOVERY quest synthesis,
+- a call waits at most LLM_QUEUE_TIMEOUT_S for admission and runs at most
+  LLM_CALL_TIMEOUT_S, otherwise it fails with a TimeoutError,
+- transient failures (timeouts, rate limiting, unavailability) are retried up
+  to LLM_MAX_RETRIES times with exponential backoff and full jitter.
+
+`stats()` exposes queue depth, wait times and the outcome counters, and the
+latency percentiles of the calls completed in a sliding window. `overload()`
+uses them to tell the graph when to shed work (see `route_after_planning`):
+when the queue is deeper than LLM_SHED_QUEUE_DEPTH or the p95 latency is over
+LLM_SHED_P95_BUDGET_S.
+"""
+
+import contextvars
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from enum import IntEnum
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# --- Constants and Configuration ---
+
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "4"))
+LLM_RATE_PER_SECOND = float(os.getenv("LLM_RATE_PER_SECOND", "5"))
+LLM_BURST = int(os.getenv("LLM_BURST", "5"))
+LLM_QUEUE_TIMEOUT_S = float(os.getenv("LLM_QUEUE_TIMEOUT_S", "30"))
+LLM_CALL_TIMEOUT_S = float(os.getenv("LLM_CALL_TIMEOUT_S", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+
+# Load shedding thresholds, and the window of the latency statistics.
+LLM_SHED_QUEUE_DEPTH = int(os.getenv("LLM_SHED_QUEUE_DEPTH", "8"))
+LLM_SHED_P95_BUDGET_S = float(os.getenv("LLM_SHED_P95_BUDGET_S", "20"))
+LATENCY_WINDOW_S = 60.0
+# Fewer samples than this in the window do not make a reliable p95.
+MIN_LATENCY_SAMPLES = 10
+
+# Backoff before retry n (from 0) is uniform in [0, min(max, base * 2^n)].
+RETRY_BACKOFF_BASE_S = 0.5
+RETRY_BACKOFF_MAX_S = 8.0
+
+# Substrings of error messages of transient provider failures.
+_TRANSIENT_MARKERS = ("429", "rate limit", "resource exhausted", "resource_exhausted", "quota",
+                      "503", "unavailable", "deadline", "timeout", "timed out", "connection")
+
+class Lane(IntEnum):
+    """Priority lanes of the dispatcher; lower values are admitted first."""
+    EFFICIENCY = 0
+    DISCOVERY = 1
+
+class DispatcherTimeout(TimeoutError):
+    """An LLM call waited too long for admission or took too long to complete."""
+
+def is_transient(error: BaseException) -> bool:
+    """Whether an LLM call that failed with this error is worth retrying."""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in _TRANSIENT_MARKERS)
+
+# --- Rate Limiting ---
+
+class TokenBucket:
+    """A token bucket refilled at `rate` tokens per second up to `burst` tokens."""
+
+    def __init__(self, rate: float, burst: int, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._clock = clock
+        self._tokens = float(self.burst)
+        self._updated = clock()
+
+    def take(self) -> float:
+        """Takes a token if one is available. Returns 0, or the seconds until the next token."""
+        if self.rate <= 0:
+            return 0.0  # Unlimited.
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+# --- Latency Statistics ---
+
+class LatencyWindow:
+    """The latencies of the calls completed in the last `window_s` seconds."""
+
+    def __init__(self, window_s: float = LATENCY_WINDOW_S, max_samples: int = 10_000,
+                 clock: Callable[[], float] = time.monotonic):
+        self.window_s = window_s
+        self._clock = clock
+        self._samples: Deque[Tuple[float, float]] = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+
+    def _prune(self, now: float):
+        while self._samples and self._samples[0][0] < now - self.window_s:
+            self._samples.popleft()
+
+    def add(self, latency_s: float):
+        with self._lock:
+            now = self._clock()
+            self._prune(now)
+            self._samples.append((now, latency_s))
+
+    def count(self) -> int:
+        with self._lock:
+            self._prune(self._clock())
+            return len(self._samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """The q-th percentile (0-100) of the latencies in the window, or None if it is empty."""
+        with self._lock:
+            self._prune(self._clock())
+            if not self._samples:
+                return None
+            return float(np.percentile([latency for _, latency in self._samples], q))
+
+# --- Dispatcher ---
+
+class LLMDispatcher:
+    """Admits LLM calls by lane under rate, concurrency and time limits, retrying transient failures."""
+
+    def __init__(self, max_in_flight: int = LLM_MAX_IN_FLIGHT, rate_per_second: float = LLM_RATE_PER_SECOND,
+                 burst: int = LLM_BURST, queue_timeout_s: float = LLM_QUEUE_TIMEOUT_S,
+                 call_timeout_s: Optional[float] = LLM_CALL_TIMEOUT_S, max_retries: int = LLM_MAX_RETRIES,
+                 shed_queue_depth: int = LLM_SHED_QUEUE_DEPTH, shed_p95_budget_s: float = LLM_SHED_P95_BUDGET_S,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        self.max_in_flight = max(1, max_in_flight)
+        self.queue_timeout_s = queue_timeout_s
+        self.call_timeout_s = call_timeout_s
+        self.max_retries = max_retries
+        self.shed_queue_depth = shed_queue_depth
+        self.shed_p95_budget_s = shed_p95_budget_s
+        self._clock = clock
+        self._sleep = sleep
+        self._bucket = TokenBucket(rate_per_second, burst, clock)
+        self._condition = threading.Condition()
+        self._waiting: List[Tuple[int, int]] = []  # Heap of (lane, sequence) tickets.
+        self._sequence = itertools.count()
+        self._in_flight = 0
+        self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="llm-call")
+        # Metrics
+        self.queued_by_lane: Dict[str, int] = {lane.name: 0 for lane in Lane}
+        self.max_queue_depth = 0
+        self.admitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+        self.queue_timeouts = 0
+        self.call_timeouts = 0
+        self.total_wait_s = 0.0
+        self.max_wait_s = 0.0
+        # Queueing, retries and call time of each invoke, failed ones included.
+        self.latency = LatencyWindow(clock=clock)
+
+    # --- Admission ---
+
+    def _acquire(self, lane: Lane) -> float:
+        """Waits until the call may run. Returns the seconds waited."""
+        ticket = (int(lane), next(self._sequence))
+        enqueued = self._clock()
+        deadline = enqueued + self.queue_timeout_s
+        with self._condition:
+            heapq.heappush(self._waiting, ticket)
+            self.queued_by_lane[lane.name] += 1
+            self.max_queue_depth = max(self.max_queue_depth, len(self._waiting))
+            try:
+                while True:
+                    retry_in = None
+                    if self._waiting[0] == ticket and self._in_flight < self.max_in_flight:
+                        retry_in = self._bucket.take()
+                        if retry_in == 0:
+                            break
+                    remaining = deadline - self._clock()
+                    if remaining <= 0:
+                        self.queue_timeouts += 1
+                        raise DispatcherTimeout(f"LLM call timeout: waited {self.queue_timeout_s:g}s "
+                                                f"in the {lane.name} queue")
+                    self._condition.wait(min(retry_in, remaining) if retry_in else remaining)
+                heapq.heappop(self._waiting)
+                self._in_flight += 1
+                self.admitted += 1
+                waited = self._clock() - enqueued
+                self.total_wait_s += waited
+                self.max_wait_s = max(self.max_wait_s, waited)
+            except BaseException:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                raise
+            finally:
+                self.queued_by_lane[lane.name] -= 1
+                # The next ticket may now be at the head of the queue.
+                self._condition.notify_all()
+        return waited
+
+    def _release(self, *_):
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    # --- Calls ---
+
+    def _call(self, runnable: Any, prompt: Any, **kwargs) -> Any:
+        """Runs one admitted call, releasing its slot when it actually finishes."""
+        if not self.call_timeout_s:
+            try:
+                return runnable.invoke(prompt, **kwargs)
+            finally:
+                self._release()
+        # The call runs in a worker thread (with the caller's context, for
+        # tracing) so the caller can stop waiting for it. A call that timed out
+        # keeps its slot until it returns, so the in-flight limit still holds.
+        context = contextvars.copy_context()
+        future = self._executor.submit(context.run, runnable.invoke, prompt, **kwargs)
+        future.add_done_callback(self._release)
+        try:
+            return future.result(timeout=self.call_timeout_s)
+        except FutureTimeoutError:
+            with self._condition:
+                self.call_timeouts += 1
+            raise DispatcherTimeout(f"LLM call timeout: no response within {self.call_timeout_s:g}s")
+
+    def invoke(self, runnable: Any, prompt: Any, lane: Lane = Lane.DISCOVERY, **kwargs) -> Any:
+        """
+        Calls `runnable.invoke(prompt)` under the dispatcher's limits.
+
+        Args:
+            runnable: An LLM client or structured output runnable.
+            prompt: The prompt to send.
+            lane: The priority lane of the call.
+
+        Returns:
+            The result of the call.
+
+        Raises:
+            DispatcherTimeout: If the call was not admitted or did not complete in time
+                (after retries).
+            Exception: The error of the last attempt, if it is not transient or
+                the retries are used up.
+        """
+        started = self._clock()
+        try:
+            return self._invoke_with_retries(runnable, prompt, lane, **kwargs)
+        finally:
+            self.latency.add(self._clock() - started)
+
+    def _invoke_with_retries(self, runnable: Any, prompt: Any, lane: Lane, **kwargs) -> Any:
+        attempt = 0
+        while True:
+            self._acquire(lane)
+            try:
+                result = self._call(runnable, prompt, **kwargs)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_transient(e):
+                    with self._condition:
+                        self.failed += 1
+                    raise
+                backoff = random.uniform(0, min(RETRY_BACKOFF_MAX_S, RETRY_BACKOFF_BASE_S * 2 ** attempt))
+                print(f"Warning: LLM call failed ({e}); retrying in {backoff:.1f}s.")
+                with self._condition:
+                    self.retries += 1
+                attempt += 1
+                self._sleep(backoff)
+                continue
+            with self._condition:
+                self.completed += 1
+            return result
+
+    # --- Metrics ---
+
+    def queue_depth(self) -> int:
+        """The number of calls waiting for admission."""
+        with self._condition:
+            return len(self._waiting)
+
+    def overload(self) -> Optional[str]:
+        """Why the dispatcher is overloaded and optional LLM work should be shed, or None if it is not."""
+        depth = self.queue_depth()
+        if depth >= self.shed_queue_depth:
+            return f"{depth} LLM calls queued"
+        if self.latency.count() >= MIN_LATENCY_SAMPLES:
+            p95 = self.latency.percentile(95)
+            if p95 > self.shed_p95_budget_s:
+                return f"p95 LLM latency {p95:.1f}s over the {self.shed_p95_budget_s:g}s budget"
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, in-flight calls, wait times and outcome counters."""
+        with self._condition:
+            return {
+                'queue_depth': len(self._waiting),
+                'queue_depth_by_lane': dict(self.queued_by_lane),
+                'max_queue_depth': self.max_queue_depth,
+                'in_flight': self._in_flight,
+                'max_in_flight': self.max_in_flight,
+                'admitted': self.admitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'retries': self.retries,
+                'queue_timeouts': self.queue_timeouts,
+                'call_timeouts': self.call_timeouts,
+                'avg_wait_s': self.total_wait_s / self.admitted if self.admitted else 0.0,
+                'max_wait_s': self.max_wait_s,
+                'window_calls': self.latency.count(),
+                'p50_latency_s': self.latency.percentile(50),
+                'p95_latency_s': self.latency.percentile(95),
+            }
+
+# --- Singleton Instance Management ---
+
+_dispatcher_instance = None
+
+def get_dispatcher() -> LLMDispatcher:
+    """Returns the dispatcher shared by all LLM calls of the process."""
+    global _dispatcher_instance
+    if _dispatcher_instance is None:
+        _dispatcher_instance = LLMDispatcher()
+    return _dispatcher_instance
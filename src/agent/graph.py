@@ -8,27 +8,39 @@ tools and the final creative synthesis is handled by an LLM.
 """
 
 import os
-import json
+import re
 from datetime import datetime
-from typing import Literal, Optional
+from typing import Literal, Optional, Tuple
 
 from pydantic import BaseModel, Field
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langgraph.graph import StateGraph, END, START
 
 # Import the state and models we've defined. This is the "memory" of our agent.
 from .state import AgentState, Intent
 from src.core.models import Coordinates, Quest
+from src.core.serialization import decode_model, dumps, dumps_text, loads
+from src.core.quest_store import get_quest_store, quest_key
+from src.core.singleflight import SingleFlight
+from .dispatcher import Lane, get_dispatcher
+from .llm import get_llm, register_fake_handler
 
-# Import the deterministic "hands" of our agent.
-from src.tools.poi_retriever import retrieve_nearby_pois_as_dict
-from src.tools.transit_planner import plan_transit_journey_as_dict
+# The deterministic "hands" of our agent (src.tools) are imported in the nodes
+# that use them: they load pandas and numpy, which importing the graph (e.g. to
+# compile it or in tests) should not pay for.
 
 # --- 1. Agent Configuration & Initialization ---
 
-# Initialize the LLM. For this prototype, we'll use Gemini 2.5 Flash.
-# The API key should be set as an environment variable (GOOGLE_API_KEY).
-llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash", temperature=0.7)
+# The LLM (Gemini 2.5 Flash by default, see `src.agent.llm`) is created on the
+# first invoke, so the API key (GOOGLE_API_KEY) is only needed from then on.
+llm = get_llm()
+
+# For this prototype, we'll use fixed coordinates for known locations.
+# A production version would use a geocoding API.
+KNOWN_LOCATIONS = {
+    "purvciems": Coordinates(latitude=56.9634, longitude=24.1953),
+    "old town": Coordinates(latitude=56.9496, longitude=24.1052),
+    "agenskalns": Coordinates(latitude=56.9363, longitude=24.0722)
+}
 
 # Define the Pydantic model for structured output when parsing the user request.
 class ParsedUserRequest(BaseModel):
@@ -36,9 +48,93 @@ class ParsedUserRequest(BaseModel):
     start_location_query: str = Field(description="The starting location mentioned by the user, e.g., 'Purvciems'.")
     end_location_query: str = Field(description="The destination location mentioned by the user, e.g., 'Old Town'.")
     arrival_time: Optional[str] = Field(description="The desired arrival time in HH:MM format, if mentioned.")
+    departure_time: Optional[str] = Field(None, description="The desired departure time in HH:MM format, if the user says when they want to leave.")
 
 structured_llm = llm.with_structured_output(ParsedUserRequest)
 
+def _parse_request_offline(prompt: str) -> ParsedUserRequest:
+    """Keyword-based parsing of the user request, used by the local fake LLM."""
+    request = prompt.split("User Request:", 1)[-1]
+    places = re.search(r"from\s+(.+?)\s+to\s+(.+?)(?:[,.?!\"]|\s+(?:arriving|by|at|around|this|for|with)\b|$)",
+                       request, re.IGNORECASE)
+    time_match = re.search(r"\b(\d{1,2}:\d{2})\b", request)
+    leaving = re.search(r"\b(?:leave|leaving|depart|departing)\b", request, re.IGNORECASE)
+    time = time_match.group(1).zfill(5) if time_match else None
+    return ParsedUserRequest(
+        start_location_query=places.group(1).strip() if places else "",
+        end_location_query=places.group(2).strip() if places else "",
+        arrival_time=None if leaving else time,
+        departure_time=time if leaving else None,
+    )
+
+register_fake_handler(ParsedUserRequest, _parse_request_offline)
+
+# Concurrent requests for the same journey share one quest synthesis.
+quest_flights = SingleFlight()
+
+def normalize_request(text: str) -> str:
+    """Normalizes a request's text (case, whitespace, trailing punctuation) for coalescing."""
+    return " ".join(text.lower().split()).strip(" .!?")
+
+def journey_key(state: AgentState) -> tuple:
+    """
+    The shareable part of a request, as a key for coalescing: its normalized
+    text (which the synthesis prompt quotes) and its parsed journey parameters.
+    """
+    def point(coords: Optional[Coordinates]):
+        return None if coords is None else (round(coords.latitude, 6), round(coords.longitude, 6))
+    return (normalize_request(state.get('original_user_request') or ""),
+            point(state.get('start_coords')), point(state.get('end_coords')),
+            state.get('arrival_time'), state.get('departure_time'), state.get('intent'))
+
+def personalize_quest(quest: Quest, state: AgentState) -> Tuple[Quest, str]:
+    """
+    The per-request part of a quest shared with concurrent requests (see `quest_flights`).
+
+    The shared quest is treated as read-only: each request gets its own copy,
+    and its response is formatted from that copy, so per-request changes
+    never reach the other requests.
+
+    Returns:
+        (quest, formatted_response) for this request.
+    """
+    quest = quest.copy(deep=True)
+    formatted_response = f"**Quest: {quest.title}**\n\n_{quest.description}_\n\n"
+    for i, leg in enumerate(quest.legs):
+        formatted_response += f"**Part {i+1}:** "
+        if hasattr(leg, 'duration_minutes'):  # WalkingLeg
+            formatted_response += f"Walk ({leg.duration_minutes} mins)\n"
+            formatted_response += f"> {leg.instructions}\n\n"
+        else:  # TransitLeg
+            formatted_response += f"Take the {leg.vehicle_type} {leg.route_short_name}\n"
+            formatted_response += f"> From {leg.start_stop_name} to {leg.end_stop_name}\n\n"
+    return quest, formatted_response
+
+def stored_quest_key(state: AgentState) -> Optional[Tuple[str, str]]:
+    """
+    The quest store key of a request and the version of the data it depends on.
+
+    The key includes the planned trip, so requests for the same stops share a
+    quest only when they are served by the same departure.
+
+    Returns:
+        (key, dataset_version), or None if there is no transit plan or the
+        journey's stops cannot be resolved.
+    """
+    transit_plan = state.get('transit_plan')
+    if not transit_plan:
+        return None
+    from src.tools.poi_retriever import get_poi_retriever
+    from src.tools.transit_planner import get_transit_planner
+    planner = get_transit_planner()
+    journey = planner.journey_cache_key(state['start_coords'], state['end_coords'],
+                                        state.get('arrival_time'), state.get('departure_time'))
+    if journey is None:
+        return None
+    _, _, start_stop_id, end_stop_id, _, _ = journey
+    dataset_version = f"{planner.content_version}:{get_poi_retriever().content_version}"
+    return quest_key(start_stop_id, end_stop_id, transit_plan, state.get('intent') or "DISCOVERY"), dataset_version
+
 # --- 2. Graph Nodes: The Steps of the Agent's "Thought Process" ---
 
 def parse_user_request(state: AgentState) -> dict:
@@ -50,60 +146,84 @@ def parse_user_request(state: AgentState) -> dict:
     prompt = f"""
     You are an expert at parsing user requests for a journey planning app.
     Parse the following user request and extract the starting location, destination, and desired arrival time.
+    If the user instead says when they want to leave, extract that as the departure time.
     The current time is {datetime.now().strftime('%Y-%m-%d %H:%M')}.
     
     User Request: "{state['original_user_request']}"
     """
-    parsed_request = structured_llm.invoke(prompt)
+    # Requests that will take the efficiency path are parsed in the priority lane.
+    lane = Lane.EFFICIENCY if classify_intent(state['original_user_request']) == "EFFICIENCY" else Lane.DISCOVERY
+    parsed_request = get_dispatcher().invoke(structured_llm, prompt, lane=lane)
     
-    # For this prototype, we'll use fixed coordinates for known locations.
-    # A production version would use a geocoding API.
-    location_map = {
-        "purvciems": Coordinates(latitude=56.9634, longitude=24.1953),
-        "old town": Coordinates(latitude=56.9496, longitude=24.1052),
-        "agenskalns": Coordinates(latitude=56.9363, longitude=24.0722)
-    }
-    
-    start_coords = location_map.get(parsed_request.start_location_query.lower())
-    end_coords = location_map.get(parsed_request.end_location_query.lower())
+    start_coords = KNOWN_LOCATIONS.get(parsed_request.start_location_query.lower())
+    end_coords = KNOWN_LOCATIONS.get(parsed_request.end_location_query.lower())
 
+    # An explicit departure time turns the query into "depart at"; otherwise we
+    # plan "arrive by", falling back to a default arrival time.
+    departure_time = None if parsed_request.arrival_time else parsed_request.departure_time
     return {
         "start_coords": start_coords,
         "end_coords": end_coords,
-        "arrival_time": parsed_request.arrival_time or "14:00" # Default arrival time
+        "arrival_time": None if departure_time else (parsed_request.arrival_time or "14:00"), # Default arrival time
+        "departure_time": departure_time
     }
 
+def classify_intent(request: str) -> Intent:
+    """The intent of a request's text."""
+    # For the prototype, we use a simple rule-based engine.
+    # A production version would use more sophisticated signals (see docs).
+    request = request.lower()
+    if "quickest" in request or "fastest" in request:
+        return "EFFICIENCY"
+    # Default to discovery for the prototype to showcase the main feature
+    return "DISCOVERY"
+
 def determine_intent(state: AgentState) -> dict:
     """
     Node 2: The Context & Intent Engine. Determines if the user wants a quick
     journey or a discovery-focused quest.
     """
     print("---NODE: DETERMINING INTENT---")
-    # For the prototype, we use a simple rule-based engine.
-    # A production version would use more sophisticated signals (see docs).
-    request = state['original_user_request'].lower()
-    if "quickest" in request or "fastest" in request:
-        intent = "EFFICIENCY"
-    else:
-        # Default to discovery for the prototype to showcase the main feature
-        intent = "DISCOVERY"
-    
+    intent = classify_intent(state['original_user_request'])
     print(f"Intent determined as: {intent}")
     return {"intent": intent}
 
+def shed_reason(state: AgentState) -> Optional[str]:
+    """
+    Why the request's quest synthesis is shed, or None to synthesize it.
+
+    Under load (a deep LLM queue or a p95 latency over budget, see
+    `LLMDispatcher.overload`), DISCOVERY requests are downgraded to the
+    efficiency path, which needs no further LLM call, rather than queueing
+    for a quest synthesis that would likely time out.
+    """
+    if state.get('intent') != "DISCOVERY":
+        return None
+    overload = get_dispatcher().overload()
+    if overload:
+        print(f"Warning: Shedding quest synthesis ({overload}); answering with the efficiency path.")
+    return overload
+
+def journey_times(state: AgentState) -> Tuple[Optional[str], Optional[str]]:
+    """The (arrival_time, departure_time) a journey is planned for, with the default arrival time."""
+    arrival_time = state.get('arrival_time')
+    departure_time = state.get('departure_time')
+    if not arrival_time and not departure_time:
+        arrival_time = "14:00"  # Default fallback
+    return arrival_time, departure_time
+
 def plan_transit_route(state: AgentState) -> dict:
     """Node 3: Calls the transit planner tool to get the logistical backbone."""
     print("---NODE: PLANNING TRANSIT ROUTE---")
+    from src.tools.transit_planner import plan_transit_journey_as_dict
     
     # Check if we have valid coordinates
     if not state.get('start_coords') or not state.get('end_coords'):
         print("Warning: Missing coordinates for transit planning")
         return {"transit_plan": None, "errors": ["Missing start or end coordinates"]}
     
-    # Check if we have arrival time
-    arrival_time = state.get('arrival_time')
-    if not arrival_time:
-        arrival_time = "14:00"  # Default fallback
+    # Check if we have arrival time (or a departure time for "depart at" queries)
+    arrival_time, departure_time = journey_times(state)
     
     try:
         start_coords = state['start_coords']
@@ -116,16 +236,23 @@ def plan_transit_route(state: AgentState) -> dict:
             start_longitude=start_coords.longitude,
             end_latitude=end_coords.latitude,
             end_longitude=end_coords.longitude,
-            arrival_time=arrival_time
+            arrival_time=arrival_time,
+            departure_time=departure_time
         )
-        return {"transit_plan": plan}
+        return {"transit_plan": plan, "degraded": shed_reason(state)}
     except Exception as e:
         print(f"Error planning transit route: {e}")
         return {"transit_plan": None, "errors": [f"Transit planning failed: {str(e)}"]}
 
 def find_start_area_pois(state: AgentState) -> dict:
-    """Node 4a: Finds POIs near the starting location for the 'Discovery' path."""
+    """
+    Node 4a: Finds POIs near the starting location for the 'Discovery' path.
+
+    The destination's POIs are found in the same batch query and returned
+    too, so `find_end_area_pois` has nothing left to search.
+    """
     print("---NODE: FINDING START AREA POIS---")
+    from src.tools.poi_retriever import retrieve_nearby_pois_batch_as_json
     
     if not state.get('start_coords'):
         print("Warning: No start coordinates available for POI search")
@@ -135,19 +262,26 @@ def find_start_area_pois(state: AgentState) -> dict:
         start_coords = state['start_coords']
         assert start_coords is not None, "Start coordinates are required"
         
-        pois = retrieve_nearby_pois_as_dict(
-            latitude=start_coords.latitude,
-            longitude=start_coords.longitude,
-            max_results=3
-        )
-        return {"start_area_pois": pois}
+        points = [(start_coords.latitude, start_coords.longitude)]
+        end_coords = state.get('end_coords')
+        if end_coords is not None:
+            points.append((end_coords.latitude, end_coords.longitude))
+        # The state holds dicts; the prompt reuses the cached encodings (see `_prompt_json`).
+        found = [loads(encoded) for encoded in retrieve_nearby_pois_batch_as_json(points, max_results=3)]
+        if end_coords is None:
+            return {"start_area_pois": found[0]}
+        return {"start_area_pois": found[0], "end_area_pois": found[1]}
     except Exception as e:
         print(f"Error finding start area POIs: {e}")
         return {"start_area_pois": [], "errors": [f"POI search failed: {str(e)}"]}
 
 def find_end_area_pois(state: AgentState) -> dict:
-    """Node 4b: Finds POIs near the destination for the 'Discovery' path."""
+    """Node 4b: Finds POIs near the destination for the 'Discovery' path, unless node 4a already did."""
     print("---NODE: FINDING END AREA POIS---")
+    from src.tools.poi_retriever import retrieve_nearby_pois_as_dict
+    
+    if state.get('end_area_pois') is not None:
+        return {}
     
     if not state.get('end_coords'):
         print("Warning: No end coordinates available for POI search")
@@ -167,6 +301,30 @@ def find_end_area_pois(state: AgentState) -> dict:
         print(f"Error finding end area POIs: {e}")
         return {"end_area_pois": [], "errors": [f"POI search failed: {str(e)}"]}
 
+def _prompt_json(state: AgentState) -> Tuple[str, str, str]:
+    """
+    The transit plan and the start and end area POIs of the state, as JSON for the prompt.
+
+    The tools cache the JSON encoding of their results, so the bytes encoded
+    when the nodes ran are reused here instead of encoding the state's dicts again.
+    """
+    from src.tools.poi_retriever import retrieve_nearby_pois_as_json
+    from src.tools.transit_planner import plan_transit_journey_as_json
+
+    start_coords, end_coords = state.get('start_coords'), state.get('end_coords')
+    arrival_time, departure_time = journey_times(state)
+    transit_plan = plan_transit_journey_as_json(start_coords.latitude, start_coords.longitude,
+                                                end_coords.latitude, end_coords.longitude,
+                                                arrival_time, departure_time)
+
+    def area_pois(field: str, coords: Optional[Coordinates]) -> bytes:
+        if not state.get(field) or coords is None:
+            return dumps(state.get(field) or [])
+        return retrieve_nearby_pois_as_json(coords.latitude, coords.longitude, max_results=3)
+
+    return tuple(dumps_text(encoded, indent=False) for encoded in (
+        transit_plan, area_pois('start_area_pois', start_coords), area_pois('end_area_pois', end_coords)))
+
 def synthesize_quest(state: AgentState) -> dict:
     """
     Node 5 (The Agentic Heart): Takes all collected data and synthesizes the
@@ -182,15 +340,16 @@ def synthesize_quest(state: AgentState) -> dict:
         }
     
     try:
+        transit_plan_json, start_pois_json, end_pois_json = _prompt_json(state)
         prompt = f"""
         You are the "Personal Adventure Architect" for the unfold.quest app. Your goal is to
         transform a boring transit plan into an engaging, narrative-driven micro-quest.
 
         You have the following information:
         - User Request: "{state.get('original_user_request', 'Unknown request')}"
-        - Transit Plan: {json.dumps(state.get('transit_plan', {}), indent=2)}
-        - Interesting places near the start: {json.dumps(state.get('start_area_pois', []), indent=2)}
-        - Interesting places near the destination: {json.dumps(state.get('end_area_pois', []), indent=2)}
+        - Transit Plan: {transit_plan_json}
+        - Interesting places near the start: {start_pois_json}
+        - Interesting places near the destination: {end_pois_json}
 
         Your task is to create a final "Quest" object. Be creative and thematic!
         1.  Give the quest a fun, creative title.
@@ -203,23 +362,27 @@ def synthesize_quest(state: AgentState) -> dict:
         5.  Return ONLY a valid JSON object that conforms to the Pydantic `Quest` model.
         """
         
-        response = llm.invoke(prompt)
-        quest_json = json.loads(response.content)
-        
-        # Validate the LLM's output with our Pydantic model
-        final_quest = Quest(**quest_json)
-        
-        # Create a simple formatted string for display
-        formatted_response = f"**Quest: {final_quest.title}**\n\n_{final_quest.description}_\n\n"
-        for i, leg in enumerate(final_quest.legs):
-            formatted_response += f"**Part {i+1}:** "
-            if hasattr(leg, 'duration_minutes'):  # WalkingLeg
-                formatted_response += f"Walk ({leg.duration_minutes} mins)\n"
-                formatted_response += f"> {leg.instructions}\n\n"
-            else:  # TransitLeg
-                formatted_response += f"Take the {leg.vehicle_type} {leg.route_short_name}\n"
-                formatted_response += f"> From {leg.start_stop_name} to {leg.end_stop_name}\n\n"
+        def synthesize() -> Quest:
+            # A quest generated earlier for the same commute is served from the store.
+            stored = stored_quest_key(state)
+            if stored is not None:
+                quest = get_quest_store().get(*stored)
+                if quest is not None:
+                    print("Serving a stored quest for this journey.")
+                    return quest
+            response = get_dispatcher().invoke(llm, prompt, lane=Lane.DISCOVERY)
+            # Parse and validate the LLM's output straight into our Pydantic model
+            quest = decode_model(Quest, response.content)
+            if stored is not None:
+                get_quest_store().put(*stored, quest)
+            return quest
 
+        # Identical requests made at the same time wait for one LLM call.
+        shared_quest, shared = quest_flights.do(journey_key(state), synthesize)
+        if shared:
+            print("Quest shared with a concurrent request for the same journey.")
+        
+        final_quest, formatted_response = personalize_quest(shared_quest, state)
         return {"final_quest": final_quest, "final_response": formatted_response}
         
     except Exception as e:
@@ -234,20 +397,25 @@ def synthesize_quest(state: AgentState) -> dict:
                 f"from **{leg.get('start_stop_name', 'your starting point')}** "
                 f"to **{leg.get('end_stop_name', 'your destination')}**."
             )
-            return {"final_response": simple_response, "errors": [f"Quest synthesis failed: {str(e)}"]}
+            return {"final_response": simple_response, "errors": [f"Quest synthesis failed: {str(e)}"],
+                    "failed_node": "synthesize_quest"}
         else:
             return {
                 "final_response": "I couldn't create a detailed quest, but you should be able to reach your destination.",
-                "errors": [f"Quest synthesis failed: {str(e)}"]
+                "errors": [f"Quest synthesis failed: {str(e)}"],
+                "failed_node": "synthesize_quest"
             }
 
 def format_simple_response(state: AgentState) -> dict:
     """Node 6: Formats a simple, efficient response for the 'Efficiency' path."""
     print("---NODE: FORMATTING SIMPLE RESPONSE---")
     
+    # Set when a DISCOVERY request's quest synthesis was shed under load.
+    degraded = state.get('degraded')
+    
     transit_plan = state.get('transit_plan')
     if not transit_plan or len(transit_plan) == 0:
-        return {"final_response": "Sorry, I could not find a direct transit route for your journey."}
+        return {"final_response": "Sorry, I could not find a direct transit route for your journey.", "degraded": degraded}
     
     try:
         leg = transit_plan[0]
@@ -259,7 +427,10 @@ def format_simple_response(state: AgentState) -> dict:
             f"2.  **Arrive:** You will arrive at **{leg.get('end_stop_name', 'your destination')}** "
             f"at approximately **{leg.get('arrival_time', 'the scheduled time')}**."
         )
-        return {"final_response": response}
+        if degraded:
+            response += ("\n\n_We're very busy right now, so this is the quick route without the quest. "
+                         "Try again in a few minutes for the full adventure._")
+        return {"final_response": response, "degraded": degraded}
     except Exception as e:
         print(f"Error formatting simple response: {e}")
         return {
@@ -282,17 +453,23 @@ def route_by_intent(state: AgentState) -> Literal["efficiency_path", "discovery_
 def route_after_planning(state: AgentState) -> Literal["efficiency_path", "discovery_path"]:
     """
     Routes to the appropriate next step after transit planning is complete.
+
+    DISCOVERY requests whose quest synthesis was shed under load (recorded in
+    `degraded` by the planning node, see `shed_reason`) take the efficiency path.
     """
-    if state.get('intent') == "EFFICIENCY":
+    if state.get('intent') == "EFFICIENCY" or state.get('degraded'):
         return "efficiency_path"
-    else:
-        return "discovery_path"
+    return "discovery_path"
 
 # --- 4. Assembling the Graph ---
 
-def get_agent_runnable():
+def get_agent_runnable(checkpointer=None):
     """
     Builds and compiles the LangGraph agent using best practices.
+
+    With a `checkpointer` (see `src.agent.checkpoints`), the state is saved
+    after every node, so failed runs can be resumed; runs then need a
+    `thread_id` in their config.
     
     The graph follows this structure:
     1. Parse user request → 2. Determine intent → 3. Route by intent
@@ -343,4 +520,4 @@ def get_agent_runnable():
     builder.add_edge("format_simple_response", END)
     
     # Compile and return the final runnable agent
-    return builder.compile()
\ No newline at end of file
+    return builder.compile(checkpointer=checkpointer)
\ No newline at end of file
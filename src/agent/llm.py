@@ -0,0 +1,202 @@
+"""
+Lazy, injectable LLM providers for the unfold.quest agent.
+
+The agent graph used to construct its Gemini client at import time, so merely
+importing the graph loaded langchain_google_genai and needed credentials. The
+graph now holds a `LazyLLM` proxy instead: the client is created by the
+configured provider on the first `invoke`, and can be replaced at any time
+(e.g. by tests or by the warm-up) with `set_llm`.
+
+Providers are registered by name and selected with the LLM_PROVIDER
+environment variable:
+- "gemini" (default): Google's Gemini via langchain_google_genai. The API key
+  is read from GOOGLE_API_KEY when the client is created.
+- "fake": a local, deterministic backend without network access, for tests,
+  demos and load testing. It replays canned responses and answers structured
+  output requests with the handler registered for the schema.
+"""
+
+import os
+import threading
+from itertools import cycle
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Type
+
+from pydantic import BaseModel
+
+from src.core.serialization import loads
+
+# --- Constants and Configuration ---
+
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini")
+LLM_MODEL = os.getenv("LLM_MODEL", "gemini-2.5-flash")
+LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.7"))
+
+# --- Providers ---
+
+_PROVIDERS: Dict[str, Callable[[], Any]] = {}
+
+def register_provider(name: str, factory: Callable[[], Any]):
+    """Registers a factory that creates an LLM client (with `invoke` and `with_structured_output`)."""
+    _PROVIDERS[name.lower()] = factory
+
+def create_llm(provider: Optional[str] = None) -> Any:
+    """
+    Creates a client of the given provider (defaults to LLM_PROVIDER).
+
+    Raises:
+        ValueError: If no provider of that name is registered.
+    """
+    name = (provider or LLM_PROVIDER).lower()
+    factory = _PROVIDERS.get(name)
+    if factory is None:
+        raise ValueError(f"Unknown LLM provider '{name}', expected one of {sorted(_PROVIDERS)}.")
+    print(f"Creating LLM client (provider: {name})...")
+    return factory()
+
+def _create_gemini() -> Any:
+    # Imported here: langchain_google_genai is slow to import and only needed
+    # once the first request reaches the LLM.
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(model=LLM_MODEL, temperature=LLM_TEMPERATURE)
+
+register_provider("gemini", _create_gemini)
+
+# --- Fake Backend ---
+
+class FakeMessage:
+    """The part of a chat model's reply the agent reads."""
+
+    def __init__(self, content: str):
+        self.content = content
+
+# Structured output handlers of the fake backend, by schema: prompt -> model.
+_FAKE_HANDLERS: Dict[Type[BaseModel], Callable[[str], BaseModel]] = {}
+
+def register_fake_handler(schema: Type[BaseModel], handler: Callable[[str], BaseModel]):
+    """Registers how the fake backend answers structured output requests for a schema."""
+    _FAKE_HANDLERS[schema] = handler
+
+class FakeLLM:
+    """
+    A local LLM backend that needs no network or credentials.
+
+    `invoke` returns the canned responses in turn (repeating them), or "{}"
+    if there are none. Structured output uses the handler registered for the
+    schema, falling back to validating the next canned response. The prompts
+    received are kept in `prompts`.
+    """
+
+    def __init__(self, responses: Optional[Sequence[str]] = None,
+                 handlers: Optional[Dict[Type[BaseModel], Callable[[str], BaseModel]]] = None):
+        self._responses: Iterator[str] = cycle(list(responses or ["{}"]))
+        self.handlers = handlers or {}
+        self.prompts: List[str] = []
+        self._lock = threading.Lock()
+
+    def invoke(self, prompt: Any, **kwargs) -> FakeMessage:
+        with self._lock:
+            self.prompts.append(str(prompt))
+            return FakeMessage(next(self._responses))
+
+    def with_structured_output(self, schema: Type[BaseModel], **kwargs) -> "_FakeStructuredLLM":
+        return _FakeStructuredLLM(self, schema)
+
+class _FakeStructuredLLM:
+    def __init__(self, llm: FakeLLM, schema: Type[BaseModel]):
+        self.llm = llm
+        self.schema = schema
+
+    def invoke(self, prompt: Any, **kwargs) -> BaseModel:
+        handler = self.llm.handlers.get(self.schema) or _FAKE_HANDLERS.get(self.schema)
+        if handler is None:
+            return self.schema.model_validate(loads(self.llm.invoke(prompt).content))
+        with self.llm._lock:
+            self.llm.prompts.append(str(prompt))
+        return handler(str(prompt))
+
+register_provider("fake", FakeLLM)
+
+# --- Lazy Proxy ---
+
+class LazyLLM:
+    """
+    Stands in for an LLM client that is created on first use.
+
+    The client can be injected with `set_client` before or after that; the
+    structured variants derived with `with_structured_output` follow it.
+    """
+
+    def __init__(self, factory: Callable[[], Any] = create_llm):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._client is not None
+
+    @property
+    def client(self) -> Any:
+        """The underlying client, created on first access."""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return self._client
+
+    def set_client(self, client: Any):
+        """Injects a client, e.g. a FakeLLM in tests."""
+        with self._lock:
+            self._client = client
+
+    def reset(self):
+        """Drops the client; the next use creates a new one."""
+        self.set_client(None)
+
+    def invoke(self, *args, **kwargs) -> Any:
+        return self.client.invoke(*args, **kwargs)
+
+    def with_structured_output(self, schema: Type[BaseModel], **kwargs) -> "_LazyStructuredLLM":
+        return _LazyStructuredLLM(self, schema, kwargs)
+
+    def __getattr__(self, name: str) -> Any:
+        # Only reached for attributes the proxy does not define itself.
+        return getattr(self.client, name)
+
+class _LazyStructuredLLM:
+    """The structured output variant of a LazyLLM's current client."""
+
+    def __init__(self, parent: LazyLLM, schema: Type[BaseModel], options: Dict[str, Any]):
+        self.parent = parent
+        self.schema = schema
+        self.options = options
+        self._source = None
+        self._runnable = None
+        self._lock = threading.Lock()
+
+    @property
+    def runnable(self) -> Any:
+        client = self.parent.client
+        with self._lock:
+            if self._source is not client:
+                self._runnable = client.with_structured_output(self.schema, **self.options)
+                self._source = client
+            return self._runnable
+
+    def invoke(self, *args, **kwargs) -> Any:
+        return self.runnable.invoke(*args, **kwargs)
+
+# --- Singleton Instance Management ---
+
+_llm_instance = None
+
+def get_llm() -> LazyLLM:
+    """Returns the shared lazy LLM of the agent."""
+    global _llm_instance
+    if _llm_instance is None:
+        _llm_instance = LazyLLM()
+    return _llm_instance
+
+def set_llm(client: Any):
+    """Injects the client behind the shared LLM, e.g. `set_llm(FakeLLM())`."""
+    get_llm().set_client(client)
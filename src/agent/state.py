@@ -45,6 +45,9 @@ class AgentState(TypedDict):
     # --- Core Decision-Making ---
     # The output of our Context & Intent Engine.
     intent: Optional[Intent]
+    # Set when a DISCOVERY request was answered on the efficiency path because
+    # the LLM was overloaded (load shedding); holds the reason.
+    degraded: Optional[str]
     
     # --- Intermediate Tool Outputs ---
     # The results from calling our deterministic tools.
@@ -68,4 +71,5 @@ class AgentState(TypedDict):
     
     # --- Error Handling & Debugging ---
     errors: Optional[List[str]]  # Any errors encountered during processing
+    failed_node: Optional[str]  # A node that failed and fell back; its run can be resumed before it
     debug_info: Optional[dict]  # Additional debug information for development
\ No newline at end of file
@@ -0,0 +1,100 @@
+"""
+Warm-up of a worker before it accepts traffic.
+
+Everything the agent needs is created lazily: the transit planner and the POI
+retriever load their datasets on first use, the indexes and the pages of the
+memory-mapped timetable are faulted in by the first queries, and the LLM
+client is created on the first invoke. Without a warm-up the first request
+after a deploy pays for all of it. `warm_up` does this work up front:
+1. loads the transit and POI datasets (building their indexes),
+2. runs representative journey and nearby-POI queries between the known
+   locations, which touches the hot pages and code paths,
+3. creates the LLM client (and with `ping_llm`, sends a minimal prompt so the
+   connection to the endpoint is opened and pooled).
+
+`is_ready` reports whether the warm-up has completed, e.g. for a health check.
+A failing step is reported but does not block readiness: the lazy paths are
+still there to retry on the first request.
+"""
+
+import os
+import threading
+import time
+from itertools import permutations
+from typing import Callable, Dict, Optional
+
+from .graph import KNOWN_LOCATIONS, llm
+
+# --- Constants and Configuration ---
+
+# Times of day of the warm-up journey queries (as arrival times).
+WARMUP_TIMES = ["08:00", "14:00", "18:00"]
+
+# Whether the warm-up sends a prompt to the LLM to open its connection. Off by
+# default since it costs an API call per worker start.
+WARMUP_LLM_PING = os.getenv("WARMUP_LLM_PING", "0") == "1"
+
+# --- Readiness ---
+
+_ready = threading.Event()
+
+def is_ready() -> bool:
+    """True once the warm-up has completed."""
+    return _ready.is_set()
+
+def wait_until_ready(timeout: Optional[float] = None) -> bool:
+    """Blocks until the warm-up has completed or the timeout expires. Returns `is_ready()`."""
+    return _ready.wait(timeout)
+
+# --- Warm-up ---
+
+def _timed(timings: Dict[str, float], name: str, step: Callable[[], None]):
+    started = time.perf_counter()
+    try:
+        step()
+    except Exception as e:
+        print(f"Warning: Warm-up step '{name}' failed: {e}")
+    timings[name] = time.perf_counter() - started
+
+def warm_up(ping_llm: bool = WARMUP_LLM_PING) -> Dict[str, float]:
+    """
+    Loads the datasets, runs representative queries and prepares the LLM client.
+
+    Args:
+        ping_llm: Send a minimal prompt to the LLM to open its connection.
+
+    Returns:
+        The seconds spent per warm-up step.
+    """
+    # Imported here, like in the graph nodes, so that importing this module stays cheap.
+    from src.tools.poi_retriever import get_poi_retriever
+    from src.tools.transit_planner import get_transit_planner
+
+    print("Warming up...")
+    timings: Dict[str, float] = {}
+    _timed(timings, "transit_data", get_transit_planner)
+    _timed(timings, "poi_data", get_poi_retriever)
+
+    def plan_journeys():
+        planner = get_transit_planner()
+        for start, end in permutations(KNOWN_LOCATIONS.values(), 2):
+            for arrival_time in WARMUP_TIMES:
+                planner.plan_journey(start, end, arrival_time_str=arrival_time)
+
+    def find_pois():
+        retriever = get_poi_retriever()
+        for location in KNOWN_LOCATIONS.values():
+            retriever.find_nearby_pois(location, max_results=3)
+
+    def prepare_llm():
+        client = llm.client
+        if ping_llm:
+            client.invoke("Reply with OK.")
+
+    _timed(timings, "journeys", plan_journeys)
+    _timed(timings, "nearby_pois", find_pois)
+    _timed(timings, "llm", prepare_llm)
+
+    _ready.set()
+    print("Warm-up complete: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items()))
+    return timings
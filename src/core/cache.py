@@ -0,0 +1,134 @@
+"""
+Memoization of tool query results.
+
+Given a loaded dataset, the tool functions are pure functions of their inputs,
+and many requests repeat the same query (e.g. the popular Purvciems -> Old Town
+journey). `QueryCache` keeps recent results with LRU and TTL eviction and
+counts hits and misses so the hit rate can be monitored.
+
+Cache keys are built from quantized inputs so that nearly identical requests
+share an entry: coordinates are snapped to a grid (`snap_to_grid`) or resolved
+to their nearest stop, times are bucketed to the minute. Keys also include the
+version of the dataset they were computed on, and the owning tool clears its
+cache when it reloads its data.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from math import cos, radians
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+from src.core.models import Coordinates
+
+# --- Constants and Configuration ---
+
+DEFAULT_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+DEFAULT_TTL_SECONDS = float(os.getenv("QUERY_CACHE_TTL_S", "600"))
+
+# Grid cell size for snapping query coordinates.
+DEFAULT_CELL_METERS = 50.0
+
+_METERS_PER_DEGREE_LAT = 111_320.0
+
+# --- Key Quantization ---
+
+def snap_to_grid(location: Coordinates, cell_meters: float = DEFAULT_CELL_METERS) -> Coordinates:
+    """
+    Snaps a coordinate to the center of its grid cell.
+
+    Cells are about `cell_meters` wide; their width in degrees of longitude is
+    fixed per latitude band so that nearby points always snap together.
+    """
+    dlat = cell_meters / _METERS_PER_DEGREE_LAT
+    row = round(location.latitude / dlat)
+    dlon = cell_meters / (_METERS_PER_DEGREE_LAT * max(cos(radians(row * dlat)), 1e-6))
+    column = round(location.longitude / dlon)
+    return Coordinates(latitude=round(row * dlat, 7), longitude=round(column * dlon, 7))
+
+def cell_radius_km(cell_meters: float = DEFAULT_CELL_METERS) -> float:
+    """An upper bound on the distance from any point to the center of its grid cell (see `snap_to_grid`)."""
+    # Half the cell diagonal is about 0.71 cells; the rest covers the cell's skew within its latitude band.
+    return 0.75 * cell_meters / 1000.0
+
+# --- Cache ---
+
+class QueryCache:
+    """
+    A thread-safe LRU cache with a time-to-live and hit-rate metrics.
+
+    Values are returned as stored; callers must not mutate them.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """Looks up a key. Returns (found, value)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if self._clock() < expires_at:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return False, None
+
+    def put(self, key: Hashable, value: Any):
+        """Stores a value, evicting the least recently used entries beyond `max_entries`."""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Returns the cached value for a key, computing and storing it on a miss."""
+        found, value = self.get(key)
+        if found:
+            return value
+        value = compute()
+        self.put(key, value)
+        return value
+
+    def clear(self):
+        """Drops all entries, e.g. after the underlying data was reloaded."""
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters, the hit rate and the current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
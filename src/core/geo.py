@@ -0,0 +1,188 @@
+"""
+Geodesic distance kernels shared by the tools.
+
+All distances are great-circle distances in kilometers on a spherical Earth.
+The module offers the same computation at three granularities:
+- `haversine_km`: scalar, for a single pair of points (plain `math`).
+- `haversine_km_array`: vectorized, element-wise over NumPy arrays.
+- `GeoPoints`: a fixed set of points (stops, POIs) with its trigonometry
+  cached, answering one-to-many queries such as `distances_from`, `within`
+  and `nearest`, and many-to-many ones with `distance_matrix`.
+
+For short distances the equirectangular projection is much cheaper than the
+haversine formula and practically exact: below EQUIRECTANGULAR_MAX_KM and
+within EQUIRECTANGULAR_MAX_LAT degrees of the equator its error stays under
+1.5 m. `distances_from` uses it by default and recomputes the (few) pairs
+outside that envelope exactly. Radius queries additionally use a bounding-box
+prefilter so that only candidates inside the box are measured.
+"""
+
+from math import asin, cos, radians, sin, sqrt
+from typing import Tuple
+
+import numpy as np
+
+from src.core.models import Coordinates
+
+# --- Constants and Configuration ---
+
+EARTH_RADIUS_KM = 6371.0
+
+# Envelope within which the equirectangular approximation is used. The error
+# grows with the cube of the distance; at 50 km and 70 degrees latitude it is
+# about 1.2 m (3e-5 relative).
+EQUIRECTANGULAR_MAX_KM = 50.0
+EQUIRECTANGULAR_MAX_LAT = 70.0
+
+# (min_lat, max_lat, min_lon, max_lon) in degrees.
+BoundingBox = Tuple[float, float, float, float]
+
+# --- Scalar and Vectorized Kernels ---
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Distance in kilometers between two points given in decimal degrees."""
+    lat1, lon1, lat2, lon2 = radians(lat1), radians(lon1), radians(lat2), radians(lon2)
+    a = sin((lat2 - lat1) / 2)**2 + cos(lat1) * cos(lat2) * sin((lon2 - lon1) / 2)**2
+    return 2 * EARTH_RADIUS_KM * asin(min(1.0, sqrt(a)))
+
+def coordinates_distance_km(coord1: Coordinates, coord2: Coordinates) -> float:
+    """`haversine_km` for two Coordinates models."""
+    return haversine_km(coord1.latitude, coord1.longitude, coord2.latitude, coord2.longitude)
+
+def haversine_km_array(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Element-wise haversine distances in kilometers; arguments broadcast like NumPy arrays."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(value, dtype=np.float64)) for value in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def equirectangular_km_array(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """
+    Element-wise equirectangular approximation of the distance in kilometers.
+
+    Only accurate for short distances; see EQUIRECTANGULAR_MAX_KM.
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(value, dtype=np.float64)) for value in (lat1, lon1, lat2, lon2))
+    x = (lon2 - lon1) * np.cos((lat1 + lat2) / 2)
+    return EARTH_RADIUS_KM * np.hypot(x, lat2 - lat1)
+
+# --- Bounding Boxes ---
+
+def bounding_box(latitude: float, longitude: float, radius_km: float) -> BoundingBox:
+    """
+    The smallest latitude/longitude box containing every point within
+    `radius_km` of the center. Near the poles the box spans all longitudes.
+    """
+    dlat = np.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat, max_lat = latitude - dlat, latitude + dlat
+    if max_lat >= 90.0 or min_lat <= -90.0:
+        return max(min_lat, -90.0), min(max_lat, 90.0), -180.0, 180.0
+    dlon = np.degrees(asin(min(1.0, sin(radius_km / EARTH_RADIUS_KM) / cos(radians(latitude)))))
+    return min_lat, max_lat, longitude - dlon, longitude + dlon
+
+def in_bounding_box(latitudes: np.ndarray, longitudes: np.ndarray, box: BoundingBox) -> np.ndarray:
+    """Boolean mask of the points inside a bounding box (boxes do not wrap the antimeridian)."""
+    min_lat, max_lat, min_lon, max_lon = box
+    return (latitudes >= min_lat) & (latitudes <= max_lat) & (longitudes >= min_lon) & (longitudes <= max_lon)
+
+# --- Point Sets ---
+
+class GeoPoints:
+    """
+    A fixed set of points with cached trigonometry for one-to-many queries.
+
+    Build it once per dataset (e.g. all stops of a timetable, all POIs) and
+    reuse it for every query point.
+    """
+
+    def __init__(self, latitudes, longitudes):
+        self.latitudes = np.asarray(latitudes, dtype=np.float64)
+        self.longitudes = np.asarray(longitudes, dtype=np.float64)
+        self._lat_rad = np.radians(self.latitudes)
+        self._lon_rad = np.radians(self.longitudes)
+        self._cos_lat = np.cos(self._lat_rad)
+
+    @classmethod
+    def from_coordinates(cls, coordinates) -> "GeoPoints":
+        """Builds a point set from a sequence of Coordinates models."""
+        coordinates = list(coordinates)
+        return cls([c.latitude for c in coordinates], [c.longitude for c in coordinates])
+
+    @classmethod
+    def concatenate(cls, parts) -> "GeoPoints":
+        """Joins point sets in order, reusing their cached trigonometry."""
+        parts = list(parts)
+        points = cls.__new__(cls)
+        for name in ('latitudes', 'longitudes', '_lat_rad', '_lon_rad', '_cos_lat'):
+            setattr(points, name, np.concatenate([getattr(part, name) for part in parts])
+                    if parts else np.zeros(0, dtype=np.float64))
+        return points
+
+    def __len__(self) -> int:
+        return len(self.latitudes)
+
+    def _haversine(self, latitude: float, longitude: float, subset=slice(None)) -> np.ndarray:
+        lat, lon = radians(latitude), radians(longitude)
+        a = (np.sin((self._lat_rad[subset] - lat) / 2)**2
+             + cos(lat) * self._cos_lat[subset] * np.sin((self._lon_rad[subset] - lon) / 2)**2)
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+    def _equirectangular(self, latitude: float, longitude: float, subset=slice(None)) -> np.ndarray:
+        lat, lon = radians(latitude), radians(longitude)
+        x = (self._lon_rad[subset] - lon) * np.cos((self._lat_rad[subset] + lat) / 2)
+        return EARTH_RADIUS_KM * np.hypot(x, self._lat_rad[subset] - lat)
+
+    def distance_matrix(self, latitudes, longitudes, subset=slice(None)) -> np.ndarray:
+        """
+        Haversine distances in kilometers from many query points to the points.
+
+        Args:
+            latitudes: Latitudes of the query points.
+            longitudes: Longitudes of the query points.
+            subset: Indices of the points to measure to (default: all).
+
+        Returns:
+            A (queries, points) matrix.
+        """
+        lat = np.radians(np.asarray(latitudes, dtype=np.float64))[:, None]
+        lon = np.radians(np.asarray(longitudes, dtype=np.float64))[:, None]
+        a = (np.sin((self._lat_rad[subset][None, :] - lat) / 2)**2
+             + np.cos(lat) * self._cos_lat[subset][None, :] * np.sin((self._lon_rad[subset][None, :] - lon) / 2)**2)
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+    def distances_from(self, location: Coordinates, exact: bool = False) -> np.ndarray:
+        """
+        Distances in kilometers from one location to every point.
+
+        Args:
+            location: The query point.
+            exact: Always use the haversine formula instead of the checked
+                equirectangular fast path.
+        """
+        if exact or abs(location.latitude) > EQUIRECTANGULAR_MAX_LAT:
+            return self._haversine(location.latitude, location.longitude)
+        distances = self._equirectangular(location.latitude, location.longitude)
+        # Pairs outside the error envelope are measured exactly.
+        outside = np.flatnonzero((distances > EQUIRECTANGULAR_MAX_KM)
+                                 | (np.abs(self.latitudes) > EQUIRECTANGULAR_MAX_LAT))
+        if len(outside):
+            distances[outside] = self._haversine(location.latitude, location.longitude, outside)
+        return distances
+
+    def within(self, location: Coordinates, radius_km: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Points within a radius of a location, using a bounding-box prefilter.
+
+        Returns:
+            A tuple of (indices, distances_km) in index order.
+        """
+        box = bounding_box(location.latitude, location.longitude, radius_km)
+        candidates = np.flatnonzero(in_bounding_box(self.latitudes, self.longitudes, box))
+        distances = self._haversine(location.latitude, location.longitude, candidates)
+        keep = distances <= radius_km
+        return candidates[keep], distances[keep]
+
+    def nearest(self, location: Coordinates) -> Tuple[int, float]:
+        """Index of and distance in kilometers to the point closest to a location."""
+        distances = self.distances_from(location)
+        index = int(np.argmin(distances))
+        return index, float(distances[index])
@@ -0,0 +1,185 @@
+"""
+Persistent store of generated quests.
+
+Synthesizing a quest is the agent's most expensive step (an LLM call of
+several seconds), and most requests are common commutes asked for again and
+again. `QuestStore` keeps the generated quests in a local SQLite database so
+that a repeated request is served the stored quest instead. Unlike the
+in-memory `QueryCache`, the store survives restarts and is shared by all
+worker processes on the machine (SQLite in WAL mode).
+
+Quests are keyed canonically by what determines them: the start and end stop
+of the journey, the trip actually planned (route, stops, departure and arrival
+time of each transit leg) and the intent (see `quest_key`). Requests at
+different times share a quest only if they are served by the same trip, so
+a replayed quest never has legs of another departure.
+Every entry also records the dataset version it was generated from (the GTFS
+feed and the POIs); entries of another version are never served and are
+dropped as soon as a different version is seen. Entries expire after
+QUEST_STORE_MAX_AGE_S, and beyond QUEST_STORE_MAX_ENTRIES the least recently
+used ones are evicted.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Mapping, Optional, Sequence
+
+from src.core.models import Quest
+from src.core.serialization import decode_model, dumps
+
+# --- Constants and Configuration ---
+
+QUEST_STORE_PATH = os.getenv(
+    "QUEST_STORE_PATH", os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'quests', 'quests.sqlite3'))
+QUEST_STORE_MAX_ENTRIES = int(os.getenv("QUEST_STORE_MAX_ENTRIES", "10000"))
+QUEST_STORE_MAX_AGE_S = float(os.getenv("QUEST_STORE_MAX_AGE_S", str(7 * 24 * 3600)))
+
+# The transit leg fields that identify the planned trip.
+TRIP_FIELDS = ('vehicle_type', 'route_short_name', 'trip_headsign', 'start_stop_name', 'end_stop_name',
+               'departure_time', 'arrival_time')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS quests (
+    key TEXT PRIMARY KEY,
+    dataset_version TEXT NOT NULL,
+    quest BLOB NOT NULL,
+    created_at REAL NOT NULL,
+    used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS quests_used_at ON quests (used_at);
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+# --- Keys ---
+
+def quest_key(start_stop_id: str, end_stop_id: str, transit_plan: Sequence[Mapping[str, Any]], intent: str) -> str:
+    """
+    The canonical store key of a journey request.
+
+    Args:
+        start_stop_id: The stop the journey starts from.
+        end_stop_id: The stop the journey ends at.
+        transit_plan: The planned transit legs (as dicts), which fix the trip and its times.
+        intent: The intent of the request.
+    """
+    trip = "|".join(",".join(str(leg.get(field)) for field in TRIP_FIELDS) for leg in transit_plan)
+    trip_digest = hashlib.sha256(trip.encode('utf-8')).hexdigest()[:16]
+    return f"{start_stop_id}|{end_stop_id}|{trip_digest}|{intent}"
+
+# --- Store ---
+
+class QuestStore:
+    """A SQLite-backed store of quests with versioning, expiry and LRU eviction."""
+
+    def __init__(self, path: str = QUEST_STORE_PATH, max_entries: int = QUEST_STORE_MAX_ENTRIES,
+                 max_age_s: float = QUEST_STORE_MAX_AGE_S, clock: Callable[[], float] = time.time):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_s = max_age_s
+        self._clock = clock
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+        with self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.executescript(_SCHEMA)
+        self._dataset_version = self._meta("dataset_version")
+        self.hits = 0
+        self.misses = 0
+
+    def _meta(self, name: str) -> Optional[str]:
+        row = self._connection.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def invalidate(self, dataset_version: str) -> int:
+        """
+        Drops the quests of every other dataset version, e.g. after a GTFS or POI reload.
+
+        Returns:
+            The number of quests dropped.
+        """
+        with self._lock, self._connection:
+            dropped = self._connection.execute(
+                "DELETE FROM quests WHERE dataset_version != ?", (dataset_version,)).rowcount
+            self._connection.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('dataset_version', ?)",
+                                     (dataset_version,))
+            self._dataset_version = dataset_version
+        if dropped:
+            print(f"Dropped {dropped} stored quests of an older dataset version.")
+        return dropped
+
+    def _check_version(self, dataset_version: str):
+        if dataset_version != self._dataset_version:
+            self.invalidate(dataset_version)
+
+    def get(self, key: str, dataset_version: str) -> Optional[Quest]:
+        """Returns the stored quest of a key if it was generated from this dataset version and has not expired."""
+        self._check_version(dataset_version)
+        now = self._clock()
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT quest FROM quests WHERE key = ? AND dataset_version = ? AND created_at >= ?",
+                (key, dataset_version, now - self.max_age_s)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._connection.execute("UPDATE quests SET used_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return decode_model(Quest, row[0])
+
+    def put(self, key: str, dataset_version: str, quest: Quest):
+        """Stores a quest, then evicts expired and least recently used quests beyond `max_entries`."""
+        self._check_version(dataset_version)
+        now = self._clock()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO quests (key, dataset_version, quest, created_at, used_at) "
+                "VALUES (?, ?, ?, ?, ?)", (key, dataset_version, dumps(quest), now, now))
+            self._evict(now)
+
+    def _evict(self, now: float) -> int:
+        evicted = self._connection.execute("DELETE FROM quests WHERE created_at < ?",
+                                           (now - self.max_age_s,)).rowcount
+        evicted += self._connection.execute(
+            "DELETE FROM quests WHERE key IN (SELECT key FROM quests ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+            (max(self.max_entries, 0),)).rowcount
+        return evicted
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM quests").fetchone()[0]
+
+    def clear(self):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM quests")
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters of this process and the number of stored quests."""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'size': len(self),
+            'max_entries': self.max_entries,
+            'dataset_version': self._dataset_version,
+        }
+
+# --- Singleton Instance Management ---
+
+_quest_store_instance = None
+
+def get_quest_store() -> QuestStore:
+    """Returns the shared quest store, opening it if necessary."""
+    global _quest_store_instance
+    if _quest_store_instance is None:
+        _quest_store_instance = QuestStore()
+    return _quest_store_instance
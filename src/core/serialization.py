@@ -0,0 +1,84 @@
+"""
+Single JSON serialization layer for tool results, agent state and LLM output.
+
+Tool results used to be turned into dicts with `.dict()`, stored in the agent
+state, dumped again with `json.dumps(indent=2)` for the prompt, and the LLM's
+reply was parsed with `json.loads` before being validated into a Quest. This
+module replaces those round trips:
+- `dumps` encodes models (and lists/dicts of them) straight to JSON bytes,
+  without building intermediate dicts. Tools cache these bytes so a result is
+  encoded once and reused for prompts and API responses.
+- `dumps_text` turns values or encoded bytes into text, indented for readability
+  or compact, e.g. to quote the tools' cached bytes in prompts as they are.
+- `to_builtins` turns models into plain JSON-compatible values for the state.
+- `decode_model` validates JSON text directly into a model.
+
+orjson is used when installed, otherwise the standard library `json`.
+"""
+
+import json
+from enum import Enum
+from typing import Any, Type, TypeVar, Union
+
+import numpy as np
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # Optional dependency: fall back to the standard library.
+    orjson = None
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+# --- Encoding ---
+
+def _default(value: Any) -> Any:
+    """Encodes the types the JSON libraries do not know natively."""
+    if isinstance(value, BaseModel):
+        # Field values only; nested models come back through this hook.
+        return value.__dict__
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(value: Any) -> bytes:
+    """Encodes a value, which may contain Pydantic models, to compact UTF-8 JSON."""
+    if orjson is not None:
+        return orjson.dumps(value, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(value, default=_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def dumps_text(value: Any, indent: bool = True) -> str:
+    """Encodes a value to a JSON string, indented by two spaces for readability (e.g. in prompts)."""
+    if isinstance(value, (bytes, bytearray)) and not indent:
+        return value.decode('utf-8')
+    if isinstance(value, (bytes, bytearray)):
+        value = loads(value)
+    if orjson is not None:
+        option = orjson.OPT_SERIALIZE_NUMPY | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(value, default=_default, option=option).decode('utf-8')
+    return json.dumps(value, default=_default, ensure_ascii=False, indent=2 if indent else None)
+
+# --- Decoding ---
+
+def loads(data: Union[bytes, bytearray, str]) -> Any:
+    """Decodes JSON into plain Python values."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def to_builtins(value: Any) -> Any:
+    """Converts models (and containers of them) into JSON-compatible dicts, lists and scalars."""
+    return loads(dumps(value))
+
+def decode_model(model_cls: Type[ModelT], data: Union[bytes, str]) -> ModelT:
+    """
+    Validates JSON text straight into a model, without an intermediate dict.
+
+    Raises:
+        pydantic.ValidationError: If the text is not valid JSON for the model.
+    """
+    return model_cls.model_validate_json(data)
@@ -0,0 +1,90 @@
+"""
+Coalescing of identical concurrent calls ("single-flight").
+
+During events many users send the same request at the same moment, and each
+would run the full agent graph, LLM calls included. `SingleFlight` lets the
+first caller for a key run the work while concurrent callers with the same key
+wait for it and share its result (or its exception). Unlike `QueryCache`,
+nothing is kept once the call completes: later callers run the work again.
+
+Keys must identify the work completely, e.g. the normalized request text or
+the parsed journey parameters. Shared results must be treated as read-only;
+per-caller changes (formatting, personalization) are applied to a copy after
+the call returns.
+"""
+
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+class _Call:
+    """An in-flight call and the callers waiting for it."""
+    __slots__ = ('done', 'value', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+class SingleFlight:
+    """Runs at most one call per key at a time; concurrent callers share its outcome."""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, compute: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Returns the result of `compute`, run once for all concurrent callers of a key.
+
+        Returns:
+            (value, shared): `shared` is True if the value came from another
+            caller's call.
+
+        Raises:
+            Any exception raised by `compute`, in every caller that waited for it.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value, True
+
+        try:
+            call.value = compute()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.value, False
+
+    def in_flight(self) -> int:
+        """The number of keys currently being computed."""
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self) -> Dict[str, Any]:
+        """How many calls ran and how many were served by another caller's call."""
+        with self._lock:
+            requests = self.executions + self.coalesced
+            return {
+                'executions': self.executions,
+                'coalesced': self.coalesced,
+                'coalesced_rate': self.coalesced / requests if requests else 0.0,
+                'in_flight': len(self._calls),
+            }
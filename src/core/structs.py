@@ -0,0 +1,54 @@
+"""
+Lightweight internal structs and cheap converters to the Pydantic models.
+
+The Pydantic models in `models.py` validate every field on construction, which
+is what we want where data enters the application (JSON files, user input,
+LLM output) but wasted work inside the tools, whose values are already
+validated or computed with the right types. The tools therefore use:
+- the slotted dataclass `LatLon` for coordinates created in loops,
+- Pydantic's `model_construct` to build a model from already-valid field
+  values without validation, e.g. `extend_model` for a POIWithDistance from a
+  loaded POI plus a distance,
+- `construct_poi` to rebuild a POI from a record that was validated when it
+  was written (the binary catalog).
+
+Transit legs, POIs and routing results have no struct types of their own: the
+tools return them as models, and the journey search itself runs on NumPy
+arrays, so a struct per result would only add a conversion. They are built
+with `model_construct` instead, which skips the validation that made them costly.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, Type, TypeVar
+
+from pydantic import BaseModel
+
+from src.core.models import POI, Coordinates, Media, NarrativeHooks, POICategory, POIType, PracticalInfo
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+# --- Converters ---
+
+def extend_model(model: BaseModel, model_cls: Type[ModelT], **extra: Any) -> ModelT:
+    """Builds a subclass model (e.g. POIWithDistance) from a validated model plus the extra fields."""
+    return model_cls.model_construct(**{**model.__dict__, **extra})
+
+def construct_poi(record: Dict[str, Any]) -> POI:
+    """Rebuilds a POI from the `dict()` of a POI that was validated before."""
+    return POI.model_construct(**{
+        **record,
+        'coordinates': Coordinates.model_construct(**record['coordinates']),
+        'category': POICategory(record['category']),
+        'narrative_hooks': NarrativeHooks.model_construct(**record['narrative_hooks']),
+        'media': Media.model_construct(**record['media']),
+        'practical_info': PracticalInfo.model_construct(**{
+            **record['practical_info'], 'type': POIType(record['practical_info']['type'])}),
+    })
+
+# --- Internal Structs ---
+
+@dataclass(frozen=True, slots=True)
+class LatLon:
+    """A coordinate pair; usable wherever the tools read `.latitude` and `.longitude`."""
+    latitude: float
+    longitude: float
@@ -0,0 +1,543 @@
+"""
+Connection Scan Algorithm (CSA) engine for the GTFS timetable.
+
+This module flattens the GTFS `stop_times` into a single, contiguous array of
+elementary connections (one vehicle hop between two consecutive stops of a
+trip), sorted by departure time and stored column-wise in NumPy arrays.
+
+Queries are answered with a single linear scan:
+- Earliest arrival ("depart at"): scan forward from the first connection that
+  departs at or after the query time, found by bisection.
+- Latest departure ("arrive by"): scan backward over the connections ordered
+  by arrival time, starting from the last one that arrives in time.
+- Profile ("all useful departures in a window"): one backward scan over the
+  departure-sorted connections, keeping per stop the Pareto set of
+  (departure, arrival) pairs.
+
+Unlike the merge-based planner, the scan naturally finds journeys with
+transfers between trips at the same stop. It is used by `TransitPlanner` when
+the "csa" engine is selected.
+
+`ConnectionScanEngine.from_stop_times_csv` builds the engine by streaming
+`stop_times.txt` in chunks into preallocated arrays, so peak memory while
+loading stays close to the size of the final arrays.
+"""
+
+import bisect
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# --- Constants and Configuration ---
+
+# Connections are scanned in Python in slices of this size, which keeps the
+# per-element cost low without converting the whole array to Python objects.
+SCAN_CHUNK_SIZE = 4096
+
+# Rows of stop_times.txt parsed per chunk by the streaming ingester.
+STREAM_CHUNK_ROWS = 50_000
+
+# Sentinel values for "not reached" in the arrival/departure label arrays.
+UNREACHED_ARRIVAL = np.iinfo(np.int32).max
+UNREACHED_DEPARTURE = np.iinfo(np.int32).min
+
+# --- Helper Functions ---
+
+def time_str_to_seconds(time_str: str) -> int:
+    """Converts a GTFS "HH:MM:SS" or "HH:MM" string into seconds since midnight."""
+    parts = [int(part) for part in str(time_str).strip().split(':')]
+    hours, minutes = parts[0], parts[1]
+    seconds = parts[2] if len(parts) > 2 else 0
+    return hours * 3600 + minutes * 60 + seconds
+
+def times_to_seconds(values: pd.Series, errors: str = 'raise') -> np.ndarray:
+    """
+    Vectorized `time_str_to_seconds` for a column of GTFS time strings.
+
+    Well-formed "H:MM:SS"/"HH:MM:SS" values are decoded digit by digit from a
+    fixed-width byte array; anything else falls back to the scalar parser.
+
+    Args:
+        values: The time strings.
+        errors: 'raise' on values the scalar parser rejects, or 'coerce' them
+            to -1 (GTFS times are never negative).
+    """
+    raw = np.char.zfill(values.to_numpy(dtype='S8'), 8)
+    digits = raw.view(np.uint8).reshape(-1, 8).astype(np.int32) - ord('0')
+    seconds = ((digits[:, 0] * 10 + digits[:, 1]) * 3600 + (digits[:, 3] * 10 + digits[:, 4]) * 60
+               + digits[:, 6] * 10 + digits[:, 7])
+
+    separators = ord(':') - ord('0')
+    numeric = np.delete(digits, [2, 5], axis=1)
+    well_formed = ((digits[:, 2] == separators) & (digits[:, 5] == separators)
+                   & ((numeric >= 0) & (numeric <= 9)).all(axis=1))
+    fallback = ~well_formed
+    if errors == 'coerce':
+        # Blank times (untimed stops) can be common; they need no scalar parse.
+        blank = values.to_numpy(dtype=object) == ''
+        seconds[blank] = -1
+        fallback &= ~blank
+    for row in np.flatnonzero(fallback):
+        try:
+            seconds[row] = time_str_to_seconds(values.iloc[row])
+        except (ValueError, IndexError):
+            if errors != 'coerce':
+                raise
+            seconds[row] = -1
+    return seconds.astype(np.int32)
+
+def _count_data_rows(path: str) -> int:
+    """Upper bound on the number of CSV data rows: line count minus the header."""
+    lines = 0
+    last = b'\n'
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            lines += block.count(b'\n')
+            last = block[-1:]
+    if last != b'\n':
+        lines += 1
+    return max(lines - 1, 0)
+
+def seconds_to_hhmm(seconds: int) -> str:
+    """Formats seconds since midnight as "HH:MM", keeping GTFS hours past 24."""
+    return f"{seconds // 3600:02d}:{(seconds % 3600) // 60:02d}"
+
+# A single in-vehicle leg of a CSA journey: (enter connection, exit connection).
+CSALeg = Tuple[int, int]
+
+# The arrays that fully describe an engine, e.g. for publishing it to shared memory.
+ENGINE_ARRAYS = (
+    'dep_stop', 'arr_stop', 'dep_time', 'arr_time', 'trip', 'dep_seq', 'arr_seq',
+    'arr_order', 'arr_time_sorted', 'stop_ids', 'stop_names',
+    'trip_ids', 'trip_route_short_names', 'trip_headsigns', 'trip_route_types',
+)
+
+# --- The Engine ---
+
+class ConnectionScanEngine:
+    """
+    Holds the time-sorted connections array and answers point-to-point queries.
+
+    Stops and trips are addressed by dense integer indices. Stop indices follow
+    the row order of the `stops_df` passed at construction time.
+    """
+
+    def __init__(self, stop_times_df: pd.DataFrame, trips_df: pd.DataFrame,
+                 routes_df: pd.DataFrame, stops_df: pd.DataFrame):
+        """Builds the connection arrays from the raw GTFS frames."""
+        self._build_stop_metadata(stops_df)
+        self._build_trip_metadata(trips_df, routes_df)
+        self._build_connections(stop_times_df)
+
+    @classmethod
+    def from_stop_times_csv(cls, stop_times_path: str, trips_df: pd.DataFrame, routes_df: pd.DataFrame,
+                            stops_df: pd.DataFrame, chunk_rows: int = STREAM_CHUNK_ROWS,
+                            on_chunk: Optional[Callable[[pd.DataFrame], None]] = None) -> "ConnectionScanEngine":
+        """
+        Builds the engine by streaming `stop_times.txt` instead of loading it whole.
+
+        The file is read in chunks of `chunk_rows`; each chunk's ids and times
+        are encoded straight into preallocated int32 columns, so neither the
+        full stop_times frame nor a merged timetable is ever materialized.
+        Rows with unknown trips or stops, without valid times or with a
+        non-numeric stop_sequence are skipped.
+
+        Args:
+            on_chunk: Called with every chunk as read (all columns as strings)
+                before it is encoded, e.g. to validate the file in the same pass.
+        """
+        engine = cls.__new__(cls)
+        engine._build_stop_metadata(stops_df)
+        engine._build_trip_metadata(trips_df, routes_df)
+
+        capacity = _count_data_rows(stop_times_path)
+        trip_idx = np.empty(capacity, dtype=np.int32)
+        stop_idx = np.empty(capacity, dtype=np.int32)
+        sequence = np.empty(capacity, dtype=np.int32)
+        arrivals = np.empty(capacity, dtype=np.int32)
+        departures = np.empty(capacity, dtype=np.int32)
+
+        filled = 0
+        reader = pd.read_csv(
+            stop_times_path, chunksize=chunk_rows, dtype=str, keep_default_na=False,
+            usecols=['trip_id', 'arrival_time', 'departure_time', 'stop_id', 'stop_sequence'],
+        )
+        for chunk in reader:
+            if on_chunk is not None:
+                on_chunk(chunk)
+            trips = chunk['trip_id'].map(engine.trip_index)
+            stops = chunk['stop_id'].map(engine.stop_index)
+            engine.unknown_stop_ids.update(chunk.loc[stops.isna() & (chunk['stop_id'] != ''), 'stop_id'])
+            sequences = pd.to_numeric(chunk['stop_sequence'], errors='coerce')
+            # Blank or malformed times are -1.
+            chunk_arrivals = times_to_seconds(chunk['arrival_time'], errors='coerce')
+            chunk_departures = times_to_seconds(chunk['departure_time'], errors='coerce')
+            valid = ((trips.notna() & stops.notna() & sequences.notna()).to_numpy()
+                     & (chunk_arrivals >= 0) & (chunk_departures >= 0))
+            end = filled + int(valid.sum())
+            trip_idx[filled:end] = trips.to_numpy()[valid]
+            stop_idx[filled:end] = stops.to_numpy()[valid]
+            sequence[filled:end] = sequences.to_numpy()[valid]
+            arrivals[filled:end] = chunk_arrivals[valid]
+            departures[filled:end] = chunk_departures[valid]
+            filled = end
+
+        order = np.lexsort((sequence[:filled], trip_idx[:filled]))
+        engine._set_connections(*_pair_consecutive_stops(
+            trip_idx[order], stop_idx[order], sequence[order], arrivals[order], departures[order]))
+        return engine
+
+    def _build_stop_metadata(self, stops_df: pd.DataFrame):
+        """Encodes stops as dense indices following the row order of `stops_df`."""
+        self.stop_ids: List[str] = stops_df['stop_id'].astype(str).tolist()
+        self.stop_names: List[str] = stops_df['stop_name'].astype(str).tolist()
+        self.stop_index = {stop_id: i for i, stop_id in enumerate(self.stop_ids)}
+        # stop_ids referenced by stop_times but missing from the stops table.
+        self.unknown_stop_ids = set()
+
+    def _build_trip_metadata(self, trips_df: pd.DataFrame, routes_df: pd.DataFrame):
+        """Encodes trips as dense indices and keeps the fields needed for legs."""
+        trips = pd.merge(trips_df, routes_df, on='route_id', how='left')
+        self.trip_ids: List[str] = trips['trip_id'].astype(str).tolist()
+        self.trip_index = {trip_id: i for i, trip_id in enumerate(self.trip_ids)}
+        self.trip_route_short_names: List[str] = trips['route_short_name'].astype(str).tolist()
+        self.trip_headsigns: List[str] = trips['trip_headsign'].astype(str).tolist()
+        self.trip_route_types: List[int] = trips['route_type'].fillna(3).astype(int).tolist()
+
+    def _build_connections(self, stop_times_df: pd.DataFrame):
+        """Pairs consecutive stop_times of each trip into departure-sorted connections."""
+        stop_times = stop_times_df[['trip_id', 'stop_id', 'stop_sequence', 'arrival_time', 'departure_time']].copy()
+        stop_times['trip_idx'] = stop_times['trip_id'].astype(str).map(self.trip_index)
+        stop_times['stop_idx'] = stop_times['stop_id'].astype(str).map(self.stop_index)
+        self.unknown_stop_ids.update(stop_times.loc[stop_times['stop_idx'].isna(), 'stop_id'].astype(str))
+        # Rows pointing to unknown trips or stops cannot be routed over.
+        stop_times = stop_times.dropna(subset=['trip_idx', 'stop_idx'])
+        stop_times = stop_times.sort_values(['trip_idx', 'stop_sequence'], kind='stable')
+
+        trip_idx = stop_times['trip_idx'].to_numpy(dtype=np.int32)
+        stop_idx = stop_times['stop_idx'].to_numpy(dtype=np.int32)
+        sequence = stop_times['stop_sequence'].to_numpy(dtype=np.int32)
+        arrivals = np.fromiter((time_str_to_seconds(t) for t in stop_times['arrival_time']),
+                               dtype=np.int32, count=len(stop_times))
+        departures = np.fromiter((time_str_to_seconds(t) for t in stop_times['departure_time']),
+                                 dtype=np.int32, count=len(stop_times))
+
+        self._set_connections(*_pair_consecutive_stops(trip_idx, stop_idx, sequence, arrivals, departures))
+
+    def _set_connections(self, dep_stop: np.ndarray, arr_stop: np.ndarray,
+                         dep_time: np.ndarray, arr_time: np.ndarray, trip: np.ndarray,
+                         dep_seq: np.ndarray, arr_seq: np.ndarray):
+        """Stores the connection columns sorted by departure time."""
+        order = np.argsort(dep_time, kind='stable')
+        self.dep_stop = dep_stop[order]
+        self.arr_stop = arr_stop[order]
+        self.dep_time = dep_time[order]
+        self.arr_time = arr_time[order]
+        self.trip = trip[order]
+        self.dep_seq = dep_seq[order]
+        self.arr_seq = arr_seq[order]
+
+        # Secondary ordering used by the backward (latest departure) scan.
+        self.arr_order = np.argsort(self.arr_time, kind='stable').astype(np.int32)
+        self.arr_time_sorted = self.arr_time[self.arr_order]
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Exports the engine as flat NumPy arrays (strings as fixed-width unicode)."""
+        return {name: np.asarray(getattr(self, name)) for name in ENGINE_ARRAYS}
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "ConnectionScanEngine":
+        """
+        Rebuilds an engine around existing arrays without copying them.
+
+        The arrays may be read-only memory maps shared between processes; the
+        engine never writes to them.
+        """
+        engine = cls.__new__(cls)
+        for name in ENGINE_ARRAYS:
+            setattr(engine, name, arrays[name])
+        engine.stop_index = {str(stop_id): i for i, stop_id in enumerate(engine.stop_ids)}
+        engine.trip_index = {str(trip_id): i for i, trip_id in enumerate(engine.trip_ids)}
+        engine.unknown_stop_ids = set()
+        return engine
+
+    @property
+    def num_connections(self) -> int:
+        """The number of elementary connections in the timetable."""
+        return len(self.dep_time)
+
+    def earliest_arrival(self, source: int, target: int, departure_s: int) -> Optional[List[CSALeg]]:
+        """
+        Finds the journey that reaches `target` the earliest when leaving
+        `source` at or after `departure_s` seconds since midnight.
+
+        Returns:
+            The journey as a list of CSALeg, or None if the target is unreachable.
+        """
+        if source == target:
+            return None
+
+        arrival = [UNREACHED_ARRIVAL] * len(self.stop_ids)
+        arrival[source] = departure_s
+        boarded_at = {}  # trip index -> connection index where it was boarded
+        journey_pointer = {}  # stop index -> (enter connection, exit connection)
+
+        start = int(np.searchsorted(self.dep_time, departure_s, side='left'))
+        for chunk_start in range(start, self.num_connections, SCAN_CHUNK_SIZE):
+            chunk_end = min(chunk_start + SCAN_CHUNK_SIZE, self.num_connections)
+            dep_times = self.dep_time[chunk_start:chunk_end].tolist()
+            if arrival[target] <= dep_times[0]:
+                break
+            arr_times = self.arr_time[chunk_start:chunk_end].tolist()
+            dep_stops = self.dep_stop[chunk_start:chunk_end].tolist()
+            arr_stops = self.arr_stop[chunk_start:chunk_end].tolist()
+            trips = self.trip[chunk_start:chunk_end].tolist()
+
+            for offset, dep_time in enumerate(dep_times):
+                if arrival[target] <= dep_time:
+                    break
+                trip = trips[offset]
+                connection = chunk_start + offset
+                if trip not in boarded_at:
+                    if arrival[dep_stops[offset]] > dep_time:
+                        continue
+                    boarded_at[trip] = connection
+                arr_stop = arr_stops[offset]
+                if arr_times[offset] < arrival[arr_stop]:
+                    arrival[arr_stop] = arr_times[offset]
+                    journey_pointer[arr_stop] = (boarded_at[trip], connection)
+
+        if arrival[target] == UNREACHED_ARRIVAL:
+            return None
+
+        legs = []
+        stop = target
+        while stop != source:
+            enter, exit_ = journey_pointer[stop]
+            legs.append((enter, exit_))
+            stop = int(self.dep_stop[enter])
+        legs.reverse()
+        return legs
+
+    def earliest_arrivals(self, source_departures: Dict[int, int],
+                          max_arrival_s: Optional[int] = None) -> np.ndarray:
+        """
+        One-to-all search: the earliest arrival time at every stop.
+
+        Args:
+            source_departures: Maps each source stop index to the time (seconds
+                since midnight) the traveller can be there, e.g. after walking.
+            max_arrival_s: Optional time horizon; connections departing after it
+                are not scanned.
+
+        Returns:
+            An int32 array with one arrival time per stop, UNREACHED_ARRIVAL
+            where the stop cannot be reached within the horizon.
+        """
+        arrival = [UNREACHED_ARRIVAL] * len(self.stop_ids)
+        for stop, departure_s in source_departures.items():
+            arrival[stop] = min(arrival[stop], departure_s)
+        if not source_departures:
+            return np.array(arrival, dtype=np.int32)
+
+        horizon = max_arrival_s if max_arrival_s is not None else UNREACHED_ARRIVAL
+        boarded = set()
+        start = int(np.searchsorted(self.dep_time, min(source_departures.values()), side='left'))
+        end = int(np.searchsorted(self.dep_time, horizon, side='right'))
+        for chunk_start in range(start, end, SCAN_CHUNK_SIZE):
+            chunk_end = min(chunk_start + SCAN_CHUNK_SIZE, end)
+            dep_times = self.dep_time[chunk_start:chunk_end].tolist()
+            arr_times = self.arr_time[chunk_start:chunk_end].tolist()
+            dep_stops = self.dep_stop[chunk_start:chunk_end].tolist()
+            arr_stops = self.arr_stop[chunk_start:chunk_end].tolist()
+            trips = self.trip[chunk_start:chunk_end].tolist()
+
+            for offset, dep_time in enumerate(dep_times):
+                trip = trips[offset]
+                if trip not in boarded:
+                    if arrival[dep_stops[offset]] > dep_time:
+                        continue
+                    boarded.add(trip)
+                arr_stop = arr_stops[offset]
+                if arr_times[offset] < arrival[arr_stop] and arr_times[offset] <= horizon:
+                    arrival[arr_stop] = arr_times[offset]
+
+        return np.array(arrival, dtype=np.int32)
+
+    def latest_departure(self, source: int, target: int, arrival_s: int) -> Optional[List[CSALeg]]:
+        """
+        Finds the journey that leaves `source` the latest while still reaching
+        `target` no later than `arrival_s` seconds since midnight.
+
+        Returns:
+            The journey as a list of CSALeg, or None if no such journey exists.
+        """
+        if source == target:
+            return None
+
+        departure = [UNREACHED_DEPARTURE] * len(self.stop_ids)
+        departure[target] = arrival_s
+        alighted_at = {}  # trip index -> connection index where it is left
+        journey_pointer = {}  # stop index -> (enter connection, exit connection)
+
+        end = int(np.searchsorted(self.arr_time_sorted, arrival_s, side='right'))
+        for chunk_end in range(end, 0, -SCAN_CHUNK_SIZE):
+            chunk_start = max(chunk_end - SCAN_CHUNK_SIZE, 0)
+            connections = self.arr_order[chunk_start:chunk_end][::-1]
+            arr_times = self.arr_time[connections].tolist()
+            if departure[source] >= arr_times[0]:
+                break
+            dep_times = self.dep_time[connections].tolist()
+            dep_stops = self.dep_stop[connections].tolist()
+            arr_stops = self.arr_stop[connections].tolist()
+            trips = self.trip[connections].tolist()
+            connection_ids = connections.tolist()
+
+            for offset, arr_time in enumerate(arr_times):
+                if departure[source] >= arr_time:
+                    break
+                trip = trips[offset]
+                connection = connection_ids[offset]
+                if trip not in alighted_at:
+                    if departure[arr_stops[offset]] < arr_time:
+                        continue
+                    alighted_at[trip] = connection
+                dep_stop = dep_stops[offset]
+                if dep_times[offset] > departure[dep_stop]:
+                    departure[dep_stop] = dep_times[offset]
+                    journey_pointer[dep_stop] = (connection, alighted_at[trip])
+
+        if departure[source] == UNREACHED_DEPARTURE:
+            return None
+
+        legs = []
+        stop = source
+        while stop != target:
+            enter, exit_ = journey_pointer[stop]
+            legs.append((enter, exit_))
+            stop = int(self.arr_stop[exit_])
+        return legs
+
+    def profile(self, source: int, target: int, window_start_s: int,
+                window_end_s: int) -> List[Tuple[int, int, List[CSALeg]]]:
+        """
+        Profile query: the useful journeys from `source` to `target` departing
+        within a time window, found with a single backward scan.
+
+        The connections departing at or after `window_start_s` are scanned once,
+        latest first. Every stop keeps its profile: the (departure, arrival at
+        the target) pairs that no later departure from the stop beats, appended
+        in decreasing departure order. Every trip keeps its earliest arrival at
+        the target when boarded. A connection's arrival is the best of staying
+        on its trip, alighting at the target and continuing from the profile of
+        its arrival stop; it extends the profile of its departure stop if it
+        beats every later departure from there.
+
+        Returns:
+            (departure_s, arrival_s, journey) for each Pareto-optimal option (no
+            other option in the window departs later and arrives as early),
+            ordered by departure.
+        """
+        if source == target:
+            return []
+
+        num_stops = len(self.stop_ids)
+        # Per stop, in decreasing departure order: the negated departures (for
+        # bisection), the arrivals at the target, and the leg taken from there as
+        # (enter connection, exit connection, continuation index in the exit
+        # stop's profile, or -1 at the target).
+        profile_deps: List[List[int]] = [[] for _ in range(num_stops)]
+        profile_arrs: List[List[int]] = [[] for _ in range(num_stops)]
+        profile_legs: List[List[Tuple[int, int, int]]] = [[] for _ in range(num_stops)]
+        trip_arrival: Dict[int, Tuple[int, int, int]] = {}  # trip -> (arrival, exit connection, continuation)
+        # The options departing from the source within the window, latest departure first.
+        options: List[Tuple[int, int, Tuple[int, int, int]]] = []
+
+        start = int(np.searchsorted(self.dep_time, window_start_s, side='left'))
+        for chunk_end in range(self.num_connections, start, -SCAN_CHUNK_SIZE):
+            chunk_start = max(chunk_end - SCAN_CHUNK_SIZE, start)
+            dep_times = self.dep_time[chunk_start:chunk_end].tolist()
+            arr_times = self.arr_time[chunk_start:chunk_end].tolist()
+            dep_stops = self.dep_stop[chunk_start:chunk_end].tolist()
+            arr_stops = self.arr_stop[chunk_start:chunk_end].tolist()
+            trips = self.trip[chunk_start:chunk_end].tolist()
+
+            for offset in range(chunk_end - chunk_start - 1, -1, -1):
+                trip = trips[offset]
+                arr_stop, arr_time = arr_stops[offset], arr_times[offset]
+                arrival, exit_, continuation = trip_arrival.get(trip, (UNREACHED_ARRIVAL, -1, -1))
+                if arr_stop == target:
+                    if arr_time < arrival:
+                        arrival, exit_, continuation = arr_time, chunk_start + offset, -1
+                else:
+                    # The earliest departure from the arrival stop at or after arriving there.
+                    reachable = bisect.bisect_right(profile_deps[arr_stop], -arr_time)
+                    if reachable and profile_arrs[arr_stop][reachable - 1] < arrival:
+                        arrival = profile_arrs[arr_stop][reachable - 1]
+                        exit_, continuation = chunk_start + offset, reachable - 1
+                if arrival == UNREACHED_ARRIVAL:
+                    continue
+                trip_arrival[trip] = (arrival, exit_, continuation)
+
+                dep_stop = dep_stops[offset]
+                if dep_stop == target:
+                    continue
+                leg = (chunk_start + offset, exit_, continuation)
+                if not profile_arrs[dep_stop] or arrival < profile_arrs[dep_stop][-1]:
+                    profile_deps[dep_stop].append(-dep_times[offset])
+                    profile_arrs[dep_stop].append(arrival)
+                    profile_legs[dep_stop].append(leg)
+                # The options only compete with departures within the window.
+                if dep_stop == source and dep_times[offset] <= window_end_s:
+                    if options and options[-1][0] == dep_times[offset] and arrival < options[-1][1]:
+                        options.pop()
+                    if not options or arrival < options[-1][1]:
+                        options.append((dep_times[offset], arrival, leg))
+
+        journeys: List[Tuple[int, int, List[CSALeg]]] = []
+        for departure_s, arrival_s, (enter, exit_, continuation) in reversed(options):
+            legs = [(enter, exit_)]
+            stop = int(self.arr_stop[exit_])
+            while continuation >= 0:
+                enter, exit_, continuation = profile_legs[stop][continuation]
+                legs.append((enter, exit_))
+                stop = int(self.arr_stop[exit_])
+            journeys.append((departure_s, arrival_s, legs))
+        return journeys
+
+    def leg_details(self, leg: CSALeg) -> dict:
+        """Returns the plain fields describing a leg, ready for a TransitLeg model."""
+        enter, exit_ = leg
+        trip = int(self.trip[enter])
+        return {
+            'route_type': int(self.trip_route_types[trip]),
+            'route_short_name': str(self.trip_route_short_names[trip]),
+            'trip_headsign': str(self.trip_headsigns[trip]),
+            'start_stop_name': str(self.stop_names[int(self.dep_stop[enter])]),
+            'end_stop_name': str(self.stop_names[int(self.arr_stop[exit_])]),
+            'departure_time': seconds_to_hhmm(int(self.dep_time[enter])),
+            'arrival_time': seconds_to_hhmm(int(self.arr_time[exit_])),
+            'departure_s': int(self.dep_time[enter]),
+            'arrival_s': int(self.arr_time[exit_]),
+            'num_stops': int(self.arr_seq[exit_] - self.dep_seq[enter]),
+        }
+
+def _pair_consecutive_stops(trip_idx: np.ndarray, stop_idx: np.ndarray, sequence: np.ndarray,
+                            arrivals: np.ndarray, departures: np.ndarray) -> Tuple[np.ndarray, ...]:
+    """
+    Turns stop_times rows sorted by (trip, sequence) into connection columns.
+
+    Each pair of consecutive rows belonging to the same trip becomes one
+    connection from the first stop (departure time) to the second (arrival time).
+    """
+    same_trip = trip_idx[:-1] == trip_idx[1:]
+    return (
+        stop_idx[:-1][same_trip],
+        stop_idx[1:][same_trip],
+        departures[:-1][same_trip],
+        arrivals[1:][same_trip],
+        trip_idx[:-1][same_trip],
+        sequence[:-1][same_trip],
+        sequence[1:][same_trip],
+    )
@@ -0,0 +1,331 @@
+"""
+Offline validation and pre-indexing of a GTFS feed.
+
+Run this between downloading a new feed (see `data/gtfs/README.md`) and
+serving it:
+
+    python -m src.tools.gtfs_compiler data/gtfs --out data/gtfs/compiled
+
+It
+- checks that all required files are present,
+- checks referential integrity (stop_times -> trips -> routes, trips -> shapes,
+  trips -> calendar/calendar_dates) and the calendar's coverage,
+- checks and normalizes stop times, including GTFS times past 24:00, into
+  seconds since the start of the service day,
+- and, if no errors were found, writes the compact timetable snapshot (the CSA
+  connection arrays and indexes plus the stop table) in the shared timetable
+  layout of `shared_timetable`.
+stop_times.txt, by far the largest file, is streamed once: its checks run on
+the chunks the connection ingest reads (see `compile_feed`).
+
+A planner then attaches to the snapshot instead of parsing the CSV files at
+startup: `TransitPlanner.attach("data/gtfs/compiled")`, or set
+`TRANSIT_SHARED_DIR`. A JSON report of all findings is written next to it.
+"""
+
+import argparse
+import json
+import os
+import sys
+from datetime import date, datetime
+from typing import List, Optional, Set, Tuple
+
+import pandas as pd
+
+from src.tools.connection_scan import STREAM_CHUNK_ROWS, ConnectionScanEngine, times_to_seconds
+from src.tools.shared_timetable import publish_timetable
+from src.tools.transit_planner import feed_signature
+
+# --- Constants and Configuration ---
+
+REQUIRED_COLUMNS = {
+    'stops.txt': ('stop_id', 'stop_name', 'stop_lat', 'stop_lon'),
+    'routes.txt': ('route_id', 'route_short_name', 'route_type'),
+    'trips.txt': ('route_id', 'service_id', 'trip_id'),
+    'stop_times.txt': ('trip_id', 'arrival_time', 'departure_time', 'stop_id', 'stop_sequence'),
+}
+
+REPORT_FILE = "validation_report.json"
+
+# Warn when the calendar ends within this many days of the compile date.
+EXPIRY_WARNING_DAYS = 14
+
+# Times are "H:MM:SS" or "HH:MM:SS", with hours allowed past 24.
+_TIME_PATTERN = r'^\s*\d{1,3}:\d{2}:\d{2}\s*$'
+
+# --- Validation Report ---
+
+class FeedReport:
+    """Findings of a feed validation: errors block compilation, warnings do not."""
+
+    def __init__(self, gtfs_dir: str):
+        self.gtfs_dir = gtfs_dir
+        self.errors: List[str] = []
+        self.warnings: List[str] = []
+        self.stats = {}
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def error(self, message: str):
+        self.errors.append(message)
+
+    def warn(self, message: str):
+        self.warnings.append(message)
+
+    def to_dict(self) -> dict:
+        return {
+            'gtfs_dir': os.path.abspath(self.gtfs_dir),
+            'checked_at': datetime.now().isoformat(),
+            'ok': self.ok,
+            'errors': self.errors,
+            'warnings': self.warnings,
+            'stats': self.stats,
+        }
+
+def _describe(ids: Set[str], limit: int = 5) -> str:
+    """Formats a set of offending ids for a report line."""
+    shown = ", ".join(sorted(ids)[:limit])
+    return f"{shown}, ..." if len(ids) > limit else shown
+
+# --- Checks ---
+
+def _read(gtfs_dir: str, filename: str, **kwargs) -> Optional[pd.DataFrame]:
+    """Reads a GTFS file with every column as a string, or None if it is absent."""
+    path = os.path.join(gtfs_dir, filename)
+    if not os.path.exists(path):
+        return None
+    return pd.read_csv(path, dtype=str, keep_default_na=False, **kwargs)
+
+def _check_calendar(gtfs_dir: str, trips_df: pd.DataFrame, report: FeedReport, today: date):
+    """Checks that every trip's service is defined and that the calendar covers today."""
+    calendar_df = _read(gtfs_dir, 'calendar.txt')
+    calendar_dates_df = _read(gtfs_dir, 'calendar_dates.txt')
+    if calendar_df is None and calendar_dates_df is None:
+        report.error("Missing calendar: neither calendar.txt nor calendar_dates.txt is present.")
+        return
+
+    services = set()
+    dates = []
+    if calendar_df is not None:
+        services |= set(calendar_df['service_id'])
+        dates += calendar_df['start_date'].tolist() + calendar_df['end_date'].tolist()
+    if calendar_dates_df is not None:
+        services |= set(calendar_dates_df['service_id'])
+        dates += calendar_dates_df.loc[calendar_dates_df['exception_type'] == '1', 'date'].tolist()
+
+    unknown_services = set(trips_df['service_id']) - services
+    if unknown_services:
+        report.error(f"{len(unknown_services)} service_ids in trips.txt have no calendar entry: "
+                     f"{_describe(unknown_services)}")
+
+    try:
+        parsed = [datetime.strptime(value, '%Y%m%d').date() for value in dates if value]
+    except ValueError as e:
+        report.error(f"Invalid calendar date: {e}")
+        return
+    if not parsed:
+        report.error("The calendar defines no service dates.")
+        return
+
+    start, end = min(parsed), max(parsed)
+    report.stats['service_start'] = start.isoformat()
+    report.stats['service_end'] = end.isoformat()
+    if end < today:
+        report.error(f"The feed expired on {end.isoformat()}.")
+    elif (end - today).days < EXPIRY_WARNING_DAYS:
+        report.warn(f"The feed expires soon, on {end.isoformat()}.")
+    if start > today:
+        report.warn(f"The feed only starts on {start.isoformat()}.")
+
+class _StopTimesCheck:
+    """Checks the references and times of stop_times.txt, one chunk at a time."""
+
+    def __init__(self, trip_ids: Set[str], stop_ids: Set[str]):
+        self.trip_ids = trip_ids
+        self.stop_ids = stop_ids
+        self.unknown_trips: Set[str] = set()
+        self.unknown_stops: Set[str] = set()
+        self.rows = self.missing_times = self.malformed_times = self.bad_sequences = 0
+        self.past_midnight = self.departs_before_arrival = 0
+
+    def __call__(self, chunk: pd.DataFrame):
+        """Checks a chunk read with every column as a string."""
+        self.rows += len(chunk)
+        self.unknown_trips.update(set(chunk['trip_id']) - self.trip_ids)
+        self.unknown_stops.update(set(chunk['stop_id']) - self.stop_ids)
+        self.bad_sequences += int(pd.to_numeric(chunk['stop_sequence'], errors='coerce').isna().sum())
+
+        arrival, departure = chunk['arrival_time'], chunk['departure_time']
+        blank = (arrival.str.strip() == '') | (departure.str.strip() == '')
+        self.missing_times += int(blank.sum())
+        well_formed = arrival.str.match(_TIME_PATTERN) & departure.str.match(_TIME_PATTERN)
+        self.malformed_times += int((~well_formed & ~blank).sum())
+
+        arrival_s = times_to_seconds(arrival[well_formed])
+        departure_s = times_to_seconds(departure[well_formed])
+        self.past_midnight += int((departure_s >= 24 * 3600).sum())
+        self.departs_before_arrival += int((departure_s < arrival_s).sum())
+
+    def report_to(self, report: FeedReport):
+        """Adds the findings over all chunks checked to a report."""
+        report.stats['stop_times'] = self.rows
+        report.stats['stop_times_past_midnight'] = self.past_midnight
+        if self.unknown_trips:
+            report.error(f"{len(self.unknown_trips)} trip_ids in stop_times.txt are missing from trips.txt: "
+                         f"{_describe(self.unknown_trips)}")
+        if self.unknown_stops:
+            report.error(f"{len(self.unknown_stops)} stop_ids in stop_times.txt are missing from stops.txt: "
+                         f"{_describe(self.unknown_stops)}")
+        if self.bad_sequences:
+            report.error(f"{self.bad_sequences} stop_times rows have a non-numeric stop_sequence.")
+        if self.malformed_times:
+            report.error(f"{self.malformed_times} stop_times rows have malformed times (expected HH:MM:SS).")
+        if self.departs_before_arrival:
+            report.error(f"{self.departs_before_arrival} stop_times rows depart before they arrive.")
+        if self.missing_times:
+            report.warn(f"{self.missing_times} stop_times rows have no times and are skipped by the planner.")
+
+def _check_connections(engine: ConnectionScanEngine, trips_df: pd.DataFrame, report: FeedReport):
+    """Checks the normalized connections: time order along trips and trips without service."""
+    backwards = int((engine.arr_time < engine.dep_time).sum())
+    if backwards:
+        report.error(f"{backwards} consecutive stop_times go back in time.")
+
+    served = set(engine.trip.tolist())
+    unserved = len(trips_df) - len(served)
+    if unserved:
+        report.warn(f"{unserved} trips have fewer than two stop_times and are never used.")
+    report.stats['connections'] = engine.num_connections
+
+def _validate_tables(gtfs_dir: str, today: date) -> Tuple[FeedReport, Optional[_StopTimesCheck]]:
+    """
+    Runs every check except those of stop_times.txt.
+
+    Returns:
+        The report so far and the check to run over the stop_times chunks, or
+        None if the feed is already unusable.
+    """
+    report = FeedReport(gtfs_dir)
+
+    missing = [name for name in REQUIRED_COLUMNS if not os.path.exists(os.path.join(gtfs_dir, name))]
+    if missing:
+        report.error(f"Missing required files: {', '.join(missing)}")
+        return report, None
+    for filename, columns in REQUIRED_COLUMNS.items():
+        header = pd.read_csv(os.path.join(gtfs_dir, filename), nrows=0).columns
+        missing_columns = [column for column in columns if column not in header]
+        if missing_columns:
+            report.error(f"{filename} is missing required columns: {', '.join(missing_columns)}")
+    if not report.ok:
+        return report, None
+
+    stops_df = _read(gtfs_dir, 'stops.txt')
+    routes_df = _read(gtfs_dir, 'routes.txt')
+    trips_df = _read(gtfs_dir, 'trips.txt')
+    report.stats.update(stops=len(stops_df), routes=len(routes_df), trips=len(trips_df))
+
+    unknown_routes = set(trips_df['route_id']) - set(routes_df['route_id'])
+    if unknown_routes:
+        report.error(f"{len(unknown_routes)} route_ids in trips.txt are missing from routes.txt: "
+                     f"{_describe(unknown_routes)}")
+
+    coordinates = pd.to_numeric(stops_df['stop_lat'], errors='coerce'), pd.to_numeric(stops_df['stop_lon'], errors='coerce')
+    if coordinates[0].isna().any() or coordinates[1].isna().any():
+        report.error("Some stops in stops.txt have no valid coordinates.")
+
+    shapes_df = _read(gtfs_dir, 'shapes.txt', usecols=['shape_id'])
+    if 'shape_id' in trips_df.columns:
+        referenced = set(trips_df['shape_id']) - {''}
+        known = set(shapes_df['shape_id']) if shapes_df is not None else set()
+        unknown_shapes = referenced - known
+        if unknown_shapes:
+            report.warn(f"{len(unknown_shapes)} shape_ids in trips.txt are missing from shapes.txt: "
+                        f"{_describe(unknown_shapes)}")
+
+    _check_calendar(gtfs_dir, trips_df, report, today)
+    return report, _StopTimesCheck(set(trips_df['trip_id']), set(stops_df['stop_id']))
+
+def validate_feed(gtfs_dir: str, today: Optional[date] = None,
+                  chunk_rows: int = STREAM_CHUNK_ROWS) -> FeedReport:
+    """
+    Validates a GTFS directory without building anything.
+
+    Args:
+        gtfs_dir: Directory with the GTFS .txt files.
+        today: The reference date for calendar coverage. Defaults to today.
+        chunk_rows: Rows of stop_times.txt read per chunk.
+
+    Returns:
+        A FeedReport with all errors and warnings found.
+    """
+    report, check_stop_times = _validate_tables(gtfs_dir, today or date.today())
+    if check_stop_times is not None:
+        reader = pd.read_csv(os.path.join(gtfs_dir, 'stop_times.txt'), dtype=str, keep_default_na=False,
+                             chunksize=chunk_rows, usecols=list(REQUIRED_COLUMNS['stop_times.txt']))
+        for chunk in reader:
+            check_stop_times(chunk)
+        check_stop_times.report_to(report)
+    return report
+
+# --- Compilation ---
+
+def compile_feed(gtfs_dir: str, out_dir: str, today: Optional[date] = None,
+                 chunk_rows: int = STREAM_CHUNK_ROWS) -> FeedReport:
+    """
+    Validates a GTFS directory and, if it is valid, writes its compiled snapshot.
+
+    The stop_times checks run on the chunks the connection ingest reads, so
+    the file is streamed once; the snapshot is only published if no check
+    (including those of the ingested connections) found an error.
+
+    Args:
+        gtfs_dir: Directory with the GTFS .txt files.
+        out_dir: Directory for the snapshot and the validation report.
+        today: The reference date for calendar coverage. Defaults to today.
+        chunk_rows: Rows of stop_times.txt read per chunk.
+
+    Returns:
+        The FeedReport; `report.stats['snapshot']` names the published snapshot.
+    """
+    report, check_stop_times = _validate_tables(gtfs_dir, today or date.today())
+    if check_stop_times is not None:
+        stops_df = pd.read_csv(os.path.join(gtfs_dir, 'stops.txt'), dtype={'stop_id': str})
+        trips_df = pd.read_csv(os.path.join(gtfs_dir, 'trips.txt'), dtype={'route_id': str, 'trip_id': str, 'service_id': str})
+        routes_df = pd.read_csv(os.path.join(gtfs_dir, 'routes.txt'), dtype={'route_id': str})
+        engine = ConnectionScanEngine.from_stop_times_csv(
+            os.path.join(gtfs_dir, 'stop_times.txt'), trips_df, routes_df, stops_df, chunk_rows,
+            on_chunk=check_stop_times)
+        check_stop_times.report_to(report)
+        _check_connections(engine, trips_df, report)
+        if report.ok:
+            report.stats['snapshot'] = publish_timetable(out_dir, engine, stops_df, feed_signature(gtfs_dir))
+
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, REPORT_FILE), 'w') as f:
+        json.dump(report.to_dict(), f, indent=2)
+    return report
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Validate a GTFS feed and compile its timetable snapshot.")
+    parser.add_argument('gtfs_dir', help="Directory with the GTFS .txt files.")
+    parser.add_argument('--out', help="Output directory for the snapshot and report. "
+                                      "Without it, the feed is only validated.")
+    args = parser.parse_args(argv)
+
+    if args.out:
+        report = compile_feed(args.gtfs_dir, args.out)
+    else:
+        report = validate_feed(args.gtfs_dir)
+
+    for message in report.errors:
+        print(f"ERROR: {message}")
+    for message in report.warnings:
+        print(f"WARNING: {message}")
+    print(f"{'Feed is valid' if report.ok else 'Feed is invalid'}: "
+          + ", ".join(f"{key}={value}" for key, value in report.stats.items()))
+    return 0 if report.ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,310 @@
+"""
+Precompiled binary catalog of the curated POI dataset.
+
+Loading the POIs from `data/pois/poi-*.json` means parsing every file and
+validating every POI with Pydantic at each startup. The catalog moves that
+work to a build step:
+
+    python -m src.tools.poi_catalog            # writes data/pois/poi-catalog.bin
+
+The POIs are validated once and written to a single binary file:
+
+    magic (8 bytes) | header length (uint32) | JSON header | sections...
+
+The header records the record encoding, the source files' sizes and mtimes
+(to detect a stale catalog), the range of POIs and content hash of each source
+file (for incremental reloads) and the offset, dtype and shape of each section:
+- `latitude`, `longitude`: float64 columns for spatial queries,
+- `category`: uint8 codes into POI_CATEGORIES,
+- `poi_id`: fixed-width unicode column for id lookups,
+- `hours`, `hours_known`, `poi_type`, `cost`, `duration`: the compiled
+  practical-info columns of `poi_filters`,
+- `offsets`, `records`: one serialized record per POI (msgpack if installed,
+  JSON otherwise) and the int64 table of their byte offsets.
+
+At runtime the file is memory-mapped once. The columns are used directly, and
+a POI record is only decoded when it is accessed.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+from collections.abc import Sequence as SequenceABC
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from src.core.models import POI, POICategory
+from src.core.structs import construct_poi
+from src.tools.poi_filters import POIAttributes
+
+try:
+    import msgpack
+except ImportError:  # Optional dependency: fall back to JSON records.
+    msgpack = None
+
+# --- Constants and Configuration ---
+
+CATALOG_FILENAME = "poi-catalog.bin"
+CATALOG_MAGIC = b"POICAT02"
+
+# Category codes stored in the `category` column.
+POI_CATEGORIES = [category.value for category in POICategory]
+
+# Sections start at multiples of this many bytes so NumPy views are aligned.
+_ALIGNMENT = 8
+
+# --- Record Encoding ---
+
+def _encode(record: dict, encoding: str) -> bytes:
+    if encoding == "msgpack":
+        return msgpack.packb(record, use_bin_type=True)
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def _decode(data: bytes, encoding: str) -> dict:
+    if encoding == "msgpack":
+        return msgpack.unpackb(data, raw=False)
+    return json.loads(data.decode('utf-8'))
+
+def _default_encoding() -> str:
+    return "msgpack" if msgpack is not None else "json"
+
+# --- Source Files ---
+
+def source_files(pois_dir: str) -> List[str]:
+    """The POI source files of a data directory, in load order."""
+    return sorted(name for name in os.listdir(pois_dir) if name.startswith('poi-') and name.endswith('.json'))
+
+def content_digest(content: bytes) -> str:
+    """The content hash used to tell real edits from touched files."""
+    return hashlib.sha256(content).hexdigest()
+
+def source_signature(pois_dir: str) -> Dict[str, List[int]]:
+    """Fingerprints the POI source files by [size, mtime_ns]."""
+    signature = {}
+    for name in source_files(pois_dir):
+        stat = os.stat(os.path.join(pois_dir, name))
+        signature[name] = [stat.st_size, stat.st_mtime_ns]
+    return signature
+
+# --- Building ---
+
+def write_catalog(path: str, pois: Sequence[POI], signature: Optional[Dict[str, List[int]]] = None,
+                  encoding: Optional[str] = None, files: Optional[Dict[str, dict]] = None):
+    """
+    Writes already validated POIs to a catalog file.
+
+    Args:
+        path: The catalog file to write.
+        pois: The POIs, in the order they should be served.
+        signature: The `source_signature` of the files the POIs came from.
+        encoding: "msgpack" or "json". Defaults to msgpack when installed.
+        files: Per source file, its POI range ("start", "stop") and "sha256".
+    """
+    encoding = encoding or _default_encoding()
+    records = [_encode(poi.dict(), encoding) for poi in pois]
+    offsets = np.zeros(len(records) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(record) for record in records])
+    attributes = POIAttributes.from_pois(pois)
+
+    sections = {
+        'latitude': np.array([poi.coordinates.latitude for poi in pois], dtype=np.float64),
+        'longitude': np.array([poi.coordinates.longitude for poi in pois], dtype=np.float64),
+        'category': np.array([POI_CATEGORIES.index(POICategory(poi.category).value) for poi in pois], dtype=np.uint8),
+        'poi_id': np.array([poi.poi_id for poi in pois], dtype=str) if pois else np.zeros(0, dtype='<U1'),
+        'hours': attributes.hours,
+        'hours_known': attributes.hours_known,
+        'poi_type': attributes.poi_type,
+        'cost': attributes.cost,
+        'duration': attributes.duration,
+        'offsets': offsets,
+        'records': np.frombuffer(b''.join(records), dtype=np.uint8),
+    }
+
+    # Lay out the sections after the header, each aligned.
+    layout, position = {}, 0
+    for name, array in sections.items():
+        layout[name] = {'offset': position, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+        position += -(-array.nbytes // _ALIGNMENT) * _ALIGNMENT
+    header = json.dumps({
+        'count': len(pois),
+        'encoding': encoding,
+        'categories': POI_CATEGORIES,
+        'signature': signature or {},
+        'files': files or {},
+        'sections': layout,
+    }).encode('utf-8')
+    prefix = len(CATALOG_MAGIC) + 4 + len(header)
+    data_start = -(-prefix // _ALIGNMENT) * _ALIGNMENT
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # Write under a temporary name first so readers never map a partial file.
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(CATALOG_MAGIC)
+        f.write(np.uint32(len(header)).tobytes())
+        f.write(header)
+        for name, array in sections.items():
+            f.seek(data_start + layout[name]['offset'])
+            f.write(array.tobytes())
+        f.truncate(data_start + position)
+    os.replace(tmp_path, path)
+
+def build_catalog(pois_dir: str, path: Optional[str] = None, encoding: Optional[str] = None) -> int:
+    """
+    Loads and validates the POI source files and writes their catalog.
+
+    Returns:
+        The number of POIs written.
+    """
+    # Imported here: the retriever itself imports this module to read catalogs.
+    from src.tools.poi_retriever import load_poi_file
+
+    signature = source_signature(pois_dir)
+    pois, files = [], {}
+    for name in signature:
+        file_path = os.path.join(pois_dir, name)
+        with open(file_path, 'rb') as f:
+            content = f.read()
+        start = len(pois)
+        pois.extend(load_poi_file(file_path, content))
+        files[name] = {'start': start, 'stop': len(pois), 'sha256': content_digest(content)}
+    path = path or os.path.join(pois_dir, CATALOG_FILENAME)
+    write_catalog(path, pois, signature, encoding, files)
+    print(f"Wrote catalog of {len(pois)} POIs to {path}.")
+    return len(pois)
+
+# --- Reading ---
+
+class POICatalog:
+    """A memory-mapped POI catalog."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._data = np.memmap(path, dtype=np.uint8, mode='r')
+        if bytes(self._data[:len(CATALOG_MAGIC)]) != CATALOG_MAGIC:
+            raise ValueError(f"{path} is not a POI catalog.")
+        header_length = int(np.frombuffer(self._data[len(CATALOG_MAGIC):len(CATALOG_MAGIC) + 4], dtype=np.uint32)[0])
+        header_start = len(CATALOG_MAGIC) + 4
+        header = json.loads(bytes(self._data[header_start:header_start + header_length]).decode('utf-8'))
+        if header['categories'] != POI_CATEGORIES:
+            raise ValueError(f"{path} was built with different POI categories.")
+        if header['encoding'] == "msgpack" and msgpack is None:
+            raise ValueError(f"{path} needs the msgpack package to be read.")
+
+        self.count: int = header['count']
+        self.encoding: str = header['encoding']
+        self.signature: Dict[str, List[int]] = header['signature']
+        self.files: Dict[str, dict] = header.get('files', {})
+        # Decoded POIs by index, shared by every LazyPOIList over this catalog.
+        self.decoded: Dict[int, POI] = {}
+        data_start = -(-(header_start + header_length) // _ALIGNMENT) * _ALIGNMENT
+        self._sections = {}
+        for name, spec in header['sections'].items():
+            dtype = np.dtype(spec['dtype'])
+            count = int(np.prod(spec['shape'])) if spec['shape'] else 1
+            start = data_start + spec['offset']
+            self._sections[name] = self._data[start:start + count * dtype.itemsize].view(dtype).reshape(spec['shape'])
+
+    @property
+    def latitudes(self) -> np.ndarray:
+        return self._sections['latitude']
+
+    @property
+    def longitudes(self) -> np.ndarray:
+        return self._sections['longitude']
+
+    @property
+    def category_codes(self) -> np.ndarray:
+        return self._sections['category']
+
+    @property
+    def poi_ids(self) -> np.ndarray:
+        return self._sections['poi_id']
+
+    def attributes(self, start: int = 0, stop: Optional[int] = None) -> POIAttributes:
+        """The compiled filter columns of the POIs in [start, stop)."""
+        return POIAttributes(*(self._sections[name][start:stop]
+                               for name in ('hours', 'hours_known', 'poi_type', 'cost', 'duration')))
+
+    def record(self, index: int) -> dict:
+        """Decodes the raw record of the POI at `index`."""
+        offsets = self._sections['offsets']
+        start, end = int(offsets[index]), int(offsets[index + 1])
+        return _decode(self._sections['records'][start:end].tobytes(), self.encoding)
+
+    def is_current(self, pois_dir: str) -> bool:
+        """Whether the catalog was built from the current state of `pois_dir`."""
+        return self.signature == source_signature(pois_dir) and set(self.files) == set(self.signature)
+
+class LazyPOIList(SequenceABC):
+    """
+    A read-only list of the catalog's POIs that decodes each POI on first access.
+
+    `start` and `stop` restrict the list to a range of the catalog, e.g. the
+    POIs of one source file.
+    """
+
+    def __init__(self, catalog: POICatalog, start: int = 0, stop: Optional[int] = None):
+        self._catalog = catalog
+        self._start = start
+        self._stop = catalog.count if stop is None else stop
+        self._decoded = catalog.decoded
+
+    def __len__(self) -> int:
+        return self._stop - self._start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("POI index out of range")
+        index += self._start
+        poi = self._decoded.get(index)
+        if poi is None:
+            # Records were validated when the catalog was built.
+            poi = construct_poi(self._catalog.record(index))
+            self._decoded[index] = poi
+        return poi
+
+    def __iter__(self) -> Iterator[POI]:
+        for index in range(len(self)):
+            yield self[index]
+
+def open_catalog(pois_dir: str, path: Optional[str] = None) -> Optional[POICatalog]:
+    """
+    Opens the catalog of a POI directory if it exists and is up to date.
+
+    Returns:
+        The POICatalog, or None if there is no usable, current catalog.
+    """
+    path = path or os.path.join(pois_dir, CATALOG_FILENAME)
+    if not os.path.exists(path):
+        return None
+    try:
+        catalog = POICatalog(path)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Warning: Ignoring unreadable POI catalog {path}: {e}")
+        return None
+    if not catalog.is_current(pois_dir):
+        print(f"Warning: POI catalog {path} is stale; loading the JSON files instead.")
+        return None
+    return catalog
+
+def main():
+    from src.tools.poi_retriever import DATA_DIR
+
+    parser = argparse.ArgumentParser(description="Build the binary POI catalog.")
+    parser.add_argument('--pois-dir', default=DATA_DIR, help="Directory with the poi-*.json files.")
+    parser.add_argument('--out', help="Catalog file. Defaults to poi-catalog.bin in the POI directory.")
+    parser.add_argument('--encoding', choices=("msgpack", "json"), help="Record encoding.")
+    args = parser.parse_args()
+    build_catalog(args.pois_dir, args.out, args.encoding)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""
+Structured, precompiled filters over the POIs' practical information.
+
+`PracticalInfo` describes each POI with free-text fields. Checking them per
+POI at query time means re-parsing the same strings for every request, so they
+are compiled once, when the POIs are loaded, into columns:
+- `hours`: one bitmap per POI covering the week in SLOT_MINUTES slots,
+  bit-packed (7 * 96 bits = 84 bytes). `hours_known` is False where the
+  operating hours are free text that cannot be parsed (e.g. "Varies by event").
+- `poi_type`: codes into POI_TYPES (Indoor/Outdoor).
+- `cost`: the price tier (0 = Free, 1 = €, ...) or UNKNOWN_COST.
+- `duration`: the estimated visit duration in minutes.
+
+A `POIFilter` such as "open on Saturday at 14:00 for 30 minutes, indoor,
+at most €, at most 30 minutes" then becomes a handful of vectorized
+comparisons and bitwise ANDs over these columns.
+
+Supported operating hours: "24/7" and rules like "Mo-Fr 09:00-17:00",
+"Tu-Sa 09:00-19:00, Su 09:00-17:00, Mo Closed", "Mo,We 10:00-12:00" or
+"Daily 08:00-12:00, 13:00-18:00"; a rule without days applies to every day.
+Later rules override the hours that earlier ones give the days they name,
+ranges ending past midnight continue into the next day (whatever rule the next
+day has), and parenthesized remarks are ignored.
+"""
+
+import re
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from pydantic import BaseModel, Field
+
+from src.core.models import POI, POIType
+
+# --- Constants and Configuration ---
+
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+SLOTS_PER_WEEK = 7 * SLOTS_PER_DAY
+
+WEEKDAYS = ["Mo", "Tu", "We", "Th", "Fr", "Sa", "Su"]
+POI_TYPES = [poi_type.value for poi_type in POIType]
+COST_TIERS = ["Free", "€", "€€", "€€€"]
+UNKNOWN_COST = 255
+
+# --- Parsing ---
+
+_DAY = r"(?:Mo|Tu|We|Th|Fr|Sa|Su)"
+_RANGE = r"\d{1,2}:\d{2}\s*-\s*\d{1,2}:\d{2}"
+_DAYS = rf"{_DAY}(?:\s*-\s*{_DAY})?"
+_RULE = re.compile(rf"(?:(?P<days>Daily|{_DAYS}(?:\s*,\s*{_DAYS})*)\s+)?(?P<hours>Closed|{_RANGE}(?:\s*,\s*{_RANGE})*)")
+_SEPARATORS = re.compile(r"^[\s,;]*$")
+_REMARK = re.compile(r"\([^)]*\)")
+_COST = re.compile(r"^(Free|€+)(?![\w€])")
+
+def _minutes(value: str) -> int:
+    hours, minutes = value.strip().split(':')
+    return int(hours) * 60 + int(minutes)
+
+def _days(spec: Optional[str]) -> List[int]:
+    if spec is None or spec == "Daily":
+        return list(range(7))
+    days = []
+    for day_range in spec.split(','):
+        bounds = [WEEKDAYS.index(day.strip()) for day in day_range.split('-')]
+        first, last = bounds[0], bounds[-1]
+        days += [(first + offset) % 7 for offset in range((last - first) % 7 + 1)]
+    return days
+
+def parse_operating_hours(text: str) -> Optional[np.ndarray]:
+    """
+    Parses an operating hours string into a weekly open/closed bitmap.
+
+    Args:
+        text: The `operating_hours` of a POI.
+
+    Returns:
+        A boolean array of SLOTS_PER_WEEK slots starting Monday 00:00 (a slot
+        is open if the POI is open at any point of it), or None if the text
+        does not follow a supported format.
+    """
+    text = _REMARK.sub(" ", text).strip()
+    if text == "24/7":
+        return np.ones(SLOTS_PER_WEEK, dtype=bool)
+
+    rules = list(_RULE.finditer(text))
+    if not rules or not _SEPARATORS.match(_RULE.sub(" ", text)):
+        return None
+    # A later rule for a day replaces the hours of the earlier ones starting on
+    # that day; the hours running past midnight into it are kept.
+    day_ranges: Dict[int, List[str]] = {}
+    for rule in rules:
+        ranges = [] if rule['hours'] == "Closed" else rule['hours'].split(',')
+        for day in _days(rule['days']):
+            day_ranges[day] = ranges
+
+    week = np.zeros(SLOTS_PER_WEEK, dtype=bool)
+    for day, ranges in day_ranges.items():
+        day_start = day * SLOTS_PER_DAY
+        for time_range in ranges:
+            start, end = (_minutes(value) for value in time_range.split('-'))
+            if start > 24 * 60 or end > 24 * 60:
+                return None
+            if end <= start:
+                end += 24 * 60  # Open past midnight.
+            slots = np.arange(start // SLOT_MINUTES, -(-end // SLOT_MINUTES)) + day_start
+            week[slots % SLOTS_PER_WEEK] = True
+    return week
+
+def parse_cost(text: str) -> int:
+    """The price tier of a `cost` string (an index into COST_TIERS), or UNKNOWN_COST."""
+    match = _COST.match(text.strip())
+    if match is None or match.group(1) not in COST_TIERS:
+        return UNKNOWN_COST
+    return COST_TIERS.index(match.group(1))
+
+def cost_tier(text: str) -> Optional[int]:
+    """The tier of a cost limit given as "Free", "€", "€€" or "€€€" (case-insensitive)."""
+    for tier, name in enumerate(COST_TIERS):
+        if name.lower() == text.strip().lower():
+            return tier
+    return None
+
+# --- Filters ---
+
+class POIFilter(BaseModel):
+    """
+    Structured constraints on the practical information of POIs.
+
+    Unset fields do not constrain. POIs whose operating hours or cost cannot
+    be parsed pass the respective constraint only if `include_unknown` is set.
+    """
+    category: Optional[str] = Field(None, description="POI category, case-insensitive, e.g. 'History'.")
+    poi_type: Optional[POIType] = Field(None, description="Indoor or Outdoor.")
+    max_cost: Optional[str] = Field(None, description="Most expensive tier allowed: Free, €, €€ or €€€.")
+    max_duration_minutes: Optional[int] = Field(None, description="Longest estimated visit allowed.")
+    open_weekday: Optional[int] = Field(None, ge=0, le=6, description="Day of the visit, 0 = Monday; defaults to today.")
+    open_time: Optional[str] = Field(None, description="Time of the visit in HH:MM format.")
+    stay_minutes: int = Field(0, ge=0, description="How long the POI must stay open after open_time.")
+    include_unknown: bool = Field(True, description="Keep POIs whose hours or cost are free text.")
+
+    def resolved(self) -> "POIFilter":
+        """The filter with the day of the visit fixed: today if unset and a visit time is given."""
+        if self.open_time is None or self.open_weekday is not None:
+            return self
+        return self.copy(update={'open_weekday': datetime.now().weekday()})
+
+class POIAttributes:
+    """The compiled filter columns of a sequence of POIs, in the same order."""
+
+    def __init__(self, hours: np.ndarray, hours_known: np.ndarray, poi_type: np.ndarray,
+                 cost: np.ndarray, duration: np.ndarray):
+        self.hours = hours
+        self.hours_known = hours_known
+        self.poi_type = poi_type
+        self.cost = cost
+        self.duration = duration
+
+    @classmethod
+    def from_pois(cls, pois: Sequence[POI]) -> "POIAttributes":
+        """Compiles the practical information of POIs into filter columns."""
+        count = len(pois)
+        week = np.zeros((count, SLOTS_PER_WEEK), dtype=bool)
+        hours_known = np.zeros(count, dtype=bool)
+        # Many POIs share the same hours text; parse each distinct one once.
+        parsed: Dict[str, Optional[np.ndarray]] = {}
+        for i, poi in enumerate(pois):
+            text = poi.practical_info.operating_hours
+            if text not in parsed:
+                parsed[text] = parse_operating_hours(text)
+            if parsed[text] is not None:
+                week[i] = parsed[text]
+                hours_known[i] = True
+        return cls(
+            hours=np.packbits(week, axis=1),
+            hours_known=hours_known,
+            poi_type=np.array([POI_TYPES.index(POIType(poi.practical_info.type).value) for poi in pois],
+                              dtype=np.uint8),
+            cost=np.array([parse_cost(poi.practical_info.cost) for poi in pois], dtype=np.uint8),
+            duration=np.array([poi.practical_info.estimated_duration_minutes for poi in pois], dtype=np.int32),
+        )
+
+    @classmethod
+    def concatenate(cls, parts: Sequence["POIAttributes"]) -> "POIAttributes":
+        """Joins the columns of several POI sequences in order."""
+        if not parts:
+            return cls.from_pois([])
+        return cls(*(np.concatenate([getattr(part, name) for part in parts])
+                     for name in ('hours', 'hours_known', 'poi_type', 'cost', 'duration')))
+
+    def __len__(self) -> int:
+        return len(self.duration)
+
+    def open_mask(self, weekday: int, time: str, stay_minutes: int = 0) -> np.ndarray:
+        """
+        Boolean mask of the POIs open at a time, for at least `stay_minutes`.
+
+        POIs with unknown hours are False.
+        """
+        start = weekday * 24 * 60 + _minutes(time)
+        first = start // SLOT_MINUTES
+        last = max(first + 1, -(-(start + stay_minutes) // SLOT_MINUTES))
+        mask = self.hours_known.copy()
+        for slot in np.arange(first, last) % SLOTS_PER_WEEK:
+            mask &= (self.hours[:, slot >> 3] >> (7 - (slot & 7))) & 1 == 1
+        return mask
+
+    def mask(self, poi_filter: POIFilter) -> np.ndarray:
+        """Boolean mask of the POIs passing every practical-info constraint of a filter."""
+        mask = np.ones(len(self), dtype=bool)
+        if poi_filter.poi_type is not None:
+            mask &= self.poi_type == POI_TYPES.index(POIType(poi_filter.poi_type).value)
+        if poi_filter.max_duration_minutes is not None:
+            mask &= self.duration <= poi_filter.max_duration_minutes
+        if poi_filter.max_cost is not None:
+            tier = cost_tier(poi_filter.max_cost)
+            if tier is None:
+                raise ValueError(f"Unknown cost tier '{poi_filter.max_cost}', expected one of {COST_TIERS}.")
+            affordable = self.cost <= tier
+            if poi_filter.include_unknown:
+                affordable |= self.cost == UNKNOWN_COST
+            mask &= affordable
+        if poi_filter.open_time is not None:
+            weekday = poi_filter.open_weekday if poi_filter.open_weekday is not None else datetime.now().weekday()
+            is_open = self.open_mask(weekday, poi_filter.open_time, poi_filter.stay_minutes)
+            if poi_filter.include_unknown:
+                is_open |= ~self.hours_known
+            mask &= is_open
+        return mask
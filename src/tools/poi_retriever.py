@@ -3,17 +3,42 @@ Tool for retrieving Points of Interest (POIs) from the curated local dataset.
 
 This module encapsulates all logic for loading, parsing, and querying the POI
 JSON files stored in the `/data/pois/` directory. It uses the Haversine formula
-for accurate distance calculation between geographical coordinates.
+for accurate distance calculation between geographical coordinates, via the
+shared kernels in `src.core.geo`.
+
+If an up-to-date binary catalog (see `poi_catalog`) exists next to the JSON
+files, it is memory-mapped instead and POIs are decoded only when accessed.
+
+The POI files are edited while the service runs. `POIRetriever.reload` checks
+each file's size and mtime, hashes the files whose stat changed, and re-parses
+only those whose content actually differs. The new index is assembled from the
+per-file parts and swapped in with a single reference assignment.
+
+`retrieve_nearby_pois` memoizes the candidate POIs of each grid cell in the
+retriever's `query_cache`, then measures and ranks them from the exact query
+point; a reload clears the cache. The JSON encoding of a result is cached per
+exact query (`retrieve_nearby_pois_as_json`, `retrieve_nearby_pois_batch_as_json`),
+so prompts and API responses reuse the bytes.
 """
 
 import os
 import json
-from math import radians, sin, cos, sqrt, atan2
-from typing import List, Dict, Optional
+import bisect
+import threading
+from collections.abc import Sequence as SequenceABC
+from typing import Hashable, Iterator, List, Dict, Optional, Sequence, Tuple, Union
+
+import numpy as np
 
 # We import our validated Pydantic model from the core module. This ensures that
 # any data returned by this tool conforms to our application's standard structure.
+from src.core.cache import QueryCache, cell_radius_km, snap_to_grid
+from src.core.geo import GeoPoints, bounding_box, coordinates_distance_km, in_bounding_box
 from src.core.models import POI, Coordinates
+from src.core.serialization import dumps, loads
+from src.core.structs import extend_model
+from src.tools.poi_catalog import POI_CATEGORIES, LazyPOIList, POICatalog, content_digest, open_catalog, source_files
+from src.tools.poi_filters import POIAttributes, POIFilter
 from pydantic import BaseModel, Field
 
 # --- Extended Models for Tool Results ---
@@ -30,6 +55,10 @@ class POIWithDistance(POI):
 # --- Constants and Configuration ---
 DATA_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'pois')
 
+# Query x POI distances computed at once by a batch query (8 MB of float64);
+# larger batches are processed in chunks of queries.
+BATCH_CHUNK_ELEMENTS = 1_000_000
+
 # --- Helper Functions ---
 
 def haversine_distance(coord1: Coordinates, coord2: Coordinates) -> float:
@@ -37,20 +66,155 @@ def haversine_distance(coord1: Coordinates, coord2: Coordinates) -> float:
     Calculate the distance in kilometers between two points on Earth
     (specified in decimal degrees) using the Haversine formula.
     """
-    # Earth radius in kilometers
-    R = 6371.0
+    return coordinates_distance_km(coord1, coord2)
+
+def _query_array(locations: Union[Sequence[Coordinates], np.ndarray]) -> np.ndarray:
+    """Search centers as an array of shape (n, 2) of latitude/longitude pairs."""
+    if isinstance(locations, np.ndarray):
+        return np.asarray(locations, dtype=np.float64).reshape(-1, 2)
+    return np.array([(location.latitude, location.longitude) for location in locations],
+                    dtype=np.float64).reshape(-1, 2)
+
+def load_poi_file(file_path: str, content: Optional[bytes] = None) -> List[POI]:
+    """
+    Loads and validates the POIs of a single JSON file.
+
+    Invalid POIs are skipped with a warning; an unreadable file yields no POIs.
+
+    Args:
+        file_path: The POI file.
+        content: The file's raw content, if it has already been read.
+    """
+    filename = os.path.basename(file_path)
+    pois = []
+    try:
+        if content is None:
+            with open(file_path, 'rb') as f:
+                content = f.read()
+        data = json.loads(content.decode('utf-8'))
+
+        # Extract POIs from the 'pois' array in each file
+        if 'pois' in data and isinstance(data['pois'], list):
+            for poi_data in data['pois']:
+                try:
+                    # Convert to our Pydantic model for validation
+                    pois.append(POI(**poi_data))
+                except Exception as e:
+                    print(f"Warning: Failed to parse POI in {filename}: {e}")
+                    continue
+                    
+    except Exception as e:
+        print(f"Warning: Failed to load POI file {filename}: {e}")
+    return pois
+
+# --- Per-File Index Parts ---
+
+class POIFile:
+    """
+    The POIs loaded from one source file, with the columns the queries use.
+
+    `stat_key` is the (size, mtime_ns) the file had when it was read and
+    `digest` the hash of its content; together they decide whether a reload
+    has to parse the file again.
+    """
+
+    def __init__(self, name: str, stat_key: Tuple[int, int], digest: str, pois: Sequence[POI],
+                 points: Optional[GeoPoints] = None, category_codes: Optional[np.ndarray] = None,
+                 poi_ids: Optional[List[str]] = None, attributes: Optional[POIAttributes] = None):
+        self.name = name
+        self.stat_key = stat_key
+        self.digest = digest
+        self.pois = pois
+        self.points = points if points is not None else GeoPoints.from_coordinates(poi.coordinates for poi in pois)
+        if category_codes is None:
+            category_codes = np.array([POI_CATEGORIES.index(poi.category.value) for poi in pois], dtype=np.uint8)
+        self.category_codes = category_codes
+        # Compiled practical info (opening hours, type, cost, duration) for filtering.
+        self.attributes = attributes if attributes is not None else POIAttributes.from_pois(pois)
+        poi_ids = poi_ids if poi_ids is not None else [poi.poi_id for poi in pois]
+        self.id_index: Dict[str, int] = {poi_id: i for i, poi_id in enumerate(poi_ids)}
+
+    @classmethod
+    def load(cls, file_path: str) -> "POIFile":
+        """Reads, hashes and parses one POI file."""
+        stat = os.stat(file_path)
+        with open(file_path, 'rb') as f:
+            content = f.read()
+        return cls(os.path.basename(file_path), (stat.st_size, stat.st_mtime_ns), content_digest(content),
+                   load_poi_file(file_path, content))
+
+    @classmethod
+    def from_catalog(cls, catalog: POICatalog, name: str) -> "POIFile":
+        """The part of a catalog that came from one source file; nothing is decoded."""
+        entry = catalog.files[name]
+        start, stop = entry['start'], entry['stop']
+        return cls(name, tuple(catalog.signature[name]), entry['sha256'], LazyPOIList(catalog, start, stop),
+                   GeoPoints(catalog.latitudes[start:stop], catalog.longitudes[start:stop]),
+                   catalog.category_codes[start:stop], catalog.poi_ids[start:stop].tolist(),
+                   catalog.attributes(start, stop))
 
-    lat1, lon1 = radians(coord1.latitude), radians(coord1.longitude)
-    lat2, lon2 = radians(coord2.latitude), radians(coord2.longitude)
+class _ChainedPOIs(SequenceABC):
+    """A read-only list over the POI lists of several files, without copying them."""
 
-    dlon = lon2 - lon1
-    dlat = lat2 - lat1
+    def __init__(self, parts: List[Sequence[POI]]):
+        self._parts = parts
+        self._starts = []
+        total = 0
+        for part in parts:
+            self._starts.append(total)
+            total += len(part)
+        self._length = total
 
-    a = sin(dlat / 2)**2 + cos(lat1) * cos(lat2) * sin(dlon / 2)**2
-    c = 2 * atan2(sqrt(a), sqrt(1 - a))
+    def __len__(self) -> int:
+        return self._length
 
-    distance = R * c
-    return distance
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("POI index out of range")
+        part = bisect.bisect_right(self._starts, index) - 1
+        return self._parts[part][index - self._starts[part]]
+
+    def __iter__(self) -> Iterator[POI]:
+        for part in self._parts:
+            yield from part
+
+class POIIndex:
+    """
+    An immutable view of the whole dataset, assembled from per-file parts.
+
+    The retriever replaces its index as a whole on reload, so a query that
+    reads `retriever._index` once sees a consistent dataset throughout.
+    """
+
+    def __init__(self, files: List[POIFile], version: int = 1):
+        self.files = files
+        self.version = version
+        # A single file's list is used as is, so it stays a plain mutable list.
+        self.pois: Sequence[POI] = files[0].pois if len(files) == 1 else _ChainedPOIs([f.pois for f in files])
+        self.points = GeoPoints.concatenate(f.points for f in files)
+        self.category_codes = (np.concatenate([f.category_codes for f in files]) if files
+                               else np.zeros(0, dtype=np.uint8))
+        self.attributes = POIAttributes.concatenate([f.attributes for f in files])
+        # Identifies the content of the files across processes and restarts.
+        self.content_version = content_digest(
+            "|".join(f"{f.name}:{f.digest}" for f in sorted(files, key=lambda f: f.name)).encode('utf-8'))[:16]
+        self._offsets = []
+        offset = 0
+        for f in files:
+            self._offsets.append(offset)
+            offset += len(f.pois)
+
+    def index_of(self, poi_id: str) -> Optional[int]:
+        """Position of a POI by id; later files win on duplicates, as in a flat load."""
+        for f, offset in zip(reversed(self.files), reversed(self._offsets)):
+            index = f.id_index.get(poi_id)
+            if index is not None:
+                return offset + index
+        return None
 
 # --- Core Data Loading and Retrieval Logic ---
 
@@ -66,45 +230,152 @@ class POIRetriever:
     
     def __init__(self):
         """Initialize the POI retriever and load all POI data into memory."""
-        self.pois: List[POI] = []
+        if not os.path.exists(DATA_DIR):
+            raise FileNotFoundError(f"POI data directory not found: {DATA_DIR}")
+        self.data_dir = DATA_DIR
+        self._reload_lock = threading.Lock()
+        # Results of the module-level tool functions, see `retrieve_nearby_pois`.
+        self.query_cache = QueryCache()
         self._load_all_pois()
-    
+
     def _load_all_pois(self):
         """
         Load all POI data from JSON files in the data directory.
         
         This method scans the /data/pois/ directory for JSON files and loads
-        all POIs into memory for fast querying.
+        all POIs into memory for fast querying. If a compiled catalog of the
+        files is present (see `poi_catalog`), the POIs are read from it instead.
         """
-        if not os.path.exists(DATA_DIR):
-            raise FileNotFoundError(f"POI data directory not found: {DATA_DIR}")
+        catalog = open_catalog(self.data_dir)
+        if catalog is not None:
+            files = [POIFile.from_catalog(catalog, name) for name in source_files(self.data_dir)]
+        else:
+            files = [POIFile.load(os.path.join(self.data_dir, filename)) for filename in source_files(self.data_dir)]
+        self._index = POIIndex(files)
         
-        for filename in os.listdir(DATA_DIR):
-            if filename.endswith('.json') and filename.startswith('poi-'):
-                file_path = os.path.join(DATA_DIR, filename)
+        print(f"Loaded {len(self.pois)} POIs from {catalog.path if catalog is not None else self.data_dir}")
+
+    @property
+    def pois(self) -> Sequence[POI]:
+        return self._index.pois
+
+    @property
+    def dataset_version(self) -> int:
+        """Version of the loaded POI index; incremented by every reload that changes it."""
+        return self._index.version
+
+    @property
+    def content_version(self) -> str:
+        """Hash of the loaded files' contents; unlike `dataset_version`, stable across processes."""
+        return self._index.content_version
+
+    @property
+    def points(self) -> GeoPoints:
+        """Cached coordinates of all POIs for vectorized radius queries."""
+        return self._index.points
+
+    @property
+    def category_codes(self) -> np.ndarray:
+        return self._index.category_codes
+
+    def reload(self, force: bool = False) -> bool:
+        """
+        Picks up edits to the POI files and atomically swaps in the new index.
+
+        Only files whose size or mtime changed are read, and only those whose
+        content hash changed are parsed again; the other files' POIs and
+        columns are reused. Queries already running keep the previous index.
+
+        Args:
+            force: Re-parse every file, even if it looks unchanged.
+
+        Returns:
+            True if a new index was swapped in, False otherwise.
+        """
+        with self._reload_lock:
+            current = self._index
+            try:
+                names = source_files(self.data_dir)
+            except OSError as e:
+                print(f"Error: Cannot read POI directory {self.data_dir}: {e}")
+                return False
+
+            previous = {f.name: f for f in current.files}
+            files, parsed = [], []
+            for name in names:
+                file_path = os.path.join(self.data_dir, name)
+                part = previous.get(name)
                 try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        
-                    # Extract POIs from the 'pois' array in each file
-                    if 'pois' in data and isinstance(data['pois'], list):
-                        for poi_data in data['pois']:
-                            try:
-                                # Convert to our Pydantic model for validation
-                                poi = POI(**poi_data)
-                                self.pois.append(poi)
-                            except Exception as e:
-                                print(f"Warning: Failed to parse POI in {filename}: {e}")
-                                continue
-                                
-                except Exception as e:
-                    print(f"Warning: Failed to load POI file {filename}: {e}")
+                    stat = os.stat(file_path)
+                    stat_key = (stat.st_size, stat.st_mtime_ns)
+                    if part is not None and not force and part.stat_key == stat_key:
+                        files.append(part)
+                        continue
+                    with open(file_path, 'rb') as f:
+                        content = f.read()
+                except OSError as e:
+                    # Most likely deleted since the listing; treat it as removed.
+                    print(f"Warning: Skipping POI file {name}: {e}")
                     continue
-        
-        print(f"Loaded {len(self.pois)} POIs from {DATA_DIR}")
+                digest = content_digest(content)
+                if part is not None and not force and part.digest == digest:
+                    # Touched but not edited: remember the new stat, skip the parse.
+                    part.stat_key = stat_key
+                    files.append(part)
+                    continue
+                files.append(POIFile(name, stat_key, digest, load_poi_file(file_path, content)))
+                parsed.append(name)
+
+            removed = [f.name for f in current.files if f.name not in {part.name for part in files}]
+            if not parsed and not removed:
+                print("POI files unchanged; skipping reload.")
+                return False
+
+            # A single reference assignment, which is atomic for concurrent readers.
+            self._index = POIIndex(files, version=current.version + 1)
+            self.query_cache.clear()
+            print(f"Reloaded POIs: {len(parsed)} file(s) parsed, {len(removed)} removed, "
+                  f"{len(self._index.pois)} POIs in total.")
+            return True
+
+    def reload_in_background(self, force: bool = False) -> threading.Thread:
+        """Starts `reload` on a daemon thread and returns the thread."""
+        thread = threading.Thread(target=self.reload, args=(force,), name="poi-reload", daemon=True)
+        thread.start()
+        return thread
+
+    @staticmethod
+    def _category_mask(category_codes: np.ndarray, category: Optional[str]) -> np.ndarray:
+        if category is None:
+            return np.ones(len(category_codes), dtype=bool)
+        codes = [code for code, name in enumerate(POI_CATEGORIES) if name.lower() == category.lower()]
+        return np.isin(category_codes, codes)
+
+    def category_mask(self, category: Optional[str]) -> np.ndarray:
+        """Boolean mask of the POIs in a category (case-insensitive); all True if None."""
+        return self._category_mask(self.category_codes, category)
     
+    def filter_mask(self, category: Optional[str] = None, filters: Optional[POIFilter] = None,
+                    index_snapshot: Optional[POIIndex] = None) -> np.ndarray:
+        """
+        Boolean mask of the POIs matching a category and structured filters.
+
+        Args:
+            category: Optional category filter (case-insensitive).
+            filters: Optional opening hours, type, cost and duration constraints.
+            index_snapshot: The index to evaluate against. Defaults to the current one.
+        """
+        index_snapshot = index_snapshot or self._index
+        mask = self._category_mask(index_snapshot.category_codes, category)
+        if filters is not None:
+            if filters.category is not None:
+                mask &= self._category_mask(index_snapshot.category_codes, filters.category)
+            mask &= index_snapshot.attributes.mask(filters)
+        return mask
+
     def find_nearby_pois(self, location: Coordinates, radius_km: float = 2.0, 
-                        max_results: int = 10, category: Optional[str] = None) -> List[POIWithDistance]:
+                        max_results: int = 10, category: Optional[str] = None,
+                        filters: Optional[POIFilter] = None) -> List[POIWithDistance]:
         """
         Find POIs within a specified radius of a given location.
         
@@ -113,30 +384,120 @@ class POIRetriever:
             radius_km: Search radius in kilometers (default: 2.0)
             max_results: Maximum number of results to return (default: 10)
             category: Optional category filter (e.g., "History", "Art", "Food & Drink")
+            filters: Optional structured filters, e.g. open at the planned arrival time
             
         Returns:
             List of POIWithDistance models, sorted by distance (closest first)
         """
-        results = []
-        
-        for poi in self.pois:
-            # Calculate distance to the POI
-            distance = haversine_distance(location, poi.coordinates)
-            
-            # Filter by radius
-            if distance <= radius_km:
-                # Filter by category if specified
-                if category is None or poi.category.lower() == category.lower():
-                    # Create POIWithDistance by copying all POI fields and adding distance
-                    poi_with_distance = POIWithDistance(
-                        **poi.dict(),
-                        distance_km=round(distance, 2)
-                    )
-                    results.append(poi_with_distance)
+        index_snapshot = self._index
         
-        # Sort by distance and limit results
-        results.sort(key=lambda x: x.distance_km)
-        return results[:max_results]
+        # Bounding-box prefilter plus exact distances, for all POIs at once
+        indices, distances = index_snapshot.points.within(location, radius_km)
+        # Filter by category and structured filters, before any POI is decoded
+        matches = self.filter_mask(category, filters, index_snapshot)[indices]
+        return self._closest(index_snapshot, indices[matches], distances[matches], max_results)
+
+    @staticmethod
+    def _closest(index_snapshot: POIIndex, indices: np.ndarray, distances: np.ndarray,
+                 max_results: int) -> List[POIWithDistance]:
+        """The `max_results` closest of the given POIs (in index order) as POIWithDistance models."""
+        distances = np.round(distances, 2)
+        # Sort by distance and limit results before building any result model
+        order = np.argsort(distances, kind='stable')[:max_results]
+        # The POIs are already validated: copy their fields and add the distance
+        return [extend_model(index_snapshot.pois[index], POIWithDistance, distance_km=distance)
+                for index, distance in zip(indices[order].tolist(), distances[order].tolist())]
+
+    def rank_candidates(self, location: Coordinates, candidates: np.ndarray, radius_km: float = 2.0,
+                        max_results: int = 10, index_snapshot: Optional[POIIndex] = None) -> List[POIWithDistance]:
+        """
+        Measures candidate POIs from a location and returns the closest within the radius.
+
+        With the candidates of `nearby_candidates_batch`, this gives the same
+        results as `find_nearby_pois` while only measuring the candidates.
+
+        Args:
+            location: The center point for the search
+            candidates: Indices of the POIs to consider, in index order
+            radius_km: Search radius in kilometers
+            max_results: Maximum number of results to return
+            index_snapshot: The index the candidates refer to. Defaults to the current one.
+
+        Returns:
+            List of POIWithDistance models, sorted by distance (closest first)
+        """
+        index_snapshot = index_snapshot or self._index
+        distances = index_snapshot.points.distance_matrix([location.latitude], [location.longitude], candidates)[0]
+        keep = distances <= radius_km
+        return self._closest(index_snapshot, candidates[keep], distances[keep], max_results)
+    
+    def find_nearby_pois_batch(self, locations: Union[Sequence[Coordinates], np.ndarray], radius_km: float = 2.0,
+                               max_results: int = 10, category: Optional[str] = None,
+                               filters: Optional[POIFilter] = None) -> List[List[POIWithDistance]]:
+        """
+        Find the POIs within a radius of each of many locations at once.
+
+        Gives the same results as calling `find_nearby_pois` per location, but
+        evaluates the filters once and measures all query x POI distances as
+        one matrix (in chunks of BATCH_CHUNK_ELEMENTS), so the per-call
+        overhead is paid once per batch rather than once per point.
+
+        Args:
+            locations: The search centers, as Coordinates or as an array of
+                shape (n, 2) of latitude/longitude pairs
+            radius_km: Search radius in kilometers (default: 2.0)
+            max_results: Maximum number of results per location (default: 10)
+            category: Optional category filter
+            filters: Optional structured filters
+
+        Returns:
+            For each location, a list of POIWithDistance models sorted by distance
+        """
+        index_snapshot = self._index
+        if max_results <= 0:
+            return [[] for _ in range(len(_query_array(locations)))]
+        return [self._closest(index_snapshot, indices, distances, max_results)
+                for indices, distances in self._within_batch(locations, radius_km, category, filters, index_snapshot)]
+
+    def nearby_candidates_batch(self, locations: Union[Sequence[Coordinates], np.ndarray], radius_km: float,
+                                category: Optional[str] = None, filters: Optional[POIFilter] = None,
+                                index_snapshot: Optional[POIIndex] = None) -> List[np.ndarray]:
+        """
+        Indices of the POIs matching the filters within a radius of each location, in index order.
+
+        Args:
+            locations: The search centers, as in `find_nearby_pois_batch`
+            radius_km: Search radius in kilometers
+            category: Optional category filter
+            filters: Optional structured filters
+            index_snapshot: The index to search. Defaults to the current one.
+        """
+        index_snapshot = index_snapshot or self._index
+        return [indices for indices, _ in self._within_batch(locations, radius_km, category, filters, index_snapshot)]
+
+    def _within_batch(self, locations: Union[Sequence[Coordinates], np.ndarray], radius_km: float,
+                      category: Optional[str], filters: Optional[POIFilter],
+                      index_snapshot: POIIndex) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """Yields, per location, the (indices, distances_km) of the matching POIs within the radius."""
+        queries = _query_array(locations)
+        candidates = np.flatnonzero(self.filter_mask(category, filters, index_snapshot))
+        if len(candidates) == 0:
+            for _ in range(len(queries)):
+                yield candidates, np.zeros(0)
+            return
+
+        points = index_snapshot.points
+        chunk_size = max(1, BATCH_CHUNK_ELEMENTS // len(candidates))
+        for start in range(0, len(queries), chunk_size):
+            chunk = queries[start:start + chunk_size]
+            # Only the candidates in the bounding box around the whole chunk are measured
+            boxes = np.array([bounding_box(latitude, longitude, radius_km) for latitude, longitude in chunk.tolist()])
+            box = (boxes[:, 0].min(), boxes[:, 1].max(), boxes[:, 2].min(), boxes[:, 3].max())
+            local = candidates[in_bounding_box(points.latitudes[candidates], points.longitudes[candidates], box)]
+            # `local` is in index order, so ties keep the order of `find_nearby_pois`
+            for row in points.distance_matrix(chunk[:, 0], chunk[:, 1], local):
+                keep = np.flatnonzero(row <= radius_km)
+                yield local[keep], row[keep]
     
     def get_poi_by_id(self, poi_id: str) -> Optional[POI]:
         """
@@ -148,10 +509,9 @@ class POIRetriever:
         Returns:
             POI model or None if not found
         """
-        for poi in self.pois:
-            if poi.poi_id == poi_id:
-                return poi
-        return None
+        index_snapshot = self._index
+        index = index_snapshot.index_of(poi_id)
+        return index_snapshot.pois[index] if index is not None else None
     
     def get_pois_by_category(self, category: str, max_results: int = 20) -> List[POI]:
         """
@@ -164,16 +524,9 @@ class POIRetriever:
         Returns:
             List of POI models
         """
-        results = []
-        
-        for poi in self.pois:
-            if poi.category.lower() == category.lower():
-                results.append(poi)
-                
-                if len(results) >= max_results:
-                    break
-        
-        return results
+        index_snapshot = self._index
+        matches = np.flatnonzero(self._category_mask(index_snapshot.category_codes, category))[:max_results]
+        return [index_snapshot.pois[index] for index in matches.tolist()]
 
 
 # --- Tool Function for Agent Integration ---
@@ -188,9 +541,32 @@ def get_poi_retriever() -> POIRetriever:
         _poi_retriever_instance = POIRetriever()
     return _poi_retriever_instance
 
+def _nearby_query(latitude: float, longitude: float, radius_km: float,
+                  category: Optional[str], filters: Optional[POIFilter]):
+    """Returns the retriever, the query point, its grid cell and the cache key of the cell's candidates."""
+    retriever = get_poi_retriever()
+    # Nearby queries share their candidate POIs per grid cell: the matching POIs
+    # within the radius plus a cell radius of the cell center, which includes
+    # every POI in the radius of any point in the cell. Distances and ranking
+    # are computed from the query point itself (see `rank_candidates`).
+    location = Coordinates(latitude=latitude, longitude=longitude)
+    cell = snap_to_grid(location)
+    key = ('nearby', retriever.dataset_version, cell.latitude, cell.longitude, radius_km,
+           category.lower() if category else None, dumps(filters) if filters is not None else None)
+    return retriever, location, cell, key
+
+def _cell_candidates(retriever: POIRetriever, cells: Sequence[Coordinates], radius_km: float,
+                     category: Optional[str], filters: Optional[POIFilter]) -> List[Tuple[POIIndex, np.ndarray]]:
+    """The cached value of each cell: the index searched and the indices of its candidate POIs."""
+    index_snapshot = retriever._index
+    candidates = retriever.nearby_candidates_batch(cells, radius_km + cell_radius_km(), category, filters,
+                                                   index_snapshot)
+    return [(index_snapshot, indices) for indices in candidates]
+
 def retrieve_nearby_pois(latitude: float, longitude: float, 
                         radius_km: float = 2.0, max_results: int = 10, 
-                        category: Optional[str] = None) -> List[POIWithDistance]:
+                        category: Optional[str] = None,
+                        filters: Optional[POIFilter] = None) -> List[POIWithDistance]:
     """
     Main tool function for the agent to retrieve nearby POIs.
     
@@ -203,17 +579,64 @@ def retrieve_nearby_pois(latitude: float, longitude: float,
         radius_km: Search radius in kilometers
         max_results: Maximum number of POIs to return
         category: Optional category filter
+        filters: Optional opening hours, type, cost and duration filters
         
     Returns:
         List of POIWithDistance models with distance information
     """
-    retriever = get_poi_retriever()
-    location = Coordinates(latitude=latitude, longitude=longitude)
-    return retriever.find_nearby_pois(location, radius_km, max_results, category)
+    # Cached results are keyed by the day of the visit, not by "today".
+    filters = filters.resolved() if filters is not None else None
+    retriever, location, cell, key = _nearby_query(latitude, longitude, radius_km, category, filters)
+    index_snapshot, candidates = retriever.query_cache.get_or_compute(
+        key, lambda: _cell_candidates(retriever, [cell], radius_km, category, filters)[0])
+    return retriever.rank_candidates(location, candidates, radius_km, max_results, index_snapshot)
+
+def retrieve_nearby_pois_batch(points: Sequence[Tuple[float, float]],
+                               radius_km: float = 2.0, max_results: int = 10,
+                               category: Optional[str] = None,
+                               filters: Optional[POIFilter] = None) -> List[List[POIWithDistance]]:
+    """
+    Tool function to retrieve the nearby POIs of many points in one call.
+
+    Shares the query cache with `retrieve_nearby_pois`: the candidates of
+    cached grid cells are served from it, the others are searched in one
+    batch and cached.
+
+    Args:
+        points: (latitude, longitude) pairs of the search centers
+        radius_km: Search radius in kilometers
+        max_results: Maximum number of POIs per point
+        category: Optional category filter
+        filters: Optional opening hours, type, cost and duration filters
+
+    Returns:
+        For each point, a list of POIWithDistance models with distance information
+    """
+    filters = filters.resolved() if filters is not None else None
+    queries = [_nearby_query(latitude, longitude, radius_km, category, filters) for latitude, longitude in points]
+    cached: Dict[Hashable, Tuple[POIIndex, np.ndarray]] = {}
+    missing: Dict[Hashable, Coordinates] = {}
+    for retriever, _, cell, key in queries:
+        if key in cached or key in missing:
+            continue
+        found, value = retriever.query_cache.get(key)
+        if found:
+            cached[key] = value
+        else:
+            missing[key] = cell
+    if missing:
+        retriever = get_poi_retriever()
+        computed = _cell_candidates(retriever, list(missing.values()), radius_km, category, filters)
+        for key, value in zip(missing, computed):
+            retriever.query_cache.put(key, value)
+            cached[key] = value
+    return [retriever.rank_candidates(location, cached[key][1], radius_km, max_results, cached[key][0])
+            for retriever, location, _, key in queries]
 
 def retrieve_nearby_pois_as_dict(latitude: float, longitude: float, 
                                 radius_km: float = 2.0, max_results: int = 10, 
-                                category: Optional[str] = None) -> List[Dict]:
+                                category: Optional[str] = None,
+                                filters: Optional[POIFilter] = None) -> List[Dict]:
     """
     Legacy function that returns POIs as dictionaries for backward compatibility.
     
@@ -223,9 +646,58 @@ def retrieve_nearby_pois_as_dict(latitude: float, longitude: float,
         radius_km: Search radius in kilometers
         max_results: Maximum number of POIs to return
         category: Optional category filter
+        filters: Optional opening hours, type, cost and duration filters
         
     Returns:
         List of POI dictionaries with distance information
     """
-    pois = retrieve_nearby_pois(latitude, longitude, radius_km, max_results, category)
-    return [poi.dict() for poi in pois]
\ No newline at end of file
+    return loads(retrieve_nearby_pois_as_json(latitude, longitude, radius_km, max_results, category, filters))
+
+def retrieve_nearby_pois_as_json(latitude: float, longitude: float,
+                                 radius_km: float = 2.0, max_results: int = 10,
+                                 category: Optional[str] = None,
+                                 filters: Optional[POIFilter] = None) -> bytes:
+    """
+    Returns the nearby POIs as UTF-8 JSON, e.g. for prompts and API responses.
+
+    The encoding is cached next to the result, so repeated queries reuse the bytes.
+
+    Returns:
+        A JSON array of POI objects with distance information
+    """
+    filters = filters.resolved() if filters is not None else None
+    retriever, _, _, key = _nearby_query(latitude, longitude, radius_km, category, filters)
+    # The encoding depends on the exact point, not only on its grid cell.
+    return retriever.query_cache.get_or_compute(
+        ('json', latitude, longitude, max_results) + key,
+        lambda: dumps(retrieve_nearby_pois(latitude, longitude, radius_km, max_results, category, filters)))
+
+def retrieve_nearby_pois_batch_as_json(points: Sequence[Tuple[float, float]],
+                                       radius_km: float = 2.0, max_results: int = 10,
+                                       category: Optional[str] = None,
+                                       filters: Optional[POIFilter] = None) -> List[bytes]:
+    """
+    Returns the nearby POIs of many points as UTF-8 JSON, one array per point.
+
+    Shares the cached encodings with `retrieve_nearby_pois_as_json`; the
+    points without one are searched in one `retrieve_nearby_pois_batch` call.
+
+    Returns:
+        For each point, a JSON array of POI objects with distance information
+    """
+    filters = filters.resolved() if filters is not None else None
+    retriever = get_poi_retriever()
+    keys: List[Hashable] = []
+    encoded: List[Optional[bytes]] = []
+    for latitude, longitude in points:
+        _, _, _, key = _nearby_query(latitude, longitude, radius_km, category, filters)
+        keys.append(('json', latitude, longitude, max_results) + key)
+        found, value = retriever.query_cache.get(keys[-1])
+        encoded.append(value if found else None)
+    missing = [i for i, value in enumerate(encoded) if value is None]
+    if missing:
+        found = retrieve_nearby_pois_batch([points[i] for i in missing], radius_km, max_results, category, filters)
+        for i, pois in zip(missing, found):
+            encoded[i] = dumps(pois)
+            retriever.query_cache.put(keys[i], encoded[i])
+    return encoded
\ No newline at end of file
@@ -0,0 +1,203 @@
+"""
+Tool for "what's reachable in N minutes from here" discovery queries.
+
+A reachability query runs a single one-to-all earliest-arrival search from the
+user's coordinate over the transit network (see
+`TransitPlanner.earliest_arrivals_from`) and then joins the per-stop arrival
+times against a precomputed index of POIs: each POI is attached once to its
+nearest stop, so the join is a vectorized lookup instead of one journey
+planning call per POI. POIs are ranked by slack, the time left in the budget
+after reaching them.
+"""
+
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+from pydantic import Field
+
+from src.core.geo import GeoPoints
+from src.core.models import POI, Coordinates
+from src.core.structs import extend_model
+from src.tools.connection_scan import UNREACHED_ARRIVAL, seconds_to_hhmm
+from src.tools.poi_retriever import POIRetriever, get_poi_retriever
+from src.tools.transit_planner import (WALKING_SPEED_KMH, TimetableGeneration, TransitPlanner, get_transit_planner,
+                                      _parse_hhmm)
+
+# --- Extended Models for Tool Results ---
+
+class ReachablePOI(POI):
+    """
+    Extends the base POI model with the reachability of the POI from the query
+    point within a time budget.
+    """
+    travel_minutes: int = Field(..., description="Door-to-door travel time from the query point in minutes")
+    arrival_time: str = Field(..., description="Arrival time at the POI in HH:MM format")
+    slack_minutes: int = Field(..., description="Minutes left in the budget after arriving")
+
+# --- Indexed POI Join ---
+
+class _POIStopJoin:
+    """
+    The POI-to-stop join of one timetable generation and POI index; never
+    modified once built.
+
+    For every POI it stores the row of its nearest stop in the generation's
+    `stops_df` (which is also the CSA stop index) and the walking time from
+    that stop, as flat NumPy arrays, plus the POI coordinates as a GeoPoints set.
+    """
+
+    def __init__(self, generation: TimetableGeneration, poi_version: int, pois: List[POI]):
+        self.generation_version = generation.version
+        self.poi_version = poi_version
+        self.pois = pois
+        self.poi_points = GeoPoints.from_coordinates(poi.coordinates for poi in pois)
+        self.poi_stop = np.zeros(len(pois), dtype=np.int32)
+        self.poi_egress_s = np.zeros(len(pois), dtype=np.int32)
+
+        stop_points = generation.stop_points
+        for i, poi in enumerate(pois):
+            nearest, distance_km = stop_points.nearest(poi.coordinates)
+            self.poi_stop[i] = nearest
+            self.poi_egress_s[i] = int(np.ceil(distance_km / WALKING_SPEED_KMH * 3600))
+
+class ReachabilityIndex:
+    """
+    Precomputed join between the POI dataset and the transit stops.
+
+    The join refers to the stop rows of one timetable generation and to the
+    POIs of one POI index, so it is rebuilt whenever a query runs against a
+    generation or POI index it was not built for (after `TransitPlanner.reload`
+    or `POIRetriever.reload`).
+    """
+
+    def __init__(self, planner: TransitPlanner, retriever: POIRetriever):
+        """Builds the POI-to-stop index for the given planner and POI dataset."""
+        self.planner = planner
+        self.retriever = retriever
+        self._join: Optional[_POIStopJoin] = None
+        self._build_lock = threading.Lock()
+        with planner.pin_generation() as generation:
+            self._join_for(generation)
+
+    def _join_for(self, generation: TimetableGeneration) -> _POIStopJoin:
+        """The join of a generation and the current POIs, building it if the current one is for others."""
+        # The version is read before the POIs: a reload in between only causes another rebuild.
+        poi_version = self.retriever.dataset_version
+        join = self._join
+        if join is not None and (join.generation_version, join.poi_version) == (generation.version, poi_version):
+            return join
+        with self._build_lock:
+            join = self._join
+            if join is None or (join.generation_version, join.poi_version) != (generation.version, poi_version):
+                join = _POIStopJoin(generation, poi_version, list(self.retriever.pois))
+                # A query still pinned to a retired generation must not replace a newer join.
+                if self._join is None or generation.version >= self._join.generation_version:
+                    self._join = join
+        return join
+
+    def find_reachable(self, location: Coordinates, departure_time: str, budget_minutes: int,
+                       category: Optional[str] = None,
+                       max_results: Optional[int] = None) -> List[ReachablePOI]:
+        """
+        Finds all POIs reachable within a time budget, ranked by slack.
+
+        Args:
+            location: The starting point.
+            departure_time: Departure time in "HH:MM" format.
+            budget_minutes: The time budget in minutes.
+            category: Optional category filter (e.g., "History", "Art").
+            max_results: Optional cap on the number of results.
+
+        Returns:
+            List of ReachablePOI models, the most slack first.
+        """
+        with self.planner.pin_generation() as generation:
+            return self._find_reachable(self._join_for(generation), location, departure_time, budget_minutes,
+                                        category, max_results)
+
+    def _find_reachable(self, join: _POIStopJoin, location: Coordinates, departure_time: str,
+                        budget_minutes: int, category: Optional[str],
+                        max_results: Optional[int]) -> List[ReachablePOI]:
+        departure_td = _parse_hhmm(departure_time)
+        if departure_td is None or not join.pois:
+            return []
+        departure_s = int(departure_td.total_seconds())
+        budget_s = budget_minutes * 60
+
+        # Walking straight to a POI is always an option.
+        walk_km = join.poi_points.distances_from(location)
+        travel_s = np.ceil(walk_km / WALKING_SPEED_KMH * 3600).astype(np.int64)
+
+        # One search gives arrival times at every stop; the join is a gather.
+        arrivals = self.planner.earliest_arrivals_from(location, departure_time, max_minutes=budget_minutes)
+        if arrivals is not None:
+            stop_arrival = arrivals[join.poi_stop].astype(np.int64)
+            reached = stop_arrival != UNREACHED_ARRIVAL
+            by_transit = stop_arrival + join.poi_egress_s - departure_s
+            travel_s = np.where(reached, np.minimum(travel_s, by_transit), travel_s)
+
+        candidates = np.flatnonzero(travel_s <= budget_s)
+        # Most slack first; ties keep the dataset order.
+        candidates = candidates[np.argsort(travel_s[candidates], kind='stable')]
+
+        results = []
+        for i in candidates:
+            poi = join.pois[int(i)]
+            if category is not None and poi.category.lower() != category.lower():
+                continue
+            travel_minutes = int(np.ceil(travel_s[i] / 60))
+            results.append(extend_model(
+                poi, ReachablePOI,
+                travel_minutes=travel_minutes,
+                arrival_time=seconds_to_hhmm(departure_s + int(travel_s[i])),
+                slack_minutes=budget_minutes - travel_minutes,
+            ))
+            if max_results is not None and len(results) >= max_results:
+                break
+        return results
+
+# --- Tool Function for Agent Integration ---
+
+_reachability_index_instance = None
+
+def get_reachability_index() -> ReachabilityIndex:
+    """Gets the singleton ReachabilityIndex, building it over the shared planner and retriever."""
+    global _reachability_index_instance
+    if _reachability_index_instance is None:
+        _reachability_index_instance = ReachabilityIndex(get_transit_planner(), get_poi_retriever())
+    return _reachability_index_instance
+
+def find_reachable_pois(latitude: float, longitude: float, departure_time: str,
+                        budget_minutes: int, category: Optional[str] = None,
+                        max_results: Optional[int] = None) -> List[ReachablePOI]:
+    """
+    Main tool function for the agent to find POIs reachable within a time budget.
+
+    Args:
+        latitude: Latitude of the starting point
+        longitude: Longitude of the starting point
+        departure_time: Departure time in "HH:MM" format
+        budget_minutes: Time budget in minutes
+        category: Optional category filter
+        max_results: Optional cap on the number of results
+
+    Returns:
+        List of ReachablePOI models, the most slack first
+    """
+    index = get_reachability_index()
+    location = Coordinates(latitude=latitude, longitude=longitude)
+    return index.find_reachable(location, departure_time, budget_minutes, category, max_results)
+
+def find_reachable_pois_as_dict(latitude: float, longitude: float, departure_time: str,
+                                budget_minutes: int, category: Optional[str] = None,
+                                max_results: Optional[int] = None) -> List[Dict]:
+    """
+    Finds the reachable POIs like `find_reachable_pois` and returns them as
+    dictionaries, e.g. for callers that serialize the tool result to JSON.
+
+    Returns:
+        List of POI dictionaries with reachability information
+    """
+    pois = find_reachable_pois(latitude, longitude, departure_time, budget_minutes, category, max_results)
+    return [poi.dict() for poi in pois]
@@ -0,0 +1,176 @@
+"""
+Publishing the compact timetable for read-only sharing between processes.
+
+Every worker process that builds its own TransitPlanner holds a private copy
+of the timetable. Instead, one loader process can publish the CSA connection
+arrays and the stop table as plain `.npy` files into a shared directory
+(ideally on a RAM-backed filesystem such as `/dev/shm`), and workers attach to
+them with read-only memory maps. The operating system keeps a single copy of
+the pages, so N workers cost roughly one timetable's worth of RAM, and
+attaching only maps files instead of parsing GTFS.
+
+Directory layout:
+
+    <root>/CURRENT              name of the generation workers should attach to
+    <root>/<generation>/        one directory per published generation
+        manifest.json           dataset version, array names, publish time
+        <array>.npy             one file per array
+
+A new generation is written under its own directory and becomes visible by
+atomically replacing CURRENT, so attached workers never see a partial write.
+"""
+
+import json
+import os
+import shutil
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from src.tools.connection_scan import ConnectionScanEngine
+
+# --- Constants and Configuration ---
+
+# Root directory of the shared timetable. When set, `get_transit_planner`
+# attaches to the published timetable instead of loading the GTFS feed.
+SHARED_TIMETABLE_DIR = os.getenv("TRANSIT_SHARED_DIR")
+
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+
+# Generations kept on disk after a publish: the new one plus its predecessor,
+# which workers may still be attached to until they reload.
+KEEP_GENERATIONS = 2
+
+# --- Publishing ---
+
+def publish_timetable(root_dir: str, engine: ConnectionScanEngine, stops_df: pd.DataFrame,
+                      signature: Optional[str] = None) -> str:
+    """
+    Writes a timetable generation into `root_dir` and makes it current.
+
+    Args:
+        root_dir: The shared directory workers attach to.
+        engine: The CSA engine holding the connection arrays.
+        stops_df: The stop table; its row order must match the engine's stop indices.
+        signature: Fingerprint of the source feed, recorded in the manifest.
+
+    Returns:
+        The name of the published generation.
+    """
+    os.makedirs(root_dir, exist_ok=True)
+    name = f"gen-{time.time_ns()}-{os.getpid()}"
+    tmp_dir = os.path.join(root_dir, f".{name}.tmp")
+    os.makedirs(tmp_dir)
+
+    arrays = engine.to_arrays()
+    arrays['stop_lat'] = stops_df['stop_lat'].to_numpy(dtype=np.float64)
+    arrays['stop_lon'] = stops_df['stop_lon'].to_numpy(dtype=np.float64)
+    for array_name, values in arrays.items():
+        np.save(os.path.join(tmp_dir, f"{array_name}.npy"), values, allow_pickle=False)
+
+    manifest = {
+        'signature': signature,
+        'arrays': sorted(arrays),
+        'num_connections': engine.num_connections,
+        'num_stops': len(stops_df),
+        'published_at': datetime.now().isoformat(),
+    }
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f)
+    os.rename(tmp_dir, os.path.join(root_dir, name))
+
+    # Switching CURRENT is a single atomic rename.
+    tmp_current = os.path.join(root_dir, f".{CURRENT_FILE}.tmp")
+    with open(tmp_current, 'w') as f:
+        f.write(name)
+    os.replace(tmp_current, os.path.join(root_dir, CURRENT_FILE))
+
+    _prune_generations(root_dir)
+    print(f"Published shared timetable generation {name} ({engine.num_connections} connections).")
+    return name
+
+def _prune_generations(root_dir: str):
+    """Deletes all but the newest KEEP_GENERATIONS published generations."""
+    generations = sorted(
+        (entry for entry in os.listdir(root_dir)
+         if entry.startswith("gen-") and os.path.isdir(os.path.join(root_dir, entry))),
+        key=lambda entry: int(entry.split("-")[1]),
+    )
+    # Processes still mapping a deleted generation keep their pages until they
+    # unmap them; only the directory entry goes away.
+    for entry in generations[:-KEEP_GENERATIONS]:
+        shutil.rmtree(os.path.join(root_dir, entry), ignore_errors=True)
+
+# --- Attaching ---
+
+def current_generation_name(root_dir: str) -> Optional[str]:
+    """Returns the name of the current generation in `root_dir`, or None if nothing is published."""
+    try:
+        with open(os.path.join(root_dir, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+class SharedTimetable:
+    """
+    A published timetable generation attached through read-only memory maps.
+
+    `arrays` maps each array name to a read-only `np.memmap`; nothing is copied
+    until it is read.
+    """
+
+    def __init__(self, root_dir: str, name: str):
+        self.root_dir = root_dir
+        self.name = name
+        generation_dir = os.path.join(root_dir, name)
+        with open(os.path.join(generation_dir, MANIFEST_FILE)) as f:
+            self.manifest = json.load(f)
+        self.arrays: Dict[str, np.ndarray] = {
+            array_name: np.load(os.path.join(generation_dir, f"{array_name}.npy"),
+                                mmap_mode='r', allow_pickle=False)
+            for array_name in self.manifest['arrays']
+        }
+
+    @property
+    def signature(self) -> Optional[str]:
+        return self.manifest.get('signature')
+
+    def build_engine(self) -> ConnectionScanEngine:
+        """Wraps the shared connection arrays in a CSA engine without copying them."""
+        return ConnectionScanEngine.from_arrays(self.arrays)
+
+    def build_stops_df(self) -> pd.DataFrame:
+        """Builds the (small) stop table used for nearest-stop lookups."""
+        return pd.DataFrame({
+            'stop_id': self.arrays['stop_ids'].astype(str),
+            'stop_name': self.arrays['stop_names'].astype(str),
+            'stop_lat': np.asarray(self.arrays['stop_lat']),
+            'stop_lon': np.asarray(self.arrays['stop_lon']),
+        })
+
+def attach_timetable(root_dir: str, name: Optional[str] = None) -> Optional[SharedTimetable]:
+    """
+    Attaches to the current generation published in `root_dir`.
+
+    Args:
+        root_dir: The shared directory.
+        name: Attach this generation instead of the current one, e.g. the one
+            a parent process is using.
+
+    Returns:
+        The attached SharedTimetable, or None if nothing is published or the
+        generation cannot be read.
+    """
+    name = name or current_generation_name(root_dir)
+    if name is None:
+        print(f"Error: No shared timetable is published in {root_dir}.")
+        return None
+    try:
+        return SharedTimetable(root_dir, name)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error: Failed to attach shared timetable {name} in {root_dir}: {e}")
+        return None
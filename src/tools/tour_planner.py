@@ -0,0 +1,271 @@
+"""
+Tool for planning time-budgeted walking tours past POIs.
+
+A walking leg (e.g. from the user's start to the first stop) usually has some
+slack before the transit departure. Choosing which POIs to visit in that slack
+and in which order is an orienteering problem: maximize the total score of the
+visited POIs such that walking plus visiting time fits the budget.
+
+The solver works on a walking-time matrix between the start, the end and the
+candidate POIs. The candidates depend on the endpoints, the budget and the
+filters, so the matrix is built for each query, in one vectorized call over at
+most MAX_CANDIDATES + 2 points. It alternates two heuristics until neither
+improves the tour:
+- greedy insertion: add the POI with the best score per added minute at its
+  cheapest position, as long as the tour still fits the budget,
+- 2-opt: reverse segments of the tour while that shortens the walk, which
+  frees time for further insertions.
+
+The work is bounded by a number of move evaluations instead of wall-clock
+time, so the same inputs always give the same tour.
+"""
+
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from pydantic import BaseModel, Field
+
+from src.core.geo import haversine_km_array
+from src.core.models import POI, Coordinates, WalkingLeg
+from src.core.structs import LatLon
+from src.tools.poi_filters import POIFilter
+from src.tools.poi_retriever import POIRetriever, get_poi_retriever
+from src.tools.transit_planner import WALKING_SPEED_KMH
+
+# --- Constants and Configuration ---
+
+# Candidate POIs considered per tour; the closest to the walk are kept.
+MAX_CANDIDATES = 40
+
+# Upper bound on the move evaluations (insertion positions and 2-opt swaps)
+# of one solve. Caps the runtime deterministically.
+MAX_EVALUATIONS = 200_000
+
+# Matrix nodes of the tour endpoints; candidates follow from index 2.
+START_NODE = 0
+END_NODE = 1
+
+# --- Models for Tool Results ---
+
+def _poi_fields(poi: POI) -> Dict:
+    """The POI fields of a POI or of a model extending it (without e.g. `distance_km` or the tour fields)."""
+    return {name: getattr(poi, name) for name in POI.model_fields}
+
+class TourStop(POI):
+    """A POI on a walking tour, with its place in the schedule."""
+    walk_minutes: int = Field(..., description="Walking time from the previous point of the tour")
+    arrival_minute: int = Field(..., description="Minutes after the start of the tour when the POI is reached")
+
+class WalkingTour(BaseModel):
+    """An ordered walking tour from a start to an end point past a set of POIs."""
+    stops: List[TourStop] = Field(default_factory=list, description="The POIs to visit, in order.")
+    walking_minutes: int
+    visiting_minutes: int
+    total_minutes: int
+    budget_minutes: int
+    distance_meters: int
+    score: float
+
+    def to_walking_leg(self, start_location_name: str, end_location_name: str) -> WalkingLeg:
+        """Turns the tour into a WalkingLeg with plain step-by-step instructions."""
+        steps = [f"Walk {stop.walk_minutes} min to {stop.title} and spend about "
+                 f"{stop.practical_info.estimated_duration_minutes} min there." for stop in self.stops]
+        final_walk = self.walking_minutes - sum(stop.walk_minutes for stop in self.stops)
+        steps.append(f"Walk {final_walk} min to {end_location_name}.")
+        return WalkingLeg(
+            start_location_name=start_location_name,
+            end_location_name=end_location_name,
+            duration_minutes=self.total_minutes,
+            distance_meters=self.distance_meters,
+            instructions=" ".join(steps),
+            pois=[POI.model_construct(**_poi_fields(stop)) for stop in self.stops],
+        )
+
+# --- Orienteering Solver ---
+
+def walking_minutes_matrix(coordinates: Sequence[Coordinates]) -> np.ndarray:
+    """Whole-minute walking times between all pairs of points."""
+    latitudes = np.array([c.latitude for c in coordinates], dtype=np.float64)
+    longitudes = np.array([c.longitude for c in coordinates], dtype=np.float64)
+    km = haversine_km_array(latitudes[:, None], longitudes[:, None], latitudes[None, :], longitudes[None, :])
+    return np.ceil(km / WALKING_SPEED_KMH * 60)
+
+def _tour_cost(route: List[int], travel: np.ndarray, visit: np.ndarray) -> float:
+    return float(travel[route[:-1], route[1:]].sum() + visit[route].sum())
+
+def _insert_greedily(route: List[int], travel: np.ndarray, visit: np.ndarray, score: np.ndarray,
+                     budget: float, evaluations: int, max_evaluations: int):
+    """Inserts POIs by best score per added minute until none fits. Returns (inserted, evaluations)."""
+    inserted = False
+    cost = _tour_cost(route, travel, visit)
+    while evaluations < max_evaluations:
+        unvisited = np.setdiff1d(np.arange(2, len(visit)), route)
+        if len(unvisited) == 0:
+            break
+        before, after = np.array(route[:-1]), np.array(route[1:])
+        # added[c, k]: extra minutes of inserting candidate c between route[k] and route[k + 1].
+        added = (travel[np.ix_(before, unvisited)].T + visit[unvisited, None]
+                 + travel[np.ix_(unvisited, after)] - travel[before, after][None, :])
+        evaluations += added.size
+        feasible = cost + added <= budget
+        if not feasible.any():
+            break
+        ratio = np.where(feasible, score[unvisited, None] / np.maximum(added, 1e-6), -np.inf)
+        best = int(np.argmax(ratio))
+        candidate, position = divmod(best, added.shape[1])
+        route.insert(position + 1, int(unvisited[candidate]))
+        cost += float(added[candidate, position])
+        inserted = True
+    return inserted, evaluations
+
+def _two_opt(route: List[int], travel: np.ndarray, evaluations: int, max_evaluations: int):
+    """Reverses tour segments while that shortens the walk. Returns (improved, evaluations)."""
+    improved_any, improved = False, True
+    while improved and evaluations < max_evaluations:
+        improved = False
+        for i in range(1, len(route) - 2):
+            for j in range(i + 1, len(route) - 1):
+                evaluations += 1
+                delta = (travel[route[i - 1], route[j]] + travel[route[i], route[j + 1]]
+                         - travel[route[i - 1], route[i]] - travel[route[j], route[j + 1]])
+                if delta < -1e-9:
+                    route[i:j + 1] = reversed(route[i:j + 1])
+                    improved = improved_any = True
+            if evaluations >= max_evaluations:
+                break
+    return improved_any, evaluations
+
+def solve_orienteering(travel: np.ndarray, visit: np.ndarray, score: np.ndarray, budget_minutes: float,
+                       max_evaluations: int = MAX_EVALUATIONS) -> List[int]:
+    """
+    Chooses and orders the nodes to visit between a start and an end node.
+
+    Args:
+        travel: Square matrix of travel minutes; node 0 is the start, node 1
+            the end and nodes from 2 on are the candidates. Must be symmetric.
+        visit: Minutes spent at each node (0 for the endpoints).
+        score: Value of visiting each node.
+        budget_minutes: Upper bound on travel plus visiting time.
+        max_evaluations: Cap on the move evaluations of the search.
+
+    Returns:
+        The candidate nodes to visit, in order (empty if none fits).
+    """
+    route = [START_NODE, END_NODE]
+    if _tour_cost(route, travel, visit) > budget_minutes:
+        return []
+    evaluations = 0
+    while evaluations < max_evaluations:
+        _, evaluations = _insert_greedily(route, travel, visit, score, budget_minutes,
+                                          evaluations, max_evaluations)
+        shortened, evaluations = _two_opt(route, travel, evaluations, max_evaluations)
+        if not shortened:
+            break
+    return route[1:-1]
+
+# --- Tour Planning ---
+
+def plan_tour(start: Coordinates, end: Coordinates, budget_minutes: int,
+              filters: Optional[POIFilter] = None, category_weights: Optional[Dict[str, float]] = None,
+              retriever: Optional[POIRetriever] = None,
+              max_candidates: int = MAX_CANDIDATES) -> Optional[WalkingTour]:
+    """
+    Plans the best walking tour from `start` to `end` within a time budget.
+
+    Args:
+        start: Where the walk begins.
+        end: Where the walk must end, e.g. the stop of the transit departure.
+        budget_minutes: Minutes available for walking and visiting.
+        filters: Optional constraints on the POIs, e.g. open now, indoor.
+        category_weights: Score of a POI by category; other categories score 1.
+        retriever: The POI retriever to use. Defaults to the shared singleton.
+        max_candidates: How many nearby POIs the solver considers.
+
+    Returns:
+        A WalkingTour (possibly without stops), or None if even the direct
+        walk does not fit the budget.
+    """
+    retriever = retriever or get_poi_retriever()
+    direct = walking_minutes_matrix([start, end])[0, 1]
+    if direct > budget_minutes:
+        print(f"Warning: Walking from start to end takes {int(direct)} min, more than the {budget_minutes} min budget.")
+        return None
+
+    # Every feasible POI lies in the ellipse with the endpoints as foci, which
+    # fits in a circle around their midpoint with half the walkable distance.
+    midpoint = LatLon((start.latitude + end.latitude) / 2, (start.longitude + end.longitude) / 2)
+    radius_km = budget_minutes / 60 * WALKING_SPEED_KMH / 2
+    candidates: List[POI] = retriever.find_nearby_pois(midpoint, radius_km, max_candidates, filters=filters)
+
+    travel = walking_minutes_matrix([start, end] + [poi.coordinates for poi in candidates])
+    visit = np.array([0, 0] + [poi.practical_info.estimated_duration_minutes for poi in candidates], dtype=np.float64)
+    weights = {category.lower(): weight for category, weight in (category_weights or {}).items()}
+    score = np.array([0.0, 0.0] + [weights.get(poi.category.value.lower(), 1.0) for poi in candidates])
+
+    order = solve_orienteering(travel, visit, score, budget_minutes)
+
+    stops, elapsed, previous = [], 0, START_NODE
+    for node in order:
+        walk = int(travel[previous, node])
+        elapsed += walk
+        poi = candidates[node - 2]
+        stops.append(TourStop.model_construct(**_poi_fields(poi), walk_minutes=walk, arrival_minute=elapsed))
+        elapsed += int(visit[node])
+        previous = node
+
+    route = [START_NODE] + order + [END_NODE]
+    points = [start, end] + [poi.coordinates for poi in candidates]
+    latitudes = np.array([points[node].latitude for node in route])
+    longitudes = np.array([points[node].longitude for node in route])
+    distance_km = haversine_km_array(latitudes[:-1], longitudes[:-1], latitudes[1:], longitudes[1:]).sum()
+
+    walking = int(travel[route[:-1], route[1:]].sum())
+    visiting = int(visit[order].sum()) if order else 0
+    return WalkingTour(
+        stops=stops,
+        walking_minutes=walking,
+        visiting_minutes=visiting,
+        total_minutes=walking + visiting,
+        budget_minutes=budget_minutes,
+        distance_meters=int(round(distance_km * 1000)),
+        score=float(score[order].sum()) if order else 0.0,
+    )
+
+# --- Tool Function for Agent Integration ---
+
+def plan_walking_tour(start_latitude: float, start_longitude: float, end_latitude: float, end_longitude: float,
+                      budget_minutes: int, filters: Optional[POIFilter] = None,
+                      category_weights: Optional[Dict[str, float]] = None) -> Optional[WalkingTour]:
+    """
+    Main tool function for the agent to fill the slack of a walking leg with POIs.
+
+    Args:
+        start_latitude: Latitude of the start of the walk
+        start_longitude: Longitude of the start of the walk
+        end_latitude: Latitude of the end of the walk (e.g. the departure stop)
+        end_longitude: Longitude of the end of the walk
+        budget_minutes: Minutes available until the walk must end
+        filters: Optional opening hours, type, cost and duration filters
+        category_weights: Optional score per POI category
+
+    Returns:
+        The ordered WalkingTour, or None if the budget is too small for the walk itself
+    """
+    start = Coordinates(latitude=start_latitude, longitude=start_longitude)
+    end = Coordinates(latitude=end_latitude, longitude=end_longitude)
+    return plan_tour(start, end, budget_minutes, filters, category_weights)
+
+def plan_walking_tour_as_dict(start_latitude: float, start_longitude: float, end_latitude: float,
+                              end_longitude: float, budget_minutes: int, filters: Optional[POIFilter] = None,
+                              category_weights: Optional[Dict[str, float]] = None) -> Optional[Dict]:
+    """
+    Plans a walking tour like `plan_walking_tour` and returns it as a dictionary,
+    e.g. for callers that serialize the tool result to JSON.
+
+    Returns:
+        The walking tour (with its stops) as a dictionary, or None if the budget
+        is too small for the walk itself
+    """
+    tour = plan_walking_tour(start_latitude, start_longitude, end_latitude, end_longitude,
+                             budget_minutes, filters, category_weights)
+    return tour.dict() if tour is not None else None
@@ -3,39 +3,75 @@ Tool for planning public transport journeys using static GTFS data.
 
 This module encapsulates all logic for loading, parsing, and querying the GTFS
 dataset for Riga. It provides functionality to find the nearest stops to a given
-coordinate and plan a direct, no-transfer journey between two points.
+coordinate and plan a direct, no-transfer journey between two points, either
+arriving by or departing at a given time, or as a profile of all useful options
+within a departure window.
 
-Note: The current implementation is a simplified proof-of-concept and does not
-handle journeys that require transfers. This is a documented limitation for the
-prototype and a key area for future development.
+Note: The default "merge" engine is a simplified proof-of-concept and does not
+handle journeys that require transfers; the "csa" engine does.
+
+The loaded feed is held in an immutable, versioned `TimetableGeneration`. A new
+feed can be loaded and validated in the background and swapped in atomically
+while queries already running finish on the generation they started with.
+A loader process can also publish its timetable to a shared directory that
+other worker processes attach to read-only (see `shared_timetable`).
+
+`plan_transit_journey` memoizes its results in the planner's `query_cache`.
+A journey only depends on the nearest stops of its endpoints and the query
+minute, so the cache key uses those and every request between the same stops
+shares an entry. Swapping in a new generation clears the cache. The JSON
+encoding of a cached journey is cached as well (`plan_transit_journey_as_json`).
 """
 
+import hashlib
 import os
+import multiprocessing
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
-from math import radians, sin, cos, sqrt, atan2
-from typing import List, Optional
+from functools import wraps
+from typing import List, Optional, Sequence, Tuple
 
+import numpy as np
 import pandas as pd
 
 # We import our validated Pydantic models from the core module. This ensures that
 # any data returned by this tool conforms to our application's standard structure.
+from src.core.cache import QueryCache
+from src.core.geo import GeoPoints, coordinates_distance_km
 from src.core.models import Coordinates, TransitLeg, VehicleType
+from src.core.serialization import dumps, loads
+from src.core.structs import LatLon
+from src.tools.connection_scan import ConnectionScanEngine
+from src.tools.shared_timetable import SHARED_TIMETABLE_DIR, attach_timetable, current_generation_name, publish_timetable
 
 # --- Constants and Configuration ---
 GTFS_DATA_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'gtfs')
 
+# Available journey planning engines:
+# - "merge": direct trips found by merging the denormalized timetable frame.
+# - "csa": Connection Scan Algorithm over a time-sorted connections array,
+#   which also finds journeys with transfers.
+ENGINES = ("merge", "csa")
+DEFAULT_ENGINE = os.getenv("TRANSIT_ENGINE", "merge")
+
+# Stops within this walking distance of a coordinate are used as access points
+# for one-to-all (reachability) searches.
+ACCESS_RADIUS_KM = 0.8
+
+# Walking speed used for access and egress legs (12 mins/km).
+WALKING_SPEED_KMH = 5.0
+
+# Batches with fewer distinct stop pairs than this are planned in-process, as
+# starting a process pool would cost more than it saves.
+BATCH_INLINE_THRESHOLD = 32
+
 # --- Helper Functions ---
 
 def haversine_distance(coord1: Coordinates, coord2: Coordinates) -> float:
     """Calculates the distance in kilometers between two points on Earth."""
-    R = 6371.0
-    lat1, lon1 = radians(coord1.latitude), radians(coord1.longitude)
-    lat2, lon2 = radians(coord2.latitude), radians(coord2.longitude)
-    dlon = lon2 - lon1
-    dlat = lat2 - lat1
-    a = sin(dlat / 2)**2 + cos(lat1) * cos(lat2) * sin(dlon / 2)**2
-    c = 2 * atan2(sqrt(a), sqrt(1 - a))
-    return R * c
+    return coordinates_distance_km(coord1, coord2)
 
 def _map_route_type_to_vehicle(route_type: int) -> VehicleType:
     """Maps GTFS route_type integer to our VehicleType enum for Riga's specific codes."""
@@ -48,6 +84,148 @@ def _map_route_type_to_vehicle(route_type: int) -> VehicleType:
         return VehicleType.TROLLEYBUS
     return VehicleType.BUS  # Default to bus if type is unknown
 
+def _format_td(td: pd.Timedelta) -> str:
+    """Formats a Timedelta since midnight as "HH:MM"."""
+    total_minutes = int(td.total_seconds()) // 60
+    return f"{total_minutes // 60:02d}:{total_minutes % 60:02d}"
+
+def _parse_hhmm(time_str: Optional[str]) -> Optional[pd.Timedelta]:
+    """Parses an "HH:MM" string into a Timedelta since midnight, or None if invalid."""
+    if not time_str:
+        return None
+    try:
+        return pd.to_timedelta(f"{time_str}:00")
+    except ValueError:
+        return None
+
+# --- Timetable Generations ---
+
+def feed_signature(gtfs_dir: str) -> str:
+    """Fingerprints a GTFS directory by the names, sizes and mtimes of its files."""
+    parts = []
+    for filename in sorted(os.listdir(gtfs_dir)):
+        if filename.endswith('.txt'):
+            stat = os.stat(os.path.join(gtfs_dir, filename))
+            parts.append(f"{filename}:{stat.st_size}:{int(stat.st_mtime)}")
+    return "|".join(parts)
+
+class TimetableGeneration:
+    """
+    One loaded version of the GTFS feed.
+
+    A generation is never modified after it is published (apart from lazily
+    building its CSA engine), so queries can keep using it safely while a newer
+    generation replaces it. `readers` counts the queries currently running on it.
+    """
+
+    def __init__(self, version: int, gtfs_dir: Optional[str] = None, signature: Optional[str] = None,
+                 stops_df: Optional[pd.DataFrame] = None, timetable_df: Optional[pd.DataFrame] = None,
+                 csa_engine: Optional[ConnectionScanEngine] = None, shared_name: Optional[str] = None):
+        self.version = version
+        self.gtfs_dir = gtfs_dir
+        self.signature = signature
+        self.shared_name = shared_name
+        self.stops_df = stops_df
+        self.timetable_df = timetable_df
+        self.csa_engine = csa_engine
+        self.loaded_at = datetime.now()
+        self.readers = 0
+        self.lock = threading.Lock()
+        self._stop_points: Optional[GeoPoints] = None
+
+    @property
+    def stop_points(self) -> Optional[GeoPoints]:
+        """The stop coordinates as a GeoPoints set, aligned with the rows of `stops_df`."""
+        if self._stop_points is None and self.stops_df is not None:
+            self._stop_points = GeoPoints(self.stops_df['stop_lat'], self.stops_df['stop_lon'])
+        return self._stop_points
+
+    def validate(self) -> List[str]:
+        """Returns a list of problems that make this generation unfit to serve."""
+        problems = []
+        if self.stops_df is None or self.stops_df.empty:
+            problems.append("no stops loaded")
+        if self.timetable_df is None:
+            # Attached shared generations carry only the connections array.
+            if self.csa_engine is None or self.csa_engine.num_connections == 0:
+                problems.append("timetable is empty")
+        elif self.timetable_df.empty:
+            problems.append("timetable is empty")
+        if not problems:
+            if self.timetable_df is not None:
+                unknown_stops = set(self.timetable_df['stop_id'].unique()) - set(self.stops_df['stop_id'])
+            else:
+                unknown_stops = self.csa_engine.unknown_stop_ids
+            if unknown_stops:
+                problems.append(f"{len(unknown_stops)} stop_ids in stop_times are missing from stops.txt")
+        return problems
+
+def _load_generation(gtfs_dir: str, version: int, engine: str) -> TimetableGeneration:
+    """Loads and pre-processes a GTFS directory into a new generation."""
+    generation = TimetableGeneration(version, gtfs_dir=gtfs_dir)
+    try:
+        generation.signature = feed_signature(gtfs_dir)
+
+        # Load core GTFS files using explicit dtypes for stability
+        stops_path = os.path.join(gtfs_dir, 'stops.txt')
+        stop_times_path = os.path.join(gtfs_dir, 'stop_times.txt')
+        trips_path = os.path.join(gtfs_dir, 'trips.txt')
+        routes_path = os.path.join(gtfs_dir, 'routes.txt')
+        
+        generation.stops_df = pd.read_csv(stops_path, dtype={'stop_id': str})
+        trips_df = pd.read_csv(trips_path, dtype={'route_id': str, 'trip_id': str, 'service_id': str})
+        routes_df = pd.read_csv(routes_path, dtype={'route_id': str})
+
+        if engine == "csa":
+            # The CSA engine only needs the compact connection arrays, so
+            # stop_times is streamed into them and no merged frame is built.
+            generation.csa_engine = ConnectionScanEngine.from_stop_times_csv(
+                stop_times_path, trips_df, routes_df, generation.stops_df)
+            print(f"Successfully loaded GTFS data for {len(routes_df)} routes (generation {version}).")
+            return generation
+
+        stop_times_df = pd.read_csv(stop_times_path, dtype={'trip_id': str, 'stop_id': str})
+
+        # CRITICAL FIX: Properly handle GTFS times that can exceed 23:59:59.
+        # Pandas to_timedelta is the correct and robust way to do this.
+        stop_times_df['arrival_time_td'] = pd.to_timedelta(stop_times_df['arrival_time'])
+        stop_times_df['departure_time_td'] = pd.to_timedelta(stop_times_df['departure_time'])
+        
+        # Create a single, denormalized timetable for efficient lookups.
+        timetable = pd.merge(stop_times_df, trips_df, on='trip_id')
+        generation.timetable_df = pd.merge(timetable, routes_df, on='route_id')
+        
+        print(f"Successfully loaded GTFS data for {len(routes_df)} routes (generation {version}).")
+    except FileNotFoundError as e:
+        print(f"Error: GTFS data file not found. Make sure data is in {gtfs_dir}. Details: {e}")
+    except Exception as e:
+        print(f"An unexpected error occurred while loading GTFS data: {e}")
+    return generation
+
+def _attach_generation(shared_dir: str, version: int, name: Optional[str] = None) -> TimetableGeneration:
+    """Attaches to the timetable currently published in a shared directory (or to the named generation)."""
+    shared = attach_timetable(shared_dir, name)
+    if shared is None:
+        return TimetableGeneration(version)
+    generation = TimetableGeneration(version, signature=shared.signature, stops_df=shared.build_stops_df(),
+                                     csa_engine=shared.build_engine(), shared_name=shared.name)
+    print(f"Attached shared timetable {shared.name} (generation {version}).")
+    return generation
+
+def _pinned(method):
+    """
+    Runs a planner method against a single timetable generation.
+
+    The current generation is pinned for the calling thread on entry, so every
+    data access inside the call (including nested calls) sees the same feed even
+    if a reload swaps in a new generation meanwhile.
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.pin_generation():
+            return method(self, *args, **kwargs)
+    return wrapper
+
 # --- Core Journey Planning Logic ---
 
 class TransitPlanner:
@@ -55,62 +233,250 @@ class TransitPlanner:
     A class to manage the loading of GTFS data and planning of journeys.
 
     Designed as a singleton to load the GTFS data into pandas DataFrames only
-    once at startup for efficient querying.
+    once at startup for efficient querying. The `engine` argument selects how
+    journeys are searched (see ENGINES); the public API is the same for both.
+
+    The data is held in a TimetableGeneration. `reload` builds a new generation
+    from disk, validates it and swaps it in atomically; at most two generations
+    are alive at any time (the current one, plus either the one being built or
+    the retired one still finishing in-flight queries).
+
+    With `shared_dir`, the planner does not load the feed itself but attaches
+    read-only to the timetable a loader process published there with
+    `publish_shared`. Attached planners use the "csa" engine.
     """
     
-    def __init__(self):
+    def __init__(self, engine: str = DEFAULT_ENGINE, shared_dir: Optional[str] = None):
         """Initialize the planner and load GTFS data into memory."""
-        self.stops_df: Optional[pd.DataFrame] = None
-        self.timetable_df: Optional[pd.DataFrame] = None
-        self._load_gtfs_data()
-    
-    def _load_gtfs_data(self):
-        """Loads and pre-processes GTFS data into efficient DataFrames."""
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown transit engine '{engine}'. Expected one of {ENGINES}.")
+        if shared_dir is not None and engine != "csa":
+            raise ValueError("A shared timetable can only be used with the 'csa' engine.")
+        self.engine = engine
+        self.shared_dir = shared_dir
+        self._local = threading.local()
+        self._reload_lock = threading.Lock()
+        # Held to publish a generation and to pin one, so a query never pins a generation already retired.
+        self._swap_lock = threading.Lock()
+        self._retired_drained = threading.Condition()
+        self._retired: Optional[TimetableGeneration] = None
+        # Results of the module-level tool functions, see `plan_transit_journey`.
+        self.query_cache = QueryCache()
+        if shared_dir is not None:
+            self._generation = _attach_generation(shared_dir, version=1)
+        else:
+            self._generation = _load_generation(GTFS_DATA_DIR, version=1, engine=engine)
+
+    @classmethod
+    def attach(cls, shared_dir: str) -> "TransitPlanner":
+        """Creates a planner attached to the timetable published in `shared_dir`."""
+        return cls(engine="csa", shared_dir=shared_dir)
+
+    def __getstate__(self):
+        """Pickles only the current generation, e.g. for the process pools (see `_pool_context`)."""
+        generation = self._current_generation()
+        if self.shared_dir is not None:
+            # The receiving process re-attaches to the same generation instead of copying the arrays.
+            return {'engine': self.engine, 'shared_dir': self.shared_dir, 'shared_name': generation.shared_name}
+        return {'engine': self.engine, 'generation': (
+            generation.version, generation.gtfs_dir, generation.signature,
+            generation.stops_df, generation.timetable_df, generation.csa_engine)}
+
+    def __setstate__(self, state):
+        self.engine = state['engine']
+        self.shared_dir = state.get('shared_dir')
+        self._local = threading.local()
+        self._reload_lock = threading.Lock()
+        self._swap_lock = threading.Lock()
+        self._retired_drained = threading.Condition()
+        self._retired = None
+        self.query_cache = QueryCache()
+        if self.shared_dir is not None:
+            self._generation = _attach_generation(self.shared_dir, version=1, name=state.get('shared_name'))
+        else:
+            self._generation = TimetableGeneration(*state['generation'])
+
+    # --- Generation Handling ---
+
+    def _current_generation(self) -> TimetableGeneration:
+        """The generation pinned by the calling thread, or the latest published one."""
+        return getattr(self._local, 'generation', None) or self._generation
+
+    @contextmanager
+    def pin_generation(self):
+        """
+        Context manager pinning the current generation for the calling thread.
+
+        Yields:
+            The pinned TimetableGeneration.
+        """
+        pinned = getattr(self._local, 'generation', None)
+        if pinned is not None:
+            # Already pinned by an outer call on this thread.
+            yield pinned
+            return
+
+        # Reading the generation and counting the reader under the swap lock means
+        # a reload either sees this reader on the generation it retires or
+        # this query pins the new generation.
+        with self._swap_lock:
+            generation = self._generation
+            with generation.lock:
+                generation.readers += 1
+        self._local.generation = generation
         try:
-            # Load core GTFS files using explicit dtypes for stability
-            stops_path = os.path.join(GTFS_DATA_DIR, 'stops.txt')
-            stop_times_path = os.path.join(GTFS_DATA_DIR, 'stop_times.txt')
-            trips_path = os.path.join(GTFS_DATA_DIR, 'trips.txt')
-            routes_path = os.path.join(GTFS_DATA_DIR, 'routes.txt')
-            
-            self.stops_df = pd.read_csv(stops_path, dtype={'stop_id': str})
-            stop_times_df = pd.read_csv(stop_times_path, dtype={'trip_id': str, 'stop_id': str})
-            trips_df = pd.read_csv(trips_path, dtype={'route_id': str, 'trip_id': str, 'service_id': str})
-            routes_df = pd.read_csv(routes_path, dtype={'route_id': str})
-
-            # CRITICAL FIX: Properly handle GTFS times that can exceed 23:59:59.
-            # Pandas to_timedelta is the correct and robust way to do this.
-            stop_times_df['arrival_time_td'] = pd.to_timedelta(stop_times_df['arrival_time'])
-            
-            # Create a single, denormalized timetable for efficient lookups.
-            timetable = pd.merge(stop_times_df, trips_df, on='trip_id')
-            self.timetable_df = pd.merge(timetable, routes_df, on='route_id')
-            
-            print(f"Successfully loaded GTFS data for {len(routes_df)} routes.")
-        except FileNotFoundError as e:
-            print(f"Error: GTFS data file not found. Make sure data is in {GTFS_DATA_DIR}. Details: {e}")
-        except Exception as e:
-            print(f"An unexpected error occurred while loading GTFS data: {e}")
+            yield generation
+        finally:
+            self._local.generation = None
+            with generation.lock:
+                generation.readers -= 1
+            if generation is self._retired and generation.readers == 0:
+                with self._retired_drained:
+                    self._retired_drained.notify_all()
+
+    @property
+    def version(self) -> int:
+        """Version number of the generation queries currently run against."""
+        return self._current_generation().version
+
+    @property
+    def dataset_version(self) -> str:
+        """Identifies the loaded feed: generation version plus file fingerprint."""
+        generation = self._current_generation()
+        return f"{generation.version}:{generation.signature}"
+
+    @property
+    def content_version(self) -> str:
+        """Identifies the content of the loaded feed across processes and restarts (unlike `version`)."""
+        signature = self._current_generation().signature or ""
+        return hashlib.sha256(signature.encode('utf-8')).hexdigest()[:16]
+
+    @property
+    def stops_df(self) -> Optional[pd.DataFrame]:
+        return self._current_generation().stops_df
+
+    @property
+    def timetable_df(self) -> Optional[pd.DataFrame]:
+        return self._current_generation().timetable_df
+
+    @property
+    def csa_engine(self) -> Optional[ConnectionScanEngine]:
+        return self._current_generation().csa_engine
+
+    def reload(self, gtfs_dir: Optional[str] = None, force: bool = False) -> bool:
+        """
+        Loads a new feed, validates it and atomically swaps it in.
+
+        Queries already running keep using the previous generation until they
+        finish. Before building, this waits for the generation retired by the
+        previous reload to drain, which bounds memory to two generations.
+
+        Attached planners re-attach to the generation currently published in
+        their shared directory instead.
+
+        Args:
+            gtfs_dir: Directory to load from. Defaults to the current feed's directory.
+            force: Reload even if the feed files have not changed.
+
+        Returns:
+            True if a new generation was published, False otherwise.
+        """
+        if self.shared_dir is not None:
+            return self._reattach(force)
+
+        with self._reload_lock:
+            current = self._generation
+            gtfs_dir = gtfs_dir or current.gtfs_dir or GTFS_DATA_DIR
+
+            if not force and current.gtfs_dir == gtfs_dir and current.signature is not None:
+                try:
+                    if feed_signature(gtfs_dir) == current.signature:
+                        print("GTFS feed unchanged; skipping reload.")
+                        return False
+                except OSError as e:
+                    print(f"Error: Cannot read GTFS directory {gtfs_dir}: {e}")
+                    return False
+
+            # Never hold more than two generations: drop the retired one first.
+            with self._retired_drained:
+                while self._retired is not None and self._retired.readers > 0:
+                    self._retired_drained.wait()
+                self._retired = None
+
+            candidate = _load_generation(gtfs_dir, version=current.version + 1, engine=self.engine)
+            problems = candidate.validate()
+            if problems:
+                print(f"Error: Rejected GTFS reload from {gtfs_dir}: {'; '.join(problems)}")
+                return False
+
+            self._swap_in(current, candidate)
+            return True
+
+    def _reattach(self, force: bool) -> bool:
+        """`reload` for attached planners: attaches to a newly published shared generation."""
+        with self._reload_lock:
+            current = self._generation
+            if not force and current.shared_name is not None:
+                if current_generation_name(self.shared_dir) == current.shared_name:
+                    print("Shared timetable unchanged; skipping reload.")
+                    return False
+
+            with self._retired_drained:
+                while self._retired is not None and self._retired.readers > 0:
+                    self._retired_drained.wait()
+                self._retired = None
+
+            candidate = _attach_generation(self.shared_dir, version=current.version + 1)
+            problems = candidate.validate()
+            if problems:
+                print(f"Error: Rejected shared timetable from {self.shared_dir}: {'; '.join(problems)}")
+                return False
+
+            self._swap_in(current, candidate)
+            return True
+
+    def _swap_in(self, current: TimetableGeneration, candidate: TimetableGeneration):
+        """Publishes a validated generation, under the lock `pin_generation` takes."""
+        with self._swap_lock:
+            self._retired = current
+            self._generation = candidate
+        self.query_cache.clear()
+        print(f"Swapped in GTFS generation {candidate.version}.")
+
+    @_pinned
+    def publish_shared(self, shared_dir: str) -> Optional[str]:
+        """
+        Publishes the current timetable to `shared_dir` for attached planners.
+
+        Returns:
+            The name of the published shared generation, or None if no
+            timetable is loaded.
+        """
+        engine = self.get_csa_engine()
+        if engine is None:
+            print("Error: GTFS timetable data is not loaded.")
+            return None
+        return publish_timetable(shared_dir, engine, self.stops_df, self._current_generation().signature)
+
+    def reload_in_background(self, gtfs_dir: Optional[str] = None, force: bool = False) -> threading.Thread:
+        """Starts `reload` on a daemon thread and returns the thread."""
+        thread = threading.Thread(target=self.reload, args=(gtfs_dir, force),
+                                  name="gtfs-reload", daemon=True)
+        thread.start()
+        return thread
 
     def _find_nearest_stop(self, location: Coordinates) -> Optional[dict]:
         """Finds the closest transit stop to a given coordinate."""
-        if self.stops_df is None or self.stops_df.empty:
+        generation = self._current_generation()
+        if generation.stops_df is None or generation.stops_df.empty:
             print("Warning: No stops data available.")
             return None
         
         try:
-            distances = self.stops_df.apply(
-                lambda row: haversine_distance(
-                    location, 
-                    Coordinates(latitude=row['stop_lat'], longitude=row['stop_lon'])
-                ),
-                axis=1
-            )
-            nearest_stop_index = distances.idxmin()
-            nearest_stop = self.stops_df.loc[nearest_stop_index].to_dict()
+            position, nearest_distance = generation.stop_points.nearest(location)
+            nearest_stop = generation.stops_df.iloc[position].to_dict()
             
             # Add distance information for debugging/logging
-            nearest_distance = distances.iloc[nearest_stop_index]
             nearest_stop['distance_km'] = round(nearest_distance, 3)
             
             return nearest_stop
@@ -118,14 +484,14 @@ class TransitPlanner:
             print(f"Error finding nearest stop: {e}")
             return None
 
-    def plan_journey(self, start_coords: Coordinates, end_coords: Coordinates, arrival_time_str: str) -> Optional[List[TransitLeg]]:
-        """
-        Plans a direct, no-transfer journey between two points based on a desired arrival time.
+    def _resolve_stops(self, start_coords: Coordinates, end_coords: Coordinates):
         """
-        if self.timetable_df is None or self.timetable_df.empty:
-            print("Error: GTFS timetable data is not loaded.")
-            return None
+        Finds the nearest stops to the start and end coordinates.
 
+        Returns:
+            A tuple of (start_stop, end_stop) dictionaries, or None if either
+            cannot be found or both resolve to the same stop.
+        """
         # 1. Find nearest stops to start and end coordinates
         start_stop = self._find_nearest_stop(start_coords)
         end_stop = self._find_nearest_stop(end_coords)
@@ -134,16 +500,27 @@ class TransitPlanner:
             print("Error: Could not find nearest stops for the given coordinates.")
             return None
         
-        start_stop_id = start_stop['stop_id']
-        end_stop_id = end_stop['stop_id']
-        
         print(f"Planning journey from '{start_stop['stop_name']}' to '{end_stop['stop_name']}'")
         
         # Handle case where start and end stops are the same
-        if start_stop_id == end_stop_id:
+        if start_stop['stop_id'] == end_stop['stop_id']:
             print("Warning: Start and end stops are the same. No journey needed.")
             return None
-        
+
+        return start_stop, end_stop
+
+    def _find_direct_trips(self, start_stop_id: str, end_stop_id: str) -> Optional[pd.DataFrame]:
+        """
+        Returns all direct trips between two stops.
+
+        The result holds one row per trip serving both stops in the correct
+        direction, with `_start` and `_end` suffixed columns, or None if no such
+        trip exists.
+        """
+        if self.timetable_df is None or self.timetable_df.empty:
+            print("Error: GTFS timetable data is not loaded.")
+            return None
+
         # 2. Find all trips that service BOTH the start and end stop
         trips_at_start = self.timetable_df[self.timetable_df['stop_id'] == start_stop_id]
         trips_at_end = self.timetable_df[self.timetable_df['stop_id'] == end_stop_id]
@@ -159,7 +536,7 @@ class TransitPlanner:
             print("No direct routes found between the selected stops.")
             return None
         
-        # 3. Filter for valid trips: correct direction and time window
+        # 3. Filter for valid trips: correct direction
         # Correct direction: The sequence number at the start stop must be less than at the end stop.
         valid_direction_trips = common_trips[common_trips['stop_sequence_start'] < common_trips['stop_sequence_end']]
         
@@ -167,47 +544,455 @@ class TransitPlanner:
             print("No direct trips found in the correct direction.")
             return None
 
-        # Correct time window: The trip must arrive at the destination *before* the desired arrival time.
-        try:
-            arrival_time_td = pd.to_timedelta(f"{arrival_time_str}:00")
-        except ValueError:
-            print(f"Invalid arrival time format: {arrival_time_str}. Expected HH:MM format.")
-            return None
-            
-        on_time_trips = valid_direction_trips[valid_direction_trips['arrival_time_td_end'] <= arrival_time_td]
+        return valid_direction_trips
 
-        if on_time_trips.empty:
-            print(f"No trips found arriving before {arrival_time_str}.")
-            return None
+    def _select_best_trip(self, trips: pd.DataFrame, query_td: pd.Timedelta,
+                          arrive_by: bool) -> Optional[pd.Series]:
+        """Picks the best direct trip for an arrive-by or depart-at query."""
+        if arrive_by:
+            # Correct time window: The trip must arrive at the destination *before* the desired arrival time.
+            on_time_trips = trips[trips['arrival_time_td_end'] <= query_td]
+            if on_time_trips.empty:
+                print(f"No trips found arriving before {_format_td(query_td)}.")
+                return None
+            # Select the BEST trip: the one that arrives the latest, but still on time.
+            # This minimizes waiting time for the user.
+            return on_time_trips.loc[on_time_trips['arrival_time_td_end'].idxmax()]
 
-        # 4. Select the BEST trip: the one that arrives the latest, but still on time.
-        # This minimizes waiting time for the user.
-        best_trip = on_time_trips.loc[on_time_trips['arrival_time_td_end'].idxmax()]
+        # The trip must leave the start stop no earlier than the requested time.
+        later_trips = trips[trips['departure_time_td_start'] >= query_td]
+        if later_trips.empty:
+            print(f"No trips found departing after {_format_td(query_td)}.")
+            return None
+        # Earliest arrival wins; among equal arrivals prefer the latest departure.
+        ordered = later_trips.sort_values(
+            ['arrival_time_td_end', 'departure_time_td_start'], ascending=[True, False]
+        )
+        return ordered.iloc[0]
 
-        # 5. Format the result into our Pydantic model for a clean, validated output
-        num_stops = int(best_trip['stop_sequence_end'] - best_trip['stop_sequence_start'])
+    def _build_transit_leg(self, trip: pd.Series, start_stop: dict, end_stop: dict) -> Optional[TransitLeg]:
+        """Formats a row of the direct-trip frame into our Pydantic model."""
+        num_stops = int(trip['stop_sequence_end'] - trip['stop_sequence_start'])
         
         try:
-            transit_leg = TransitLeg(
-                vehicle_type=_map_route_type_to_vehicle(best_trip['route_type_start']),
-                route_short_name=str(best_trip['route_short_name_start']),
-                trip_headsign=str(best_trip['trip_headsign_start']),
+            return TransitLeg.model_construct(
+                vehicle_type=_map_route_type_to_vehicle(trip['route_type_start']),
+                route_short_name=str(trip['route_short_name_start']),
+                trip_headsign=str(trip['trip_headsign_start']),
                 start_stop_name=str(start_stop['stop_name']),
                 end_stop_name=str(end_stop['stop_name']),
-                departure_time=str(best_trip['departure_time_start'])[:-3], # Remove seconds for HH:MM format
-                arrival_time=str(best_trip['arrival_time_end'])[:-3], # Remove seconds for HH:MM format
+                departure_time=str(trip['departure_time_start'])[:-3], # Remove seconds for HH:MM format
+                arrival_time=str(trip['arrival_time_end'])[:-3], # Remove seconds for HH:MM format
                 num_stops=num_stops
             )
-            
-            print(f"Found journey: {transit_leg.route_short_name} from {transit_leg.start_stop_name} to {transit_leg.end_stop_name}")
-            
-            # Return as a list to support future multi-leg journey plans
-            return [transit_leg]
-            
         except Exception as e:
             print(f"Error creating TransitLeg model: {e}")
             return None
 
+    @_pinned
+    def plan_journey(self, start_coords: Coordinates, end_coords: Coordinates,
+                     arrival_time_str: Optional[str] = None,
+                     departure_time_str: Optional[str] = None) -> Optional[List[TransitLeg]]:
+        """
+        Plans a direct, no-transfer journey between two points.
+
+        Exactly one of the two time arguments should be given:
+        - `arrival_time_str` ("arrive by"): the trip that arrives the latest while
+          still on time, which minimizes waiting at the destination.
+        - `departure_time_str` ("depart at"): the trip that arrives the earliest
+          among those leaving the start stop at or after the given time.
+        """
+        if arrival_time_str is None and departure_time_str is None:
+            print("Error: Either an arrival time or a departure time is required.")
+            return None
+
+        time_str = arrival_time_str if arrival_time_str is not None else departure_time_str
+        query_td = _parse_hhmm(time_str)
+        if query_td is None:
+            print(f"Invalid time format: {time_str}. Expected HH:MM format.")
+            return None
+
+        stops = self._resolve_stops(start_coords, end_coords)
+        if stops is None:
+            return None
+        start_stop, end_stop = stops
+
+        return self.plan_journey_between_stops(start_stop, end_stop, query_td,
+                                               arrive_by=arrival_time_str is not None)
+
+    @_pinned
+    def journey_cache_key(self, start_coords: Coordinates, end_coords: Coordinates,
+                          arrival_time_str: Optional[str] = None,
+                          departure_time_str: Optional[str] = None) -> Optional[tuple]:
+        """
+        Cache key of a `plan_journey` query: generation, nearest stops, kind and minute.
+
+        Returns:
+            The key, or None if the query is invalid or its stops cannot be resolved.
+        """
+        time_str = arrival_time_str if arrival_time_str is not None else departure_time_str
+        query_td = _parse_hhmm(time_str)
+        if query_td is None:
+            return None
+        start_stop = self._find_nearest_stop(start_coords)
+        end_stop = self._find_nearest_stop(end_coords)
+        if not start_stop or not end_stop:
+            return None
+        return ('journey', self._current_generation().version, str(start_stop['stop_id']),
+                str(end_stop['stop_id']), arrival_time_str is not None, int(query_td.total_seconds()) // 60)
+
+    @_pinned
+    def plan_journey_between_stops(self, start_stop: dict, end_stop: dict, query_td: pd.Timedelta,
+                                   arrive_by: bool, direct_trips: Optional[pd.DataFrame] = None) -> Optional[List[TransitLeg]]:
+        """
+        Plans a journey between two already resolved stops.
+
+        Args:
+            start_stop: The start stop as returned by `_find_nearest_stop`.
+            end_stop: The end stop as returned by `_find_nearest_stop`.
+            query_td: The query time as a Timedelta since midnight.
+            arrive_by: True for an arrive-by query, False for depart-at.
+            direct_trips: Optionally, the precomputed result of `_find_direct_trips`
+                for this stop pair, so callers can share it across queries.
+
+        Returns:
+            A list of TransitLeg models, or None if no journey is found.
+        """
+        if self.engine == "csa":
+            return self._plan_journey_csa(start_stop, end_stop, int(query_td.total_seconds()), arrive_by)
+
+        trips = direct_trips if direct_trips is not None else self._find_direct_trips(start_stop['stop_id'], end_stop['stop_id'])
+        if trips is None:
+            return None
+
+        best_trip = self._select_best_trip(trips, query_td, arrive_by)
+        if best_trip is None:
+            return None
+
+        transit_leg = self._build_transit_leg(best_trip, start_stop, end_stop)
+        if transit_leg is None:
+            return None
+
+        print(f"Found journey: {transit_leg.route_short_name} from {transit_leg.start_stop_name} to {transit_leg.end_stop_name}")
+        
+        # Return as a list to support future multi-leg journey plans
+        return [transit_leg]
+
+    @_pinned
+    def plan_journey_range(self, start_coords: Coordinates, end_coords: Coordinates,
+                           earliest_departure_str: str, latest_departure_str: str) -> Optional[List[List[TransitLeg]]]:
+        """
+        Profile query: all useful journeys departing within a time window.
+
+        Instead of running one depart-at search per minute of the window, this
+        performs a single reverse scan in the spirit of rRAPTOR: candidate trips
+        are visited from the latest departure to the earliest, and a trip is
+        kept only if it arrives strictly earlier than every later-departing trip
+        already kept. The result is the Pareto set of (later departure, earlier
+        arrival) options, ordered by departure time.
+
+        Args:
+            start_coords: The starting point.
+            end_coords: The destination point.
+            earliest_departure_str: Start of the departure window in "HH:MM" format.
+            latest_departure_str: End of the departure window in "HH:MM" format.
+
+        Returns:
+            A list of journeys (each a list of TransitLeg models), or None if no
+            journey departs within the window.
+        """
+        window_start = _parse_hhmm(earliest_departure_str)
+        window_end = _parse_hhmm(latest_departure_str)
+        if window_start is None or window_end is None or window_start > window_end:
+            print(f"Invalid departure window: {earliest_departure_str}-{latest_departure_str}.")
+            return None
+
+        stops = self._resolve_stops(start_coords, end_coords)
+        if stops is None:
+            return None
+        start_stop, end_stop = stops
+
+        if self.engine == "csa":
+            return self._plan_journey_range_csa(start_stop, end_stop,
+                                                int(window_start.total_seconds()),
+                                                int(window_end.total_seconds()))
+
+        trips = self._find_direct_trips(start_stop['stop_id'], end_stop['stop_id'])
+        if trips is None:
+            return None
+
+        in_window = trips[
+            (trips['departure_time_td_start'] >= window_start) &
+            (trips['departure_time_td_start'] <= window_end)
+        ]
+        if in_window.empty:
+            print(f"No trips found departing between {earliest_departure_str} and {latest_departure_str}.")
+            return None
+
+        # Latest departure first; ties broken by earliest arrival so the best one is seen first.
+        ordered = in_window.sort_values(
+            ['departure_time_td_start', 'arrival_time_td_end'], ascending=[False, True]
+        )
+        pareto_rows = []
+        best_arrival = None
+        for _, trip in ordered.iterrows():
+            if best_arrival is None or trip['arrival_time_td_end'] < best_arrival:
+                best_arrival = trip['arrival_time_td_end']
+                pareto_rows.append(trip)
+
+        journeys = []
+        for trip in reversed(pareto_rows):
+            transit_leg = self._build_transit_leg(trip, start_stop, end_stop)
+            if transit_leg is not None:
+                journeys.append([transit_leg])
+
+        print(f"Found {len(journeys)} journey options departing between {earliest_departure_str} and {latest_departure_str}.")
+        return journeys or None
+
+    # --- Connection Scan Engine ---
+
+    @_pinned
+    def get_csa_engine(self) -> Optional[ConnectionScanEngine]:
+        """
+        Returns the CSA engine, building it from the loaded timetable on first use.
+
+        One-to-all queries (travel-time matrices, reachability) need the
+        connections array regardless of which engine plans single journeys.
+        """
+        generation = self._current_generation()
+        with generation.lock:
+            timetable_df = generation.timetable_df
+            if generation.csa_engine is None and timetable_df is not None and not timetable_df.empty:
+                trips_df = timetable_df[['trip_id', 'route_id', 'trip_headsign']].drop_duplicates('trip_id')
+                routes_df = timetable_df[['route_id', 'route_short_name', 'route_type']].drop_duplicates('route_id')
+                generation.csa_engine = ConnectionScanEngine(timetable_df, trips_df, routes_df, generation.stops_df)
+        return generation.csa_engine
+
+    @_pinned
+    def earliest_arrivals_from(self, location: Coordinates, departure_time_str: str,
+                               max_minutes: int = 60,
+                               access_radius_km: float = ACCESS_RADIUS_KM) -> Optional[np.ndarray]:
+        """
+        One-to-all search from a coordinate: the earliest arrival at every stop.
+
+        All stops within `access_radius_km` (or the nearest stop, if none is that
+        close) are seeded with the time needed to walk there, and a single
+        connection scan propagates arrivals up to the time budget.
+
+        Args:
+            location: The starting point.
+            departure_time_str: Departure time in "HH:MM" format.
+            max_minutes: Time budget; stops reached later are left unreached.
+            access_radius_km: Maximum walking distance to an access stop.
+
+        Returns:
+            An int32 array of arrival times (seconds since midnight) aligned with
+            the rows of `stops_df`, with UNREACHED_ARRIVAL for stops not reached,
+            or None if the data is not loaded or the time is invalid.
+        """
+        departure_td = _parse_hhmm(departure_time_str)
+        if departure_td is None:
+            print(f"Invalid time format: {departure_time_str}. Expected HH:MM format.")
+            return None
+        engine = self.get_csa_engine()
+        if engine is None:
+            print("Error: GTFS timetable data is not loaded.")
+            return None
+
+        departure_s = int(departure_td.total_seconds())
+        distances = self._current_generation().stop_points.distances_from(location)
+        access_stops = np.flatnonzero(distances <= access_radius_km)
+        if len(access_stops) == 0:
+            access_stops = np.array([int(np.argmin(distances))])
+
+        walk_s = np.ceil(distances[access_stops] / WALKING_SPEED_KMH * 3600).astype(int)
+        sources = {int(stop): departure_s + int(walk) for stop, walk in zip(access_stops, walk_s)}
+        return engine.earliest_arrivals(sources, departure_s + max_minutes * 60)
+
+    def _csa_stop_indices(self, start_stop: dict, end_stop: dict):
+        """Maps two resolved stops to CSA stop indices."""
+        if self.csa_engine is None:
+            print("Error: CSA engine is not built.")
+            return None
+        return (self.csa_engine.stop_index[str(start_stop['stop_id'])],
+                self.csa_engine.stop_index[str(end_stop['stop_id'])])
+
+    def _csa_journey_to_legs(self, journey) -> Optional[List[TransitLeg]]:
+        """Converts a CSA journey (connection index pairs) into TransitLeg models."""
+        try:
+            legs = []
+            for leg in journey:
+                details = self.csa_engine.leg_details(leg)
+                legs.append(TransitLeg.model_construct(
+                    vehicle_type=_map_route_type_to_vehicle(details['route_type']),
+                    route_short_name=details['route_short_name'],
+                    trip_headsign=details['trip_headsign'],
+                    start_stop_name=details['start_stop_name'],
+                    end_stop_name=details['end_stop_name'],
+                    departure_time=details['departure_time'],
+                    arrival_time=details['arrival_time'],
+                    num_stops=details['num_stops']
+                ))
+            return legs
+        except Exception as e:
+            print(f"Error creating TransitLeg model: {e}")
+            return None
+
+    def _plan_journey_csa(self, start_stop: dict, end_stop: dict,
+                          query_s: int, arrive_by: bool) -> Optional[List[TransitLeg]]:
+        """Plans a journey (possibly with transfers) with a single connection scan."""
+        stops = self._csa_stop_indices(start_stop, end_stop)
+        if stops is None:
+            return None
+        source, target = stops
+
+        if arrive_by:
+            journey = self.csa_engine.latest_departure(source, target, query_s)
+        else:
+            journey = self.csa_engine.earliest_arrival(source, target, query_s)
+
+        if not journey:
+            print("No journey found for the requested time.")
+            return None
+
+        legs = self._csa_journey_to_legs(journey)
+        if legs:
+            print(f"Found journey with {len(legs)} leg(s) from {legs[0].start_stop_name} to {legs[-1].end_stop_name}")
+        return legs
+
+    def _plan_journey_range_csa(self, start_stop: dict, end_stop: dict,
+                                window_start_s: int, window_end_s: int) -> Optional[List[List[TransitLeg]]]:
+        """Profile query over the CSA engine: one backward profile scan for the whole window."""
+        stops = self._csa_stop_indices(start_stop, end_stop)
+        if stops is None:
+            return None
+        source, target = stops
+
+        options = self.csa_engine.profile(source, target, window_start_s, window_end_s)
+        journeys = [legs for legs in (self._csa_journey_to_legs(j) for _, _, j in options) if legs]
+        print(f"Found {len(journeys)} journey options in the departure window.")
+        return journeys or None
+
+    # --- Batch Planning ---
+
+    @_pinned
+    def plan_journeys_batch(self, origins: Sequence[Tuple[float, float]],
+                            destinations: Sequence[Tuple[float, float]],
+                            arrival_times: Optional[Sequence[Optional[str]]] = None,
+                            departure_times: Optional[Sequence[Optional[str]]] = None,
+                            max_workers: Optional[int] = None) -> List[Optional[List[TransitLeg]]]:
+        """
+        Plans many journeys at once, returning results in input order.
+
+        Work is shared across the batch: every distinct coordinate is resolved
+        to its nearest stop only once, and requests are grouped by stop pair so
+        the direct-trip join for a pair is computed once for all its query
+        times. Groups are then fanned out across a process pool.
+
+        Args:
+            origins: (latitude, longitude) pairs of the starting points.
+            destinations: (latitude, longitude) pairs of the ending points.
+            arrival_times: Per-request arrive-by times in "HH:MM" format.
+            departure_times: Per-request depart-at times in "HH:MM" format,
+                used where no arrival time is given.
+            max_workers: Size of the process pool. 1 plans everything in-process.
+
+        Returns:
+            One entry per request: a list of TransitLeg models, or None if no
+            journey was found or the request was invalid.
+        """
+        count = len(origins)
+        if len(destinations) != count:
+            raise ValueError("origins and destinations must have the same length.")
+        arrival_times = list(arrival_times) if arrival_times is not None else [None] * count
+        departure_times = list(departure_times) if departure_times is not None else [None] * count
+        if len(arrival_times) != count or len(departure_times) != count:
+            raise ValueError("Time sequences must have the same length as origins.")
+
+        results: List[Optional[List[TransitLeg]]] = [None] * count
+
+        # 1. Resolve every distinct coordinate to its nearest stop exactly once.
+        nearest_stops = {}
+        def resolve(point):
+            key = (float(point[0]), float(point[1]))
+            if key not in nearest_stops:
+                nearest_stops[key] = self._find_nearest_stop(LatLon(key[0], key[1]))
+            return nearest_stops[key]
+
+        # 2. Group valid requests by stop pair.
+        groups = {}
+        for position in range(count):
+            arrive_by = arrival_times[position] is not None
+            query_td = _parse_hhmm(arrival_times[position] if arrive_by else departure_times[position])
+            if query_td is None:
+                print(f"Skipping batch request {position}: invalid or missing time.")
+                continue
+            start_stop, end_stop = resolve(origins[position]), resolve(destinations[position])
+            if not start_stop or not end_stop or start_stop['stop_id'] == end_stop['stop_id']:
+                continue
+            pair = (start_stop['stop_id'], end_stop['stop_id'])
+            groups.setdefault(pair, (start_stop, end_stop, []))[2].append((position, query_td, arrive_by))
+
+        # 3. Plan each group, fanning out across processes for large batches.
+        tasks = list(groups.values())
+        if max_workers == 1 or len(tasks) < BATCH_INLINE_THRESHOLD:
+            outputs = [self._plan_stop_pair_groups(tasks)]
+        else:
+            workers = max_workers or os.cpu_count() or 1
+            chunk_size = max(1, -(-len(tasks) // (workers * 4)))
+            chunks = [tasks[i:i + chunk_size] for i in range(0, len(tasks), chunk_size)]
+            with ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context(),
+                                     initializer=_init_batch_worker, initargs=(self,)) as pool:
+                outputs = list(pool.map(_run_batch_chunk, chunks))
+
+        for output in outputs:
+            for position, legs in output:
+                results[position] = legs
+        return results
+
+    def _plan_stop_pair_groups(self, groups) -> List[Tuple[int, Optional[List[TransitLeg]]]]:
+        """Plans grouped batch requests, sharing the direct-trip join per stop pair."""
+        planned = []
+        for start_stop, end_stop, requests in groups:
+            direct_trips = None
+            if self.engine == "merge":
+                direct_trips = self._find_direct_trips(start_stop['stop_id'], end_stop['stop_id'])
+                if direct_trips is None:
+                    planned.extend((position, None) for position, _, _ in requests)
+                    continue
+            for position, query_td, arrive_by in requests:
+                legs = self.plan_journey_between_stops(start_stop, end_stop, query_td, arrive_by,
+                                                       direct_trips=direct_trips)
+                planned.append((position, legs))
+        return planned
+
+# --- Process Pool Workers for Batch Planning ---
+
+# The planner each pool worker plans with, unpickled by the pool initializer:
+# attached planners re-attach to the shared memory-mapped timetable (see
+# `TransitPlanner.__getstate__`), others receive a copy of their generation.
+_batch_worker_planner: Optional[TransitPlanner] = None
+
+def _pool_context():
+    """
+    The start method of the process pools: "forkserver" where available, "spawn" otherwise.
+
+    Never "fork": pools are started from the multithreaded app server, and a
+    forked child can deadlock on a lock another thread held at fork time.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+def _init_batch_worker(planner: TransitPlanner):
+    """Process pool initializer: installs the planner used by this worker."""
+    global _batch_worker_planner
+    _batch_worker_planner = planner
+
+def _run_batch_chunk(groups):
+    """Process pool task: plans a chunk of stop-pair groups."""
+    return _batch_worker_planner._plan_stop_pair_groups(groups)
+
 # --- Tool Function for Agent Integration ---
 
 _transit_planner_instance = None
@@ -216,12 +1001,16 @@ def get_transit_planner() -> TransitPlanner:
     """Gets the singleton TransitPlanner instance, creating it if necessary."""
     global _transit_planner_instance
     if _transit_planner_instance is None:
-        _transit_planner_instance = TransitPlanner()
+        if SHARED_TIMETABLE_DIR:
+            _transit_planner_instance = TransitPlanner.attach(SHARED_TIMETABLE_DIR)
+        else:
+            _transit_planner_instance = TransitPlanner()
     return _transit_planner_instance
 
 def plan_transit_journey(start_latitude: float, start_longitude: float, 
                          end_latitude: float, end_longitude: float, 
-                         arrival_time: str) -> Optional[List[TransitLeg]]:
+                         arrival_time: Optional[str] = None,
+                         departure_time: Optional[str] = None) -> Optional[List[TransitLeg]]:
     """
     Main tool function for the LangGraph agent to plan a journey.
     
@@ -233,6 +1022,8 @@ def plan_transit_journey(start_latitude: float, start_longitude: float,
         end_latitude: Latitude of the ending point.
         end_longitude: Longitude of the ending point.
         arrival_time: Desired arrival time in "HH:MM" format (e.g., "14:30").
+        departure_time: Desired departure time in "HH:MM" format, used when
+            no arrival time is given.
         
     Returns:
         A list of TransitLeg models, or None if no direct route is found.
@@ -241,11 +1032,68 @@ def plan_transit_journey(start_latitude: float, start_longitude: float,
     start_coords = Coordinates(latitude=start_latitude, longitude=start_longitude)
     end_coords = Coordinates(latitude=end_latitude, longitude=end_longitude)
 
-    return planner.plan_journey(start_coords, end_coords, arrival_time)
+    def plan():
+        return planner.plan_journey(start_coords, end_coords,
+                                    arrival_time_str=arrival_time,
+                                    departure_time_str=departure_time)
+
+    key = planner.journey_cache_key(start_coords, end_coords, arrival_time, departure_time)
+    if key is None:
+        return plan()
+    journey = planner.query_cache.get_or_compute(key, plan)
+    return list(journey) if journey is not None else None
+
+def plan_transit_journey_range(start_latitude: float, start_longitude: float,
+                               end_latitude: float, end_longitude: float,
+                               earliest_departure: str, latest_departure: str) -> Optional[List[List[TransitLeg]]]:
+    """
+    Tool function returning all useful journey options within a departure window.
+    
+    Powers "leave later" style suggestions with a single profile scan.
+    
+    Args:
+        start_latitude: Latitude of the starting point.
+        start_longitude: Longitude of the starting point.
+        end_latitude: Latitude of the ending point.
+        end_longitude: Longitude of the ending point.
+        earliest_departure: Start of the departure window in "HH:MM" format.
+        latest_departure: End of the departure window in "HH:MM" format.
+        
+    Returns:
+        A list of journeys ordered by departure time, or None if none are found.
+    """
+    planner = get_transit_planner()
+    start_coords = Coordinates(latitude=start_latitude, longitude=start_longitude)
+    end_coords = Coordinates(latitude=end_latitude, longitude=end_longitude)
+
+    return planner.plan_journey_range(start_coords, end_coords, earliest_departure, latest_departure)
+
+def plan_transit_journeys_batch(origins: Sequence[Tuple[float, float]],
+                                destinations: Sequence[Tuple[float, float]],
+                                arrival_times: Optional[Sequence[Optional[str]]] = None,
+                                departure_times: Optional[Sequence[Optional[str]]] = None,
+                                max_workers: Optional[int] = None) -> List[Optional[List[TransitLeg]]]:
+    """
+    Tool function for planning many journeys in one call, e.g. to precompute
+    quests for popular neighbourhood pairs.
+    
+    Args:
+        origins: (latitude, longitude) pairs of the starting points.
+        destinations: (latitude, longitude) pairs of the ending points.
+        arrival_times: Per-request arrive-by times in "HH:MM" format.
+        departure_times: Per-request depart-at times in "HH:MM" format.
+        max_workers: Size of the process pool. 1 plans everything in-process.
+        
+    Returns:
+        A list with one journey (or None) per request, in input order.
+    """
+    planner = get_transit_planner()
+    return planner.plan_journeys_batch(origins, destinations, arrival_times, departure_times, max_workers)
 
 def plan_transit_journey_as_dict(start_latitude: float, start_longitude: float, 
                                 end_latitude: float, end_longitude: float, 
-                                arrival_time: str) -> Optional[List[dict]]:
+                                arrival_time: Optional[str] = None,
+                                departure_time: Optional[str] = None) -> Optional[List[dict]]:
     """
     Legacy function that returns transit legs as dictionaries for backward compatibility.
     
@@ -255,14 +1103,40 @@ def plan_transit_journey_as_dict(start_latitude: float, start_longitude: float,
         end_latitude: Latitude of the ending point.
         end_longitude: Longitude of the ending point.
         arrival_time: Desired arrival time in "HH:MM" format (e.g., "14:30").
+        departure_time: Desired departure time in "HH:MM" format, used when
+            no arrival time is given.
         
     Returns:
         A list containing transit leg dictionaries, or None if no direct route is found.
     """
-    journey_plan = plan_transit_journey(start_latitude, start_longitude, 
-                                      end_latitude, end_longitude, arrival_time)
+    journey_plan = loads(plan_transit_journey_as_json(start_latitude, start_longitude,
+                                                      end_latitude, end_longitude, arrival_time, departure_time))
     
     if journey_plan:
-        return [leg.dict() for leg in journey_plan]
+        return journey_plan
     
-    return None
\ No newline at end of file
+    return None
+
+def plan_transit_journey_as_json(start_latitude: float, start_longitude: float,
+                                 end_latitude: float, end_longitude: float,
+                                 arrival_time: Optional[str] = None,
+                                 departure_time: Optional[str] = None) -> bytes:
+    """
+    Returns the planned journey as UTF-8 JSON, e.g. for prompts and API responses.
+
+    The encoding is cached next to the journey, so repeated queries reuse the bytes.
+
+    Returns:
+        A JSON array of transit legs, or `null` if no route is found.
+    """
+    def encode():
+        return dumps(plan_transit_journey(start_latitude, start_longitude, end_latitude, end_longitude,
+                                          arrival_time, departure_time))
+
+    planner = get_transit_planner()
+    key = planner.journey_cache_key(Coordinates(latitude=start_latitude, longitude=start_longitude),
+                                    Coordinates(latitude=end_latitude, longitude=end_longitude),
+                                    arrival_time, departure_time)
+    if key is None:
+        return encode()
+    return planner.query_cache.get_or_compute(('json',) + key, encode)
\ No newline at end of file
@@ -0,0 +1,270 @@
+"""
+Tool for computing many-to-many travel-time matrices between POIs or stops.
+
+For quest composition we need to know how long it takes to get from every POI
+to every other POI at a given time of day, e.g. "which museums are within 20
+minutes of this park". Instead of planning one journey per pair, the matrix is
+filled row by row with one-to-all searches over the CSA connections array:
+one scan per origin gives the arrival time at every stop at once.
+
+Each entry combines walking to the origin's nearest stop, the transit ride,
+and walking from the destination's nearest stop, and falls back to walking
+directly when that is faster. Results are stored as whole minutes in a compact
+uint16 array and can be saved to and loaded from disk for reuse; a saved
+matrix records the feed and the coordinates it was computed from, so it is
+not reused once either changes.
+"""
+
+import hashlib
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.core.geo import GeoPoints
+from src.core.models import POI, Coordinates
+from src.core.structs import LatLon
+from src.tools.connection_scan import UNREACHED_ARRIVAL
+from src.tools.transit_planner import WALKING_SPEED_KMH, TransitPlanner, get_transit_planner, _parse_hhmm, _pool_context
+
+# --- Constants and Configuration ---
+
+# Sentinel stored in the uint16 matrix for pairs not reachable within the horizon.
+UNREACHABLE_MINUTES = np.iinfo(np.uint16).max
+
+# Default search horizon in minutes; longer journeys are reported as unreachable.
+DEFAULT_MAX_MINUTES = 120
+
+# --- Matrix Container ---
+
+class TravelTimeMatrix:
+    """
+    A square travel-time matrix in whole minutes, with labelled rows/columns.
+
+    `minutes[i, j]` is the travel time from `ids[i]` to `ids[j]` when leaving at
+    `departure_time`, or UNREACHABLE_MINUTES. `feed_version` and
+    `coordinates_digest` identify the GTFS feed and the locations the matrix
+    was computed from (empty if unknown).
+    """
+
+    def __init__(self, ids: Sequence[str], minutes: np.ndarray, departure_time: str, max_minutes: int,
+                 feed_version: str = "", coordinates_digest: str = ""):
+        self.ids: List[str] = list(ids)
+        self.minutes = minutes.astype(np.uint16, copy=False)
+        self.departure_time = departure_time
+        self.max_minutes = max_minutes
+        self.feed_version = feed_version
+        self.coordinates_digest = coordinates_digest
+        self._index = {item_id: i for i, item_id in enumerate(self.ids)}
+
+    def travel_time(self, from_id: str, to_id: str) -> Optional[int]:
+        """Returns the travel time in minutes between two ids, or None if unreachable."""
+        value = int(self.minutes[self._index[from_id], self._index[to_id]])
+        return None if value == UNREACHABLE_MINUTES else value
+
+    def reachable_from(self, from_id: str, max_minutes: int) -> List[Tuple[str, int]]:
+        """Lists (id, minutes) of all other entries reachable within a budget, closest first."""
+        row = self.minutes[self._index[from_id]]
+        candidates = np.flatnonzero(row <= max_minutes)
+        reachable = [(self.ids[j], int(row[j])) for j in candidates if self.ids[j] != from_id]
+        reachable.sort(key=lambda item: item[1])
+        return reachable
+
+    def save(self, path: str):
+        """Persists the matrix and its labels to a compressed .npz file."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Write under a temporary name first so readers never see a partial file.
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(
+                f,
+                minutes=self.minutes,
+                ids=np.array(self.ids, dtype=str),
+                departure_time=np.array(self.departure_time),
+                max_minutes=np.array(self.max_minutes),
+                feed_version=np.array(self.feed_version),
+                coordinates_digest=np.array(self.coordinates_digest),
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "TravelTimeMatrix":
+        """Loads a matrix previously written with `save`."""
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                ids=data['ids'].tolist(),
+                minutes=data['minutes'],
+                departure_time=str(data['departure_time']),
+                max_minutes=int(data['max_minutes']),
+                # Matrices saved before these were recorded match no feed.
+                feed_version=str(data['feed_version']) if 'feed_version' in data.files else "",
+                coordinates_digest=str(data['coordinates_digest']) if 'coordinates_digest' in data.files else "",
+            )
+
+# --- Matrix Computation ---
+
+def coordinates_digest(coordinates: Sequence[Coordinates]) -> str:
+    """Hash of a sequence of coordinates, to tell whether a saved matrix covers the same locations."""
+    values = np.array([(coords.latitude, coords.longitude) for coords in coordinates], dtype=np.float64)
+    return hashlib.sha256(values.tobytes()).hexdigest()[:16]
+
+class _MatrixPoint:
+    """An origin/destination of the matrix: its location and nearest stop."""
+
+    def __init__(self, coordinates: Coordinates, stop_index: Optional[int], walk_s: int):
+        self.coordinates = coordinates
+        self.stop_index = stop_index
+        self.walk_s = walk_s
+
+def _walking_seconds(distance_km: float) -> int:
+    """Converts a walking distance into whole seconds at WALKING_SPEED_KMH."""
+    return int(math.ceil(distance_km / WALKING_SPEED_KMH * 3600))
+
+def _points_for_coordinates(planner: TransitPlanner, coordinates: Sequence[Coordinates]) -> List[_MatrixPoint]:
+    """Attaches each coordinate to its nearest stop in the CSA index."""
+    engine = planner.get_csa_engine()
+    points = []
+    for coords in coordinates:
+        stop = planner._find_nearest_stop(coords)
+        if stop is None or engine is None:
+            points.append(_MatrixPoint(coords, None, 0))
+            continue
+        points.append(_MatrixPoint(coords, engine.stop_index[str(stop['stop_id'])],
+                                   _walking_seconds(stop['distance_km'])))
+    return points
+
+def _compute_row(planner: TransitPlanner, points: List[_MatrixPoint], origin: int,
+                 departure_s: int, max_minutes: int, geo_points: Optional[GeoPoints] = None) -> np.ndarray:
+    """Fills one matrix row with a single one-to-all search from the origin."""
+    source = points[origin]
+    horizon_s = departure_s + max_minutes * 60
+    geo_points = geo_points or GeoPoints.from_coordinates(point.coordinates for point in points)
+
+    # Walking directly to every destination at once.
+    walk_km = geo_points.distances_from(source.coordinates)
+    best_s = np.ceil(walk_km / WALKING_SPEED_KMH * 3600)
+
+    engine = planner.get_csa_engine()
+    if engine is not None and source.stop_index is not None:
+        arrivals = engine.earliest_arrivals({source.stop_index: departure_s + source.walk_s}, horizon_s)
+        for j, destination in enumerate(points):
+            if destination.stop_index is None:
+                continue
+            stop_arrival = int(arrivals[destination.stop_index])
+            if stop_arrival != UNREACHED_ARRIVAL:
+                best_s[j] = min(best_s[j], stop_arrival + destination.walk_s - departure_s)
+
+    best_s[origin] = 0
+    row = np.full(len(points), UNREACHABLE_MINUTES, dtype=np.uint16)
+    in_horizon = best_s <= max_minutes * 60
+    row[in_horizon] = np.ceil(best_s[in_horizon] / 60).astype(np.uint16)
+    return row
+
+# State installed in each pool worker by the initializer (see `_pool_context`).
+_worker_state: Optional[tuple] = None
+
+def _init_matrix_worker(planner: TransitPlanner, points: List[_MatrixPoint], departure_s: int, max_minutes: int):
+    """Process pool initializer: installs the planner and matrix points."""
+    global _worker_state
+    _worker_state = (planner, points, departure_s, max_minutes)
+
+def _compute_rows(origins: List[int]) -> List[np.ndarray]:
+    """Process pool task: computes a chunk of matrix rows."""
+    planner, points, departure_s, max_minutes = _worker_state
+    geo_points = GeoPoints.from_coordinates(point.coordinates for point in points)
+    return [_compute_row(planner, points, origin, departure_s, max_minutes, geo_points) for origin in origins]
+
+def compute_travel_matrix(ids: Sequence[str], coordinates: Sequence[Coordinates], departure_time: str,
+                          max_minutes: int = DEFAULT_MAX_MINUTES, planner: Optional[TransitPlanner] = None,
+                          max_workers: Optional[int] = None) -> TravelTimeMatrix:
+    """
+    Computes the travel-time matrix between arbitrary labelled locations.
+
+    Args:
+        ids: Labels for the rows and columns.
+        coordinates: The location of each id.
+        departure_time: Departure time slot in "HH:MM" format.
+        max_minutes: Search horizon; slower pairs are marked unreachable.
+        planner: The TransitPlanner to use. Defaults to the shared singleton.
+        max_workers: Size of the process pool. 1 computes all rows in-process.
+
+    Returns:
+        A TravelTimeMatrix with one row per origin.
+    """
+    if len(ids) != len(coordinates):
+        raise ValueError("ids and coordinates must have the same length.")
+    departure_td = _parse_hhmm(departure_time)
+    if departure_td is None:
+        raise ValueError(f"Invalid departure time: {departure_time}. Expected HH:MM format.")
+    if max_minutes >= UNREACHABLE_MINUTES:
+        raise ValueError(f"max_minutes must be below {UNREACHABLE_MINUTES}.")
+
+    planner = planner or get_transit_planner()
+    feed_version = planner.content_version
+    departure_s = int(departure_td.total_seconds())
+    points = _points_for_coordinates(planner, coordinates)
+
+    origins = list(range(len(points)))
+    if max_workers == 1 or len(origins) < 2:
+        geo_points = GeoPoints.from_coordinates(point.coordinates for point in points)
+        rows = [_compute_row(planner, points, origin, departure_s, max_minutes, geo_points) for origin in origins]
+    else:
+        workers = max_workers or os.cpu_count() or 1
+        chunk_size = max(1, -(-len(origins) // (workers * 4)))
+        chunks = [origins[i:i + chunk_size] for i in range(0, len(origins), chunk_size)]
+        with ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context(), initializer=_init_matrix_worker,
+                                 initargs=(planner, points, departure_s, max_minutes)) as pool:
+            rows = [row for chunk_rows in pool.map(_compute_rows, chunks) for row in chunk_rows]
+
+    minutes = np.vstack(rows) if rows else np.zeros((0, 0), dtype=np.uint16)
+    print(f"Computed {len(ids)}x{len(ids)} travel-time matrix for departure at {departure_time}.")
+    return TravelTimeMatrix(ids, minutes, departure_time, max_minutes,
+                            feed_version=feed_version, coordinates_digest=coordinates_digest(coordinates))
+
+def compute_poi_travel_matrix(pois: Sequence[POI], departure_time: str, **kwargs) -> TravelTimeMatrix:
+    """Computes the POI x POI travel-time matrix, labelled by `poi_id`."""
+    return compute_travel_matrix([poi.poi_id for poi in pois], [poi.coordinates for poi in pois],
+                                 departure_time, **kwargs)
+
+def compute_stop_travel_matrix(stop_ids: Sequence[str], departure_time: str,
+                               planner: Optional[TransitPlanner] = None, **kwargs) -> TravelTimeMatrix:
+    """Computes the stop x stop travel-time matrix, labelled by GTFS `stop_id`."""
+    planner = planner or get_transit_planner()
+    stops = planner.stops_df.set_index(planner.stops_df['stop_id'].astype(str))
+    coordinates = [
+        LatLon(float(stops.at[stop_id, 'stop_lat']), float(stops.at[stop_id, 'stop_lon']))
+        for stop_id in stop_ids
+    ]
+    return compute_travel_matrix(list(stop_ids), coordinates, departure_time, planner=planner, **kwargs)
+
+def load_or_compute_poi_travel_matrix(path: str, pois: Sequence[POI], departure_time: str,
+                                      max_minutes: int = DEFAULT_MAX_MINUTES, **kwargs) -> TravelTimeMatrix:
+    """
+    Loads a persisted POI matrix if it matches the request, otherwise computes
+    and saves it.
+
+    A saved matrix is reused only if it was built for the same POI ids and
+    coordinates, departure time and horizon, from the same GTFS feed as the
+    planner's (see `TransitPlanner.content_version`).
+    """
+    planner = kwargs.pop('planner', None) or get_transit_planner()
+    poi_ids = [poi.poi_id for poi in pois]
+    if os.path.exists(path):
+        try:
+            matrix = TravelTimeMatrix.load(path)
+            if (matrix.ids == poi_ids and matrix.departure_time == departure_time
+                    and matrix.max_minutes == max_minutes
+                    and matrix.feed_version == planner.content_version
+                    and matrix.coordinates_digest == coordinates_digest([poi.coordinates for poi in pois])):
+                return matrix
+            print(f"Travel matrix at {path} is stale; recomputing.")
+        except Exception as e:
+            print(f"Warning: Failed to load travel matrix from {path}: {e}")
+
+    matrix = compute_poi_travel_matrix(pois, departure_time, max_minutes=max_minutes, planner=planner, **kwargs)
+    matrix.save(path)
+    return matrix
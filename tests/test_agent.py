@@ -9,7 +9,8 @@ actual LLM service.
 
 import pytest
 import json
-from typing import Dict, Any
+import sqlite3
+from typing import Any, Dict, List, Tuple
 from unittest.mock import MagicMock, patch
 from dotenv import load_dotenv
 
@@ -17,12 +18,25 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from src.agent.graph import get_agent_runnable, llm as original_llm
+from src.agent.checkpoints import SqliteFailedThreads, stream_with_resume
+from src.agent.dispatcher import DispatcherTimeout, Lane, LLMDispatcher
+from src.agent.llm import FakeLLM, LazyLLM, get_llm
+from src.agent.warmup import is_ready, warm_up
 from src.core.models import Quest, Coordinates, TransitLeg, WalkingLeg, VehicleType
+from src.core.quest_store import QuestStore
 
 # Mark all tests in this file as integration tests.
 # You can run only unit tests with `pytest -m "not integration"`.
 pytestmark = pytest.mark.integration
 
+@pytest.fixture(autouse=True)
+def isolated_quest_store(tmp_path, monkeypatch):
+    """Gives every test an empty quest store, so stored quests do not leak between tests."""
+    store = QuestStore(str(tmp_path / "quests.sqlite3"))
+    monkeypatch.setattr("src.core.quest_store._quest_store_instance", store)
+    yield store
+    store.close()
+
 @pytest.fixture(scope="module")
 def agent_runnable():
     """Fixture to compile the agent runnable once for all tests in this module."""
@@ -41,6 +55,59 @@ def run_graph_with_final_state(agent, initial_state) -> Dict[str, Any]:
     assert isinstance(final_state, dict), f"Expected dict, got {type(final_state)}"
     return final_state
 
+def run_graph_with_merged_state(agent, initial_state) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Helper function to run the graph and return the state merged from every
+    node's update, together with the names of the nodes that ran.
+    """
+    state, nodes = dict(initial_state), []
+    for state_update in agent.stream(initial_state):
+        for node, update in state_update.items():
+            nodes.append(node)
+            state.update(update or {})
+    if not nodes:
+        pytest.fail("Agent failed to produce any state updates")
+    return state, nodes
+
+@pytest.fixture
+def mock_transit_network(tmp_path, monkeypatch):
+    """
+    Creates a small GTFS network with a bus between Old Town and Purvciems in
+    both directions and installs it as the shared transit planner.
+    """
+    from src.tools import transit_planner
+
+    gtfs_dir = tmp_path / "gtfs"
+    gtfs_dir.mkdir()
+    stops_txt = (
+        "stop_id,stop_name,stop_lat,stop_lon\n"
+        "stop_O,Old Town,56.9496,24.1052\n"
+        "stop_M,Teika,56.9570,24.1500\n"
+        "stop_P,Purvciems,56.9634,24.1953"
+    )
+    routes_txt = "route_id,route_short_name,route_type\nroute_1,3,3"
+    trips_txt = (
+        "route_id,service_id,trip_id,trip_headsign\n"
+        "route_1,weekday,out_1,Purvciems\nroute_1,weekday,out_2,Purvciems\n"
+        "route_1,weekday,in_1,Old Town\nroute_1,weekday,in_2,Old Town"
+    )
+    stop_times_txt = (
+        "trip_id,arrival_time,departure_time,stop_id,stop_sequence\n"
+        "out_1,13:00:00,13:00:00,stop_O,1\nout_1,13:10:00,13:10:00,stop_M,2\nout_1,13:20:00,13:20:00,stop_P,3\n"
+        "out_2,15:00:00,15:00:00,stop_O,1\nout_2,15:10:00,15:10:00,stop_M,2\nout_2,15:20:00,15:20:00,stop_P,3\n"
+        "in_1,13:15:00,13:15:00,stop_P,1\nin_1,13:25:00,13:25:00,stop_M,2\nin_1,13:35:00,13:35:00,stop_O,3\n"
+        "in_2,15:15:00,15:15:00,stop_P,1\nin_2,15:25:00,15:25:00,stop_M,2\nin_2,15:35:00,15:35:00,stop_O,3"
+    )
+    (gtfs_dir / "stops.txt").write_text(stops_txt)
+    (gtfs_dir / "routes.txt").write_text(routes_txt)
+    (gtfs_dir / "trips.txt").write_text(trips_txt)
+    (gtfs_dir / "stop_times.txt").write_text(stop_times_txt)
+
+    monkeypatch.setattr(transit_planner, "GTFS_DATA_DIR", str(gtfs_dir))
+    planner = transit_planner.TransitPlanner()
+    monkeypatch.setattr(transit_planner, "_transit_planner_instance", planner)
+    return planner
+
 def test_efficiency_path_is_correct(agent_runnable):
     """
     Tests the 'EFFICIENCY' path. This path should NOT call the final synthesis LLM
@@ -253,6 +320,42 @@ def test_poi_retrieval_nodes(agent_runnable):
                 assert "poi_id" in poi
                 assert "title" in poi
 
+def test_area_pois_are_found_in_one_batch(monkeypatch):
+    """The start and destination POIs come from a single batch query."""
+    from src.agent.graph import KNOWN_LOCATIONS, find_end_area_pois, find_start_area_pois
+    from src.tools import poi_retriever
+
+    batches = []
+    batch = poi_retriever.retrieve_nearby_pois_batch_as_json
+    monkeypatch.setattr(poi_retriever, "retrieve_nearby_pois_batch_as_json",
+                        lambda points, **kwargs: batches.append(list(points)) or batch(points, **kwargs))
+    monkeypatch.setattr(poi_retriever, "retrieve_nearby_pois_as_dict", MagicMock(side_effect=AssertionError))
+    state = {"start_coords": KNOWN_LOCATIONS["old town"], "end_coords": KNOWN_LOCATIONS["purvciems"]}
+
+    update = find_start_area_pois(state)
+    assert len(batches) == 1 and len(batches[0]) == 2
+    assert isinstance(update["start_area_pois"], list) and isinstance(update["end_area_pois"], list)
+    assert find_end_area_pois({**state, **update}) == {}
+
+def test_prompt_reuses_the_cached_tool_json(monkeypatch, mock_transit_network):
+    """The synthesis prompt quotes the tools' cached JSON instead of encoding the state again."""
+    from src.agent import graph
+    from src.tools import poi_retriever, transit_planner
+    state = {"start_coords": graph.KNOWN_LOCATIONS["old town"], "end_coords": graph.KNOWN_LOCATIONS["purvciems"],
+             "arrival_time": "15:30", "departure_time": None}
+    state.update(graph.plan_transit_route(state))
+    state.update(graph.find_start_area_pois(state))
+
+    def no_encoding(value):
+        raise AssertionError("encoded again")
+    monkeypatch.setattr(poi_retriever, "dumps", no_encoding)
+    monkeypatch.setattr(transit_planner, "dumps", no_encoding)
+    transit_plan, start_pois, end_pois = graph._prompt_json(state)
+
+    assert json.loads(transit_plan) == state["transit_plan"]
+    assert json.loads(start_pois) == state["start_area_pois"]
+    assert json.loads(end_pois) == state["end_area_pois"]
+
 def test_transit_planning_node(agent_runnable):
     """
     Tests that the transit planning node returns valid transit data.
@@ -396,4 +499,209 @@ def test_state_progression_discovery_path(agent_runnable, monkeypatch):
     assert final_state.get("start_area_pois") is not None
     assert final_state.get("end_area_pois") is not None
     assert final_state.get("final_quest") is not None
-    assert final_state.get("final_response") is not None
\ No newline at end of file
+    assert final_state.get("final_response") is not None
+
+def test_fake_llm_provider_runs_without_credentials(agent_runnable, monkeypatch, mock_transit_network):
+    """The local fake backend parses the request offline and answers with canned quests."""
+    quest_json = Quest(title="Offline Quest", description="No network needed.", legs=[],
+                       total_duration_minutes=20).json()
+    fake_llm = FakeLLM(responses=[quest_json])
+    monkeypatch.setattr(get_llm(), "_client", fake_llm)
+
+    final_state, _ = run_graph_with_merged_state(
+        agent_runnable, {"original_user_request": "Show me a journey from Old Town to Purvciems, arriving at 15:30"})
+
+    assert final_state.get("start_coords") is not None
+    assert final_state.get("end_coords") is not None
+    assert final_state.get("arrival_time") == "15:30"
+    assert final_state.get("transit_plan")[0]["departure_time"] == "15:00"
+    assert final_state.get("final_quest").title == "Offline Quest"
+    assert len(fake_llm.prompts) == 2  # Request parsing and quest synthesis
+
+def test_llm_client_is_created_lazily():
+    """Importing the graph does not create an LLM client; it is created on first use."""
+    created = []
+    lazy = LazyLLM(lambda: created.append(True) or FakeLLM(responses=["hello"]))
+    structured = lazy.with_structured_output(Quest)
+
+    assert not lazy.is_loaded and not created
+    assert lazy.invoke("hi").content == "hello"
+    assert lazy.is_loaded and len(created) == 1
+    assert isinstance(original_llm, LazyLLM)
+    assert structured.schema is Quest
+
+def test_warm_up_loads_data_and_sets_readiness(monkeypatch):
+    """The warm-up runs every step and marks the worker ready."""
+    fake_llm = FakeLLM(responses=["OK"])
+    monkeypatch.setattr(get_llm(), "_client", fake_llm)
+
+    timings = warm_up(ping_llm=True)
+
+    assert set(timings) == {"transit_data", "poi_data", "journeys", "nearby_pois", "llm"}
+    assert is_ready()
+    assert fake_llm.prompts == ["Reply with OK."]
+
+def test_llm_dispatcher_admits_by_lane_and_retries_transient_errors():
+    """Queued calls are admitted efficiency lane first; transient failures are retried."""
+    import threading, time
+    gate, order = threading.Event(), []
+
+    class BlockingLLM:
+        def invoke(self, prompt):
+            gate.wait(5)
+            order.append(prompt)
+            return prompt
+
+    dispatcher = LLMDispatcher(max_in_flight=1, rate_per_second=0, max_retries=0)
+    threads = [threading.Thread(target=dispatcher.invoke, args=(BlockingLLM(), "running"))]
+    threads[0].start()
+    time.sleep(0.05)
+    for prompt, lane in [("discovery", Lane.DISCOVERY), ("efficiency", Lane.EFFICIENCY)]:
+        threads.append(threading.Thread(target=dispatcher.invoke, args=(BlockingLLM(), prompt), kwargs={"lane": lane}))
+        threads[-1].start()
+        time.sleep(0.05)
+    assert dispatcher.stats()['queue_depth'] == 2
+    gate.set()
+    for thread in threads:
+        thread.join()
+    assert order == ["running", "efficiency", "discovery"]
+
+    attempts = []
+    class RateLimitedLLM:
+        def invoke(self, prompt):
+            attempts.append(prompt)
+            if len(attempts) < 3:
+                raise RuntimeError("429 Resource exhausted")
+            return "ok"
+    retrying = LLMDispatcher(rate_per_second=0, max_retries=2, sleep=lambda seconds: None)
+    assert retrying.invoke(RateLimitedLLM(), "prompt") == "ok"
+    assert retrying.stats()['retries'] == 2
+
+    class SlowLLM:
+        def invoke(self, prompt):
+            time.sleep(0.2)
+            return prompt
+    with pytest.raises(DispatcherTimeout):
+        LLMDispatcher(rate_per_second=0, call_timeout_s=0.01, max_retries=0).invoke(SlowLLM(), "slow")
+
+def test_coalescing_key_and_personalized_copy():
+    """Only requests with the same normalized text and journey share a quest; each gets its own copy."""
+    from src.agent.graph import KNOWN_LOCATIONS, journey_key, personalize_quest
+    journey = {"start_coords": KNOWN_LOCATIONS["old town"], "end_coords": KNOWN_LOCATIONS["purvciems"],
+               "arrival_time": "15:30", "departure_time": None, "intent": "DISCOVERY"}
+    key = journey_key({**journey, "original_user_request": "From Old Town to Purvciems by 15:30"})
+
+    assert journey_key({**journey, "original_user_request": "  from old town to  purvciems by 15:30! "}) == key
+    assert journey_key({**journey, "original_user_request": "Old Town to Purvciems with art, by 15:30"}) != key
+
+    shared = Quest(title="Shared Quest", description="One synthesis.", legs=[
+        WalkingLeg(start_location_name="Start", end_location_name="Stop", duration_minutes=5,
+                   distance_meters=400, instructions="Walk to the stop.", pois=[])], total_duration_minutes=5)
+    quest, response = personalize_quest(shared, journey)
+    assert quest == shared and quest is not shared and quest.legs[0] is not shared.legs[0]
+    assert "Quest: Shared Quest" in response and "Walk (5 mins)" in response
+
+def test_discovery_is_downgraded_when_llm_is_overloaded(agent_runnable, monkeypatch, mock_transit_network):
+    """Under load, DISCOVERY requests skip quest synthesis and say they were degraded."""
+    clock = [0.0]
+    dispatcher = LLMDispatcher(rate_per_second=0, shed_p95_budget_s=5, clock=lambda: clock[0])
+    for latency in [1.0] * 5 + [9.0] * 5:
+        dispatcher.latency.add(latency)
+    assert "p95" in dispatcher.overload()
+    clock[0] += 120  # The slow calls leave the sliding window.
+    assert dispatcher.overload() is None
+    for latency in [9.0] * 10:
+        dispatcher.latency.add(latency)
+
+    fake_llm = FakeLLM()
+    monkeypatch.setattr(get_llm(), "_client", fake_llm)
+    monkeypatch.setattr("src.agent.graph.get_dispatcher", lambda: dispatcher)
+    final_state, nodes = run_graph_with_merged_state(
+        agent_runnable, {"original_user_request": "I want to go from Purvciems to Old Town"})
+
+    assert final_state.get("intent") == "DISCOVERY"
+    assert nodes[-2:] == ["plan_transit_route", "format_simple_response"]
+    assert "synthesize_quest" not in nodes
+    assert final_state.get("final_quest") is None
+    assert "p95" in final_state.get("degraded")
+    assert "Efficient Route:" in final_state.get("final_response", "")
+    assert "quick route" in final_state.get("final_response", "")
+    assert len(fake_llm.prompts) == 1  # Only the request parsing reached the LLM
+
+    # Without overload the same request takes the discovery path.
+    quest_json = Quest(title="Full Quest", description="Not shed.", legs=[], total_duration_minutes=20).json()
+    monkeypatch.setattr(get_llm(), "_client", FakeLLM(responses=[quest_json]))
+    monkeypatch.setattr("src.agent.graph.get_dispatcher",
+                        lambda: LLMDispatcher(rate_per_second=0, shed_p95_budget_s=5))
+    final_state, nodes = run_graph_with_merged_state(
+        agent_runnable, {"original_user_request": "I want to go from Purvciems to Old Town"})
+
+    assert nodes[-1] == "synthesize_quest"
+    assert final_state.get("degraded") is None
+    assert final_state.get("final_quest").title == "Full Quest"
+
+def test_repeated_quest_is_served_from_the_store(agent_runnable, monkeypatch, isolated_quest_store,
+                                                mock_transit_network):
+    """A second request for the same commute reuses the stored quest instead of calling the LLM."""
+    quest_json = Quest(title="Stored Quest", description="Generated once.", legs=[],
+                       total_duration_minutes=20).json()
+    fake_llm = FakeLLM(responses=[quest_json])
+    monkeypatch.setattr(get_llm(), "_client", fake_llm)
+    request = "Show me a journey from Old Town to Purvciems, arriving at 15:30"
+
+    first, _ = run_graph_with_merged_state(agent_runnable, {"original_user_request": request})
+    assert first.get("final_quest").title == "Stored Quest"
+    assert len(fake_llm.prompts) == 2  # Parse and synthesis
+    assert isolated_quest_store.stats()['hits'] == 0
+    assert len(isolated_quest_store) == 1
+
+    second, _ = run_graph_with_merged_state(agent_runnable, {"original_user_request": request})
+    assert second.get("transit_plan") == first.get("transit_plan")
+    assert second.get("final_quest").title == "Stored Quest"
+    assert len(fake_llm.prompts) == 3  # Only the second parse; no second synthesis
+    assert isolated_quest_store.stats()['hits'] == 1
+
+    # Another trip of the same stops is not served the stored quest.
+    third, _ = run_graph_with_merged_state(
+        agent_runnable, {"original_user_request": "Show me a journey from Old Town to Purvciems, arriving at 13:30"})
+    assert third.get("transit_plan")[0]["departure_time"] == "13:00"
+    assert len(fake_llm.prompts) == 5
+    assert isolated_quest_store.stats()['hits'] == 1
+    assert len(isolated_quest_store) == 2
+
+def test_failed_synthesis_is_resumed_from_checkpoint(monkeypatch, mock_transit_network):
+    """A retry after a failed synthesis reuses the checkpointed plan and POIs and only re-runs synthesis."""
+    from langgraph.checkpoint.memory import MemorySaver
+    agent = get_agent_runnable(checkpointer=MemorySaver())
+    quest_json = Quest(title="Resumed Quest", description="Second try.", legs=[],
+                       total_duration_minutes=20).json()
+    fake_llm = FakeLLM(responses=["not json", quest_json])
+    monkeypatch.setattr(get_llm(), "_client", fake_llm)
+    request = "Show me a journey from Old Town to Purvciems, arriving at 15:30"
+
+    first = list(stream_with_resume(agent, request, "retry-request"))
+    assert "synthesize_quest" in first[-1]
+    assert first[-1]["synthesize_quest"]["failed_node"] == "synthesize_quest"
+
+    second = list(stream_with_resume(agent, request, "retry-request"))
+    assert [list(update) for update in second] == [["synthesize_quest"]]
+    assert second[-1]["synthesize_quest"]["final_quest"].title == "Resumed Quest"
+    assert len(fake_llm.prompts) == 3  # One parse, two syntheses
+    # The completed run's thread is deleted; a further request starts afresh.
+    assert list(agent.checkpointer.list(None)) == []
+
+def test_failed_threads_are_shared_through_the_sqlite_database(tmp_path, monkeypatch):
+    """A failed run recorded by one process is found by another sharing the checkpoint database."""
+    monkeypatch.setattr("src.agent.checkpoints.FAILED_THREADS_MAX", 2)
+    path = str(tmp_path / "graph.sqlite3")
+    recorder = SqliteFailedThreads(sqlite3.connect(path))
+    assert recorder.remember("first", "thread-1") == []
+    assert recorder.remember("first", "thread-2") == ["thread-1"]
+    assert recorder.remember("second", "thread-3") == []
+    assert recorder.remember("third", "thread-4") == ["thread-2"]  # The oldest is pushed out
+
+    other_process = SqliteFailedThreads(sqlite3.connect(path))
+    assert other_process.take("first") is None
+    assert other_process.take("second") == "thread-3"
+    assert recorder.take("second") is None  # Taken once, by a single retry
+    assert recorder.take("third") == "thread-4"
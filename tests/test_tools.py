@@ -6,9 +6,23 @@ expected with controlled, mock data. They do not involve any LLM calls and
 should run quickly.
 """
 
+import json
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
 import pytest
-from src.core.models import Coordinates
-from src.tools import poi_retriever, transit_planner
+from datetime import date
+from pathlib import Path
+from src.core import serialization
+from src.core.cache import QueryCache, snap_to_grid
+from src.core.models import POI, Coordinates, Quest, TransitLeg
+from src.core.quest_store import QuestStore, quest_key
+from src.core.singleflight import SingleFlight
+from src.core.structs import construct_poi, extend_model
+from src.tools import (connection_scan, gtfs_compiler, poi_catalog, poi_filters, poi_retriever, reachability,
+                       tour_planner, transit_planner, travel_matrix)
 
 # --- Fixture for Mock POI Data ---
 
@@ -140,6 +154,578 @@ def test_plan_journey_no_route_too_late(mock_gtfs_data):
     
     assert plan is None
 
+# --- Fixture for a Multi-Trip GTFS Network ---
+
+@pytest.fixture
+def mock_gtfs_network(tmp_path, monkeypatch):
+    """
+    Creates a small GTFS network with several trips per route, including a slow
+    trip that is overtaken and a connecting tram, for time-dependent queries.
+    """
+    gtfs_dir = tmp_path / "gtfs_network"
+    gtfs_dir.mkdir()
+
+    stops_txt = (
+        "stop_id,stop_name,stop_lat,stop_lon\n"
+        "stop_A,Central Station,56.947,24.113\n"
+        "stop_B,Market,56.944,24.115\n"
+        "stop_C,University,56.950,24.105\n"
+        "stop_D,Zoo,56.980,24.160"
+    )
+    routes_txt = "route_id,route_short_name,route_type\nroute_1,10,3\nroute_2,7,0"
+    trips_txt = (
+        "route_id,service_id,trip_id,trip_headsign\n"
+        "route_1,weekday,trip_1,University\n"
+        "route_1,weekday,trip_slow,University\n"
+        "route_1,weekday,trip_2,University\n"
+        "route_1,weekday,trip_3,University\n"
+        "route_2,weekday,trip_4,Zoo"
+    )
+    stop_times_txt = (
+        "trip_id,arrival_time,departure_time,stop_id,stop_sequence\n"
+        "trip_1,10:00:00,10:00:00,stop_A,1\ntrip_1,10:05:00,10:05:00,stop_B,2\ntrip_1,10:10:00,10:10:00,stop_C,3\n"
+        "trip_slow,10:15:00,10:15:00,stop_A,1\ntrip_slow,10:35:00,10:35:00,stop_C,2\n"
+        "trip_2,10:20:00,10:20:00,stop_A,1\ntrip_2,10:25:00,10:25:00,stop_B,2\ntrip_2,10:30:00,10:30:00,stop_C,3\n"
+        "trip_3,10:40:00,10:40:00,stop_A,1\ntrip_3,10:45:00,10:45:00,stop_B,2\ntrip_3,10:50:00,10:50:00,stop_C,3\n"
+        "trip_4,10:32:00,10:32:00,stop_C,1\ntrip_4,10:50:00,10:50:00,stop_D,2"
+    )
+
+    (gtfs_dir / "stops.txt").write_text(stops_txt)
+    (gtfs_dir / "routes.txt").write_text(routes_txt)
+    (gtfs_dir / "trips.txt").write_text(trips_txt)
+    (gtfs_dir / "stop_times.txt").write_text(stop_times_txt)
+
+    monkeypatch.setattr(transit_planner, "GTFS_DATA_DIR", str(gtfs_dir))
+    return transit_planner.TransitPlanner()
+
+# --- Tests for Time-Dependent Queries ---
+
+CENTRAL = Coordinates(latitude=56.947, longitude=24.113)
+UNIVERSITY = Coordinates(latitude=56.950, longitude=24.105)
+
+def test_plan_journey_arrive_by_picks_latest_on_time_trip(mock_gtfs_network):
+    """Tests that arrive-by picks the trip arriving closest to the deadline."""
+    plan = mock_gtfs_network.plan_journey(CENTRAL, UNIVERSITY, arrival_time_str="10:40")
+
+    assert plan is not None
+    assert plan[0].departure_time == "10:15"
+    assert plan[0].arrival_time == "10:35"
+
+def test_plan_journey_depart_at_picks_earliest_arrival(mock_gtfs_network):
+    """Tests that depart-at prefers an overtaking trip over the first one to leave."""
+    plan = mock_gtfs_network.plan_journey(CENTRAL, UNIVERSITY, departure_time_str="10:12")
+
+    assert plan is not None
+    assert plan[0].departure_time == "10:20"
+    assert plan[0].arrival_time == "10:30"
+    assert plan[0].num_stops == 2
+
+def test_plan_journey_depart_at_too_late(mock_gtfs_network):
+    """Tests that no journey is returned after the last departure."""
+    assert mock_gtfs_network.plan_journey(CENTRAL, UNIVERSITY, departure_time_str="11:00") is None
+
+def test_plan_journey_requires_a_time(mock_gtfs_network):
+    """Tests that a query without arrival or departure time is rejected."""
+    assert mock_gtfs_network.plan_journey(CENTRAL, UNIVERSITY) is None
+
+def test_plan_journey_range_returns_pareto_options(mock_gtfs_network):
+    """Tests that the profile scan drops trips that are overtaken by later ones."""
+    journeys = mock_gtfs_network.plan_journey_range(CENTRAL, UNIVERSITY, "10:00", "10:45")
+
+    assert journeys is not None
+    departures = [journey[0].departure_time for journey in journeys]
+    assert departures == ["10:00", "10:20", "10:40"]
+
+def test_plan_journey_range_empty_window(mock_gtfs_network):
+    """Tests a departure window that contains no trips."""
+    assert mock_gtfs_network.plan_journey_range(CENTRAL, UNIVERSITY, "12:00", "13:00") is None
+
+# --- Tests for the Connection Scan Engine ---
+
+ZOO = Coordinates(latitude=56.980, longitude=24.160)
+
+@pytest.fixture
+def mock_csa_network(mock_gtfs_network):
+    """Loads the multi-trip GTFS network with the CSA engine selected."""
+    return transit_planner.TransitPlanner(engine="csa")
+
+def test_csa_engine_connections_sorted(mock_csa_network):
+    """Tests that stop_times are flattened into departure-sorted connections."""
+    engine = mock_csa_network.csa_engine
+    assert engine is not None
+    # 5 trips with 3, 2, 3, 3 and 2 stops give 2 + 1 + 2 + 2 + 1 connections
+    assert engine.num_connections == 8
+    assert list(engine.dep_time) == sorted(engine.dep_time)
+
+def test_csa_depart_at_matches_merge_engine(mock_gtfs_network, mock_csa_network):
+    """Tests that both engines agree on a direct depart-at query."""
+    merge_plan = mock_gtfs_network.plan_journey(CENTRAL, UNIVERSITY, departure_time_str="10:12")
+    csa_plan = mock_csa_network.plan_journey(CENTRAL, UNIVERSITY, departure_time_str="10:12")
+
+    assert csa_plan is not None
+    assert len(csa_plan) == 1
+    assert csa_plan[0].departure_time == merge_plan[0].departure_time
+    assert csa_plan[0].arrival_time == merge_plan[0].arrival_time
+    assert csa_plan[0].num_stops == merge_plan[0].num_stops
+
+def test_csa_finds_journey_with_transfer(mock_gtfs_network, mock_csa_network):
+    """Tests that CSA connects two trips where the merge engine finds nothing."""
+    assert mock_gtfs_network.plan_journey(CENTRAL, ZOO, departure_time_str="10:00") is None
+
+    plan = mock_csa_network.plan_journey(CENTRAL, ZOO, departure_time_str="10:00")
+    assert plan is not None
+    assert [leg.route_short_name for leg in plan] == ["10", "7"]
+    assert plan[0].end_stop_name == "University"
+    assert plan[1].arrival_time == "10:50"
+
+def test_csa_arrive_by_leaves_as_late_as_possible(mock_csa_network):
+    """Tests the latest-departure scan for arrive-by queries."""
+    plan = mock_csa_network.plan_journey(CENTRAL, ZOO, arrival_time_str="10:55")
+
+    assert plan is not None
+    assert plan[0].departure_time == "10:20"
+    assert plan[-1].arrival_time == "10:50"
+
+def test_csa_range_returns_pareto_options(mock_csa_network):
+    """Tests the profile query over the CSA engine."""
+    journeys = mock_csa_network.plan_journey_range(CENTRAL, UNIVERSITY, "10:00", "10:45")
+
+    assert journeys is not None
+    assert [journey[0].departure_time for journey in journeys] == ["10:00", "10:20", "10:40"]
+
+def _range_by_repeated_scans(engine, source, target, window_start_s, window_end_s):
+    """The (departure, arrival) options of a window from one earliest-arrival scan per option."""
+    # Departures from the source after the window, and any arrival back at it,
+    # are moved to a copy of the source: journeys may still pass through it, but
+    # only the departures within the window compete as options.
+    arrays = engine.to_arrays()
+    copy = len(arrays['stop_ids'])
+    arrays['dep_stop'] = np.where((arrays['dep_stop'] == source) & (arrays['dep_time'] > window_end_s),
+                                  copy, arrays['dep_stop'])
+    arrays['arr_stop'] = np.where(arrays['arr_stop'] == source, copy, arrays['arr_stop'])
+    arrays['stop_ids'] = np.append(arrays['stop_ids'], "copy")
+    arrays['stop_names'] = np.append(arrays['stop_names'], "Copy")
+    engine = connection_scan.ConnectionScanEngine.from_arrays(arrays)
+
+    options, departure_s = [], window_start_s
+    while departure_s <= window_end_s:
+        journey = engine.earliest_arrival(source, target, departure_s)
+        if not journey:
+            break
+        first, last = engine.leg_details(journey[0]), engine.leg_details(journey[-1])
+        if first['departure_s'] > window_end_s:
+            break
+        if options and options[-1][1] == last['arrival_s']:
+            options.pop()
+        options.append((first['departure_s'], last['arrival_s']))
+        departure_s = first['departure_s'] + 1
+    return options
+
+def test_csa_profile_scan_matches_repeated_scans():
+    """Tests the single profile scan against one earliest-arrival scan per option on a random network."""
+    rng = np.random.default_rng(7)
+    num_stops = 12
+    stops_df = pd.DataFrame({'stop_id': [f"s{i}" for i in range(num_stops)],
+                             'stop_name': [f"Stop {i}" for i in range(num_stops)]})
+    trips, rows = [], []
+    for trip in range(60):
+        trips.append({'trip_id': f"t{trip}", 'route_id': "r", 'trip_headsign': "Somewhere"})
+        time_s = int(rng.integers(6 * 3600, 9 * 3600))
+        for sequence, stop in enumerate(rng.choice(num_stops, size=int(rng.integers(2, 6)), replace=False)):
+            rows.append({'trip_id': f"t{trip}", 'stop_id': f"s{stop}", 'stop_sequence': sequence,
+                         'arrival_time': connection_scan.seconds_to_hhmm(time_s) + ":00",
+                         'departure_time': connection_scan.seconds_to_hhmm(time_s) + ":00"})
+            time_s += int(rng.integers(1, 15)) * 60
+    engine = connection_scan.ConnectionScanEngine(
+        pd.DataFrame(rows), pd.DataFrame(trips),
+        pd.DataFrame([{'route_id': "r", 'route_short_name': "1", 'route_type': 3}]), stops_df)
+
+    for source in range(num_stops):
+        for target in range(num_stops):
+            if source == target:
+                continue
+            options = engine.profile(source, target, 7 * 3600, 8 * 3600)
+            assert [(dep, arr) for dep, arr, _ in options] == _range_by_repeated_scans(
+                engine, source, target, 7 * 3600, 8 * 3600)
+            for departure_s, arrival_s, legs in options:
+                assert int(engine.dep_stop[legs[0][0]]) == source
+                assert int(engine.arr_stop[legs[-1][1]]) == target
+                assert int(engine.dep_time[legs[0][0]]) == departure_s
+                assert int(engine.arr_time[legs[-1][1]]) == arrival_s
+                for (_, exit_), (enter, _) in zip(legs, legs[1:]):
+                    assert engine.arr_stop[exit_] == engine.dep_stop[enter]
+                    assert engine.arr_time[exit_] <= engine.dep_time[enter]
+
+def test_csa_streaming_ingest_matches_in_memory_build(mock_gtfs_network, mock_csa_network):
+    """Tests that streaming stop_times in small chunks builds the same connections."""
+    in_memory = mock_gtfs_network.get_csa_engine()
+    streamed = mock_csa_network.csa_engine
+    assert mock_csa_network.timetable_df is None
+
+    chunked = transit_planner.ConnectionScanEngine.from_stop_times_csv(
+        str(Path(transit_planner.GTFS_DATA_DIR) / "stop_times.txt"),
+        mock_gtfs_network.timetable_df[['trip_id', 'route_id', 'trip_headsign']].drop_duplicates('trip_id'),
+        mock_gtfs_network.timetable_df[['route_id', 'route_short_name', 'route_type']].drop_duplicates('route_id'),
+        mock_gtfs_network.stops_df, chunk_rows=3)
+    for engine in (streamed, chunked):
+        for column in ('dep_stop', 'arr_stop', 'dep_time', 'arr_time', 'dep_seq', 'arr_seq'):
+            assert list(getattr(engine, column)) == list(getattr(in_memory, column))
+
+def test_csa_reload_rejects_unknown_stops(mock_csa_network):
+    """Tests that the streaming ingester reports stop_ids missing from stops.txt."""
+    with open(Path(transit_planner.GTFS_DATA_DIR) / "stop_times.txt", "a") as f:
+        f.write("\ntrip_4,11:00:00,11:00:00,stop_X,3")
+
+    assert mock_csa_network.reload(force=True) is False
+    assert mock_csa_network.version == 1
+
+def test_unknown_engine_is_rejected(mock_gtfs_network):
+    """Tests that the engine selector validates its argument."""
+    with pytest.raises(ValueError):
+        transit_planner.TransitPlanner(engine="dijkstra")
+
+# --- Tests for Batch Journey Planning ---
+
+def _batch_inputs():
+    """Three requests: a repeated stop pair at two times and an unreachable one."""
+    central = (CENTRAL.latitude, CENTRAL.longitude)
+    university = (UNIVERSITY.latitude, UNIVERSITY.longitude)
+    zoo = (ZOO.latitude, ZOO.longitude)
+    origins = [central, central, central]
+    destinations = [university, university, zoo]
+    arrival_times = ["10:40", None, "11:00"]
+    departure_times = [None, "10:12", None]
+    return origins, destinations, arrival_times, departure_times
+
+def test_plan_journeys_batch_matches_single_queries(mock_gtfs_network):
+    """Tests that batch results equal individual queries and keep input order."""
+    origins, destinations, arrival_times, departure_times = _batch_inputs()
+    results = mock_gtfs_network.plan_journeys_batch(origins, destinations, arrival_times, departure_times, max_workers=1)
+
+    assert len(results) == 3
+    assert results[0] == mock_gtfs_network.plan_journey(CENTRAL, UNIVERSITY, arrival_time_str="10:40")
+    assert results[1] == mock_gtfs_network.plan_journey(CENTRAL, UNIVERSITY, departure_time_str="10:12")
+    assert results[2] is None
+
+def test_plan_journeys_batch_process_pool(mock_gtfs_network, monkeypatch):
+    """Tests that fanning out across a process pool preserves order and results."""
+    monkeypatch.setattr(transit_planner, "BATCH_INLINE_THRESHOLD", 0)
+    origins, destinations, arrival_times, departure_times = _batch_inputs()
+    results = mock_gtfs_network.plan_journeys_batch(origins, destinations, arrival_times, departure_times, max_workers=2)
+
+    assert results[0][0].departure_time == "10:15"
+    assert results[1][0].departure_time == "10:20"
+    assert results[2] is None
+
+def test_plan_journeys_batch_length_mismatch(mock_gtfs_network):
+    """Tests that mismatched input arrays are rejected."""
+    with pytest.raises(ValueError):
+        mock_gtfs_network.plan_journeys_batch([(56.947, 24.113)], [], arrival_times=["10:00"])
+
+# --- Tests for the Travel-Time Matrix ---
+
+MATRIX_IDS = ["central", "university", "zoo"]
+MATRIX_COORDS = [CENTRAL, UNIVERSITY, ZOO]
+
+def test_travel_matrix_combines_transit_and_walking(mock_gtfs_network):
+    """Tests that entries take the faster of transit (with transfers) and walking."""
+    matrix = travel_matrix.compute_travel_matrix(MATRIX_IDS, MATRIX_COORDS, "10:00",
+                                                 planner=mock_gtfs_network, max_workers=1)
+
+    assert matrix.minutes.dtype.name == "uint16"
+    assert matrix.minutes.shape == (3, 3)
+    assert matrix.travel_time("central", "central") == 0
+    # Bus 10 to University, then tram 7 arriving at 10:50
+    assert matrix.travel_time("central", "zoo") == 50
+    # University is a short walk away, which beats waiting for the bus
+    assert matrix.travel_time("central", "university") < 10
+    assert [item_id for item_id, _ in matrix.reachable_from("central", 60)] == ["university", "zoo"]
+
+def test_travel_matrix_horizon_marks_unreachable(mock_gtfs_network):
+    """Tests that pairs beyond the horizon are stored as unreachable."""
+    matrix = travel_matrix.compute_travel_matrix(MATRIX_IDS, MATRIX_COORDS, "10:00", max_minutes=30,
+                                                 planner=mock_gtfs_network, max_workers=1)
+
+    assert matrix.travel_time("central", "zoo") is None
+    assert matrix.minutes[0, 2] == travel_matrix.UNREACHABLE_MINUTES
+
+def test_travel_matrix_parallel_matches_serial(mock_gtfs_network):
+    """Tests that computing rows across processes gives the same matrix."""
+    serial = travel_matrix.compute_travel_matrix(MATRIX_IDS, MATRIX_COORDS, "10:00",
+                                                 planner=mock_gtfs_network, max_workers=1)
+    parallel = travel_matrix.compute_travel_matrix(MATRIX_IDS, MATRIX_COORDS, "10:00",
+                                                   planner=mock_gtfs_network, max_workers=2)
+
+    assert (serial.minutes == parallel.minutes).all()
+
+def test_travel_matrix_save_and_reuse(mock_gtfs_network, mock_poi_data, tmp_path, monkeypatch):
+    """Tests persisting a POI matrix and reusing it instead of recomputing."""
+    path = str(tmp_path / "matrices" / "pois-1000.npz")
+    pois = mock_poi_data.pois
+    matrix = travel_matrix.load_or_compute_poi_travel_matrix(path, pois, "10:00",
+                                                             planner=mock_gtfs_network, max_workers=1)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("matrix should have been loaded from disk")
+    monkeypatch.setattr(travel_matrix, "compute_poi_travel_matrix", fail)
+    reloaded = travel_matrix.load_or_compute_poi_travel_matrix(path, pois, "10:00", planner=mock_gtfs_network)
+
+    assert reloaded.ids == [poi.poi_id for poi in pois]
+    assert (reloaded.minutes == matrix.minutes).all()
+
+def test_travel_matrix_recomputed_for_changed_feed_or_coordinates(mock_gtfs_network, mock_poi_data, tmp_path,
+                                                                  monkeypatch):
+    """Tests that a saved POI matrix is not reused once the feed or a POI's location changes."""
+    path = str(tmp_path / "matrices" / "pois-1000.npz")
+    pois = list(mock_poi_data.pois)
+    travel_matrix.load_or_compute_poi_travel_matrix(path, pois, "10:00", planner=mock_gtfs_network, max_workers=1)
+
+    computed = []
+    compute = travel_matrix.compute_poi_travel_matrix
+    monkeypatch.setattr(travel_matrix, "compute_poi_travel_matrix",
+                        lambda *args, **kwargs: computed.append(1) or compute(*args, **kwargs))
+
+    _add_evening_trip(Path(transit_planner.GTFS_DATA_DIR))
+    assert mock_gtfs_network.reload(force=True) is True
+    travel_matrix.load_or_compute_poi_travel_matrix(path, pois, "10:00", planner=mock_gtfs_network, max_workers=1)
+    assert len(computed) == 1
+
+    pois[0] = pois[0].copy(update={"coordinates": Coordinates(latitude=56.950, longitude=24.105)})
+    travel_matrix.load_or_compute_poi_travel_matrix(path, pois, "10:00", planner=mock_gtfs_network, max_workers=1)
+    assert len(computed) == 2
+
+    travel_matrix.load_or_compute_poi_travel_matrix(path, pois, "10:00", planner=mock_gtfs_network, max_workers=1)
+    assert len(computed) == 2
+
+# --- Tests for Reachability Queries ---
+
+@pytest.fixture
+def mock_reachability_index(mock_gtfs_network, mock_poi_data):
+    """Builds a reachability index over the GTFS network with an extra POI at the Zoo."""
+    zoo_poi = mock_poi_data.pois[0].copy(update={
+        "poi_id": "riga_zoo", "title": "Riga Zoo", "category": "Nature",
+        "coordinates": Coordinates(latitude=56.980, longitude=24.160),
+    })
+    mock_poi_data.pois.append(zoo_poi)
+    return reachability.ReachabilityIndex(mock_gtfs_network, mock_poi_data)
+
+def test_earliest_arrivals_from_coordinate(mock_gtfs_network):
+    """Tests the one-to-all search returns per-stop arrival times."""
+    arrivals = mock_gtfs_network.earliest_arrivals_from(CENTRAL, "10:00", max_minutes=60)
+
+    stop_ids = mock_gtfs_network.stops_df['stop_id'].tolist()
+    zoo_arrival = arrivals[stop_ids.index("stop_D")]
+    assert zoo_arrival == 10 * 3600 + 50 * 60
+
+def test_find_reachable_pois_uses_transit(mock_reachability_index):
+    """Tests that a POI too far to walk is reachable by transit within the budget."""
+    results = mock_reachability_index.find_reachable(CENTRAL, "10:00", budget_minutes=52)
+
+    zoo = [poi for poi in results if poi.poi_id == "riga_zoo"]
+    assert len(zoo) == 1
+    assert zoo[0].travel_minutes == 50
+    assert zoo[0].arrival_time == "10:50"
+    assert zoo[0].slack_minutes == 2
+
+def test_find_reachable_pois_ranked_by_slack(mock_reachability_index):
+    """Tests ranking, budget and category filtering."""
+    results = mock_reachability_index.find_reachable(CENTRAL, "10:00", budget_minutes=52)
+    slacks = [poi.slack_minutes for poi in results]
+    assert slacks == sorted(slacks, reverse=True)
+    assert results[0].poi_id == "riga_central_market"
+
+    tight = mock_reachability_index.find_reachable(CENTRAL, "10:00", budget_minutes=30)
+    assert "riga_zoo" not in [poi.poi_id for poi in tight]
+
+    nature = mock_reachability_index.find_reachable(CENTRAL, "10:00", budget_minutes=52, category="Nature")
+    assert [poi.poi_id for poi in nature] == ["riga_zoo"]
+
+def test_reachability_index_follows_reloaded_generation(mock_reachability_index, mock_gtfs_network):
+    """Tests that the POI-to-stop join is rebuilt for a reloaded feed whose stop rows moved."""
+    stops_path = Path(transit_planner.GTFS_DATA_DIR) / "stops.txt"
+    header, *rows = stops_path.read_text().splitlines()
+    stops_path.write_text("\n".join([header] + rows[::-1]))
+    assert mock_gtfs_network.reload(force=True) is True
+
+    results = mock_reachability_index.find_reachable(CENTRAL, "10:00", budget_minutes=52)
+    zoo = [poi for poi in results if poi.poi_id == "riga_zoo"]
+    assert len(zoo) == 1 and zoo[0].travel_minutes == 50
+
+def test_reachability_index_follows_poi_reload(mock_reachability_index, mock_poi_data):
+    """Tests that POIs added by a POI reload are joined to the stops and found."""
+    _write_poi_file(Path(poi_retriever.DATA_DIR) / "poi-extra.json", "zoo_gate", "Zoo Gate",
+                    latitude=56.980, longitude=24.160)
+    assert mock_poi_data.reload()
+
+    results = mock_reachability_index.find_reachable(CENTRAL, "10:00", budget_minutes=52)
+    gate = [poi for poi in results if poi.poi_id == "zoo_gate"]
+    assert len(gate) == 1 and gate[0].travel_minutes == 50
+
+# --- Tests for Hot-Reloading the GTFS Feed ---
+
+def _add_evening_trip(gtfs_dir):
+    """Appends a late trip_5 on route 10 to the network's stop_times and trips."""
+    with open(gtfs_dir / "trips.txt", "a") as f:
+        f.write("\nroute_1,weekday,trip_5,University")
+    with open(gtfs_dir / "stop_times.txt", "a") as f:
+        f.write("\ntrip_5,18:00:00,18:00:00,stop_A,1\ntrip_5,18:10:00,18:10:00,stop_C,2")
+
+def test_reload_skips_unchanged_feed(mock_gtfs_network):
+    """Tests that reloading an unchanged feed keeps the current generation."""
+    assert mock_gtfs_network.reload() is False
+    assert mock_gtfs_network.version == 1
+
+def test_reload_swaps_in_new_generation(mock_gtfs_network):
+    """Tests that a changed feed is loaded, validated and served."""
+    _add_evening_trip(Path(transit_planner.GTFS_DATA_DIR))
+    old_version = mock_gtfs_network.dataset_version
+
+    assert mock_gtfs_network.reload(force=True) is True
+    assert mock_gtfs_network.version == 2
+    assert mock_gtfs_network.dataset_version != old_version
+    plan = mock_gtfs_network.plan_journey(CENTRAL, UNIVERSITY, departure_time_str="17:00")
+    assert plan[0].departure_time == "18:00"
+
+def test_reload_rejects_invalid_feed(mock_gtfs_network):
+    """Tests that a broken feed is rejected and the old one keeps serving."""
+    (Path(transit_planner.GTFS_DATA_DIR) / "stop_times.txt").write_text("trip_id,arrival_time,departure_time,stop_id,stop_sequence\n")
+
+    assert mock_gtfs_network.reload(force=True) is False
+    assert mock_gtfs_network.version == 1
+    assert mock_gtfs_network.plan_journey(CENTRAL, UNIVERSITY, departure_time_str="10:12") is not None
+
+def test_inflight_queries_finish_on_old_generation(mock_gtfs_network):
+    """Tests pinning, and that a third generation waits for the retired one to drain."""
+    with mock_gtfs_network.pin_generation() as pinned:
+        assert mock_gtfs_network.reload(force=True) is True
+        # The pinning thread still sees generation 1 ...
+        assert mock_gtfs_network.version == 1
+        assert pinned.version == 1
+        # ... so a further reload must wait before building generation 3.
+        thread = mock_gtfs_network.reload_in_background(force=True)
+        thread.join(timeout=0.3)
+        assert thread.is_alive()
+
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+    assert mock_gtfs_network.version == 3
+
+# --- Tests for the Shared Timetable ---
+
+def test_attached_planner_matches_loader(mock_csa_network, tmp_path):
+    """Tests that a planner attached to a published timetable plans the same journeys."""
+    shared_dir = str(tmp_path / "shared")
+    assert mock_csa_network.publish_shared(shared_dir) is not None
+
+    attached = transit_planner.TransitPlanner.attach(shared_dir)
+    assert attached.timetable_df is None
+    assert not attached.csa_engine.dep_time.flags.writeable
+    assert attached.csa_engine.num_connections == mock_csa_network.csa_engine.num_connections
+
+    expected = mock_csa_network.plan_journey(CENTRAL, ZOO, departure_time_str="10:00")
+    plan = attached.plan_journey(CENTRAL, ZOO, departure_time_str="10:00")
+    assert [leg.dict() for leg in plan] == [leg.dict() for leg in expected]
+
+def test_attached_planner_picks_up_new_publish(mock_csa_network, tmp_path):
+    """Tests that reload re-attaches only after a new generation is published."""
+    shared_dir = str(tmp_path / "shared")
+    mock_csa_network.publish_shared(shared_dir)
+    attached = transit_planner.TransitPlanner.attach(shared_dir)
+    assert attached.reload() is False
+
+    _add_evening_trip(Path(transit_planner.GTFS_DATA_DIR))
+    mock_csa_network.reload(force=True)
+    mock_csa_network.publish_shared(shared_dir)
+
+    assert attached.reload() is True
+    plan = attached.plan_journey(CENTRAL, UNIVERSITY, departure_time_str="17:00")
+    assert plan[0].departure_time == "18:00"
+
+def test_pickled_attached_planner_keeps_its_generation(mock_csa_network, tmp_path):
+    """Tests that pool workers re-attach to the parent's generation and are never forked."""
+    shared_dir = str(tmp_path / "shared")
+    mock_csa_network.publish_shared(shared_dir)
+    attached = transit_planner.TransitPlanner.attach(shared_dir)
+    name = attached._current_generation().shared_name
+
+    _add_evening_trip(Path(transit_planner.GTFS_DATA_DIR))
+    mock_csa_network.reload(force=True)
+    mock_csa_network.publish_shared(shared_dir)
+
+    copy = pickle.loads(pickle.dumps(attached))
+    assert copy._current_generation().shared_name == name
+    assert transit_planner._pool_context().get_start_method() != "fork"
+
+def test_attach_requires_csa_engine(tmp_path):
+    """Tests that only the CSA engine can run on a shared timetable."""
+    with pytest.raises(ValueError):
+        transit_planner.TransitPlanner(engine="merge", shared_dir=str(tmp_path))
+
+# --- Tests for the GTFS Compiler ---
+
+def _add_calendar(gtfs_dir):
+    """Gives the network a weekday service from July 2025 to June 2026."""
+    (gtfs_dir / "calendar.txt").write_text(
+        "service_id,monday,tuesday,wednesday,thursday,friday,saturday,sunday,start_date,end_date\n"
+        "weekday,1,1,1,1,1,0,0,20250701,20260630"
+    )
+
+def test_compile_feed_writes_snapshot(mock_gtfs_network, tmp_path):
+    """Tests that a valid feed compiles to a snapshot a planner can attach to."""
+    gtfs_dir = Path(transit_planner.GTFS_DATA_DIR)
+    _add_calendar(gtfs_dir)
+    out_dir = tmp_path / "compiled"
+
+    report = gtfs_compiler.compile_feed(str(gtfs_dir), str(out_dir), today=date(2025, 9, 1))
+    assert report.ok, report.errors
+    assert report.stats['connections'] == 8
+    assert (out_dir / gtfs_compiler.REPORT_FILE).exists()
+
+    planner = transit_planner.TransitPlanner.attach(str(out_dir))
+    plan = planner.plan_journey(CENTRAL, ZOO, departure_time_str="10:00")
+    assert plan[-1].arrival_time == "10:50"
+
+def test_validate_feed_reports_integrity_errors(mock_gtfs_network, tmp_path):
+    """Tests that broken references, bad times and an expired calendar are reported."""
+    gtfs_dir = Path(transit_planner.GTFS_DATA_DIR)
+    _add_calendar(gtfs_dir)
+    with open(gtfs_dir / "trips.txt", "a") as f:
+        f.write("\nroute_9,weekday,trip_9,Nowhere")
+    with open(gtfs_dir / "stop_times.txt", "a") as f:
+        f.write("\ntrip_4,10:6x:00,10:60:00,stop_X,3")
+
+    report = gtfs_compiler.compile_feed(str(gtfs_dir), str(tmp_path / "compiled"), today=date(2026, 9, 1))
+    assert not report.ok
+    assert 'snapshot' not in report.stats
+    messages = " ".join(report.errors)
+    for expected in ("route_ids", "stop_ids", "malformed times", "expired"):
+        assert expected in messages
+
+def test_compile_feed_streams_stop_times_once(mock_gtfs_network, tmp_path, monkeypatch):
+    """Tests that compiling checks stop_times.txt on the chunks the connection ingest reads."""
+    gtfs_dir = Path(transit_planner.GTFS_DATA_DIR)
+    _add_calendar(gtfs_dir)
+    streams = []
+    read_csv = gtfs_compiler.pd.read_csv
+    def counting_read_csv(path, *args, **kwargs):
+        if kwargs.get('chunksize') and str(path).endswith("stop_times.txt"):
+            streams.append(path)
+        return read_csv(path, *args, **kwargs)
+    monkeypatch.setattr(gtfs_compiler.pd, "read_csv", counting_read_csv)
+
+    report = gtfs_compiler.compile_feed(str(gtfs_dir), str(tmp_path / "compiled"), today=date(2025, 9, 1),
+                                        chunk_rows=4)
+    assert report.ok, report.errors
+    assert len(streams) == 1
+    assert report.stats['stop_times'] == 13
+
+def test_validate_feed_missing_files(tmp_path):
+    """Tests that a feed without stop_times.txt fails validation up front."""
+    (tmp_path / "stops.txt").write_text("stop_id,stop_name,stop_lat,stop_lon\nstop_A,A,56.9,24.1")
+    report = gtfs_compiler.validate_feed(str(tmp_path))
+    assert not report.ok
+    assert "stop_times.txt" in report.errors[0]
+
 # --- Additional POI Retriever Tests for Complete Coverage ---
 
 def test_find_nearby_pois_with_radius_filter(mock_poi_data):
@@ -303,6 +889,44 @@ def test_haversine_distance_transit_function():
     assert distance > 0
     assert distance < 1.0  # Should be less than 1 km for these coordinates
 
+def test_geo_kernels_agree():
+    """Tests that the scalar, vectorized and point-set distance kernels agree."""
+    from src.core import geo
+
+    lats = np.array([56.950, 56.980, 57.400, 59.440])  # the last two are far from Riga
+    lons = np.array([24.105, 24.160, 24.500, 24.750])
+    points = geo.GeoPoints(lats, lons)
+    origin = Coordinates(latitude=56.947, longitude=24.113)
+
+    scalar = [geo.haversine_km(56.947, 24.113, lat, lon) for lat, lon in zip(lats, lons)]
+    assert np.allclose(geo.haversine_km_array(56.947, 24.113, lats, lons), scalar)
+    assert np.allclose(points.distances_from(origin, exact=True), scalar)
+    # The equirectangular fast path stays within its 1.5 m error bound.
+    assert np.abs(points.distances_from(origin) - scalar).max() < 0.0015
+    assert points.nearest(origin)[0] == 0
+
+def test_geo_within_uses_bounding_box(monkeypatch):
+    """Tests that radius queries only measure points inside the bounding box."""
+    from src.core import geo
+
+    rng = np.random.default_rng(1)
+    points = geo.GeoPoints(56.9 + rng.uniform(-0.2, 0.2, 500), 24.1 + rng.uniform(-0.3, 0.3, 500))
+    origin = Coordinates(latitude=56.95, longitude=24.1)
+
+    measured = []
+    haversine = geo.GeoPoints._haversine
+    def counting(self, latitude, longitude, subset=slice(None)):
+        distances = haversine(self, latitude, longitude, subset)
+        measured.append(len(distances))
+        return distances
+    monkeypatch.setattr(geo.GeoPoints, "_haversine", counting)
+
+    indices, distances = points.within(origin, 2.0)
+    expected = np.flatnonzero(points.distances_from(origin, exact=True) <= 2.0)
+    assert list(indices) == list(expected)
+    assert np.all(distances <= 2.0)
+    assert measured[0] < 100
+
 def test_find_nearest_stop(mock_gtfs_data):
     """Tests finding the nearest transit stop."""
     # Coordinates very close to Central Station
@@ -416,6 +1040,406 @@ def test_poi_retriever_missing_directory(monkeypatch):
     with pytest.raises(FileNotFoundError):
         poi_retriever.POIRetriever()
 
+# --- Tests for the Binary POI Catalog ---
+
+def test_poi_catalog_matches_json_load(mock_poi_data):
+    """Tests that a retriever over the catalog answers like the JSON-backed one."""
+    poi_catalog.build_catalog(poi_retriever.DATA_DIR)
+    retriever = poi_retriever.POIRetriever()
+
+    assert isinstance(retriever.pois, poi_catalog.LazyPOIList)
+    assert len(retriever.pois) == len(mock_poi_data.pois)
+    location = Coordinates(latitude=56.9445, longitude=24.1190)
+    expected = mock_poi_data.find_nearby_pois(location, radius_km=1.0)
+    assert [poi.dict() for poi in retriever.find_nearby_pois(location, radius_km=1.0)] == [poi.dict() for poi in expected]
+    assert retriever.get_poi_by_id("riga_central_market") == mock_poi_data.get_poi_by_id("riga_central_market")
+    assert [poi.poi_id for poi in retriever.get_pois_by_category("architecture")] == ["latvian_academy_of_sciences"]
+
+@pytest.mark.parametrize("encoding", ["json", pytest.param("msgpack", marks=pytest.mark.skipif(
+    poi_catalog.msgpack is None, reason="msgpack is not installed"))])
+def test_poi_catalog_decodes_lazily(mock_poi_data, encoding):
+    """Tests that only the POIs that are accessed get decoded."""
+    poi_catalog.build_catalog(poi_retriever.DATA_DIR, encoding=encoding)
+    retriever = poi_retriever.POIRetriever()
+
+    retriever.get_poi_by_id("latvian_academy_of_sciences")
+    assert list(retriever.pois._decoded) == [1]
+
+def test_stale_poi_catalog_is_ignored(mock_poi_data):
+    """Tests that edits to the JSON files after the build bypass the catalog."""
+    poi_catalog.build_catalog(poi_retriever.DATA_DIR)
+    poi_file = Path(poi_retriever.DATA_DIR) / "poi-test-data.json"
+    poi_file.write_text(poi_file.read_text().replace("Riga Central Market", "Central Market of Riga"))
+
+    retriever = poi_retriever.POIRetriever()
+    assert isinstance(retriever.pois, list)
+    assert retriever.get_poi_by_id("riga_central_market").title == "Central Market of Riga"
+
+# --- Tests for Structured POI Filters ---
+
+def test_parse_operating_hours():
+    """Tests the weekly bitmaps compiled from operating hours strings."""
+    def open_slots(text):
+        week = poi_filters.parse_operating_hours(text)
+        return None if week is None else [int(day.sum()) for day in week.reshape(7, -1)]
+
+    assert open_slots("24/7 (courtyard access)") == [96] * 7
+    assert open_slots("Tu-Sa 09:00-19:00, Su 09:00-17:00, Mo Closed") == [0, 40, 40, 40, 40, 40, 32]
+    # Past midnight the range continues into the next day.
+    assert open_slots("Fr-Sa 22:00-02:00") == [0, 0, 0, 0, 8, 16, 8]
+    # A later rule for the next day keeps the hours running into it.
+    assert open_slots("Su 22:00-02:00, Mo 09:00-17:00") == [40, 0, 0, 0, 0, 0, 8]
+    assert open_slots("Daily 09:00-17:00, Su 10:00-12:00") == [32, 32, 32, 32, 32, 32, 8]
+    assert open_slots("Mo,We 10:00-12:00, Fr-Sa 10:00-11:00") == [8, 0, 8, 0, 4, 4, 0]
+    assert open_slots("Varies by event schedule") is None
+    assert [poi_filters.parse_cost(cost) for cost in ("Free (courtyard access)", "€€", "Varies")] == [
+        0, 2, poi_filters.UNKNOWN_COST]
+
+def test_find_nearby_pois_with_filters(mock_poi_data):
+    """Tests filtering by opening hours, type, cost and duration."""
+    location = Coordinates(latitude=56.9445, longitude=24.1190)
+
+    def nearby_ids(**constraints):
+        filters = poi_filters.POIFilter(open_weekday=2, **constraints)
+        return [poi.poi_id for poi in mock_poi_data.find_nearby_pois(location, radius_km=5.0, filters=filters)]
+
+    assert nearby_ids(open_time="19:00") == ["latvian_academy_of_sciences"]
+    assert nearby_ids(open_time="17:00", stay_minutes=90) == ["latvian_academy_of_sciences"]
+    assert nearby_ids(open_time="08:00") == ["riga_central_market"]
+    assert nearby_ids(max_cost="Free") == ["riga_central_market"]
+    assert nearby_ids(max_duration_minutes=30) == ["latvian_academy_of_sciences"]
+    assert nearby_ids(poi_type="Outdoor") == []
+    assert nearby_ids(open_time="12:00", poi_type="Indoor", max_cost="€", max_duration_minutes=30) == [
+        "latvian_academy_of_sciences"]
+
+def test_poi_filters_from_catalog_match_json(mock_poi_data):
+    """Tests that the catalog's precompiled filter columns match the JSON-compiled ones."""
+    poi_catalog.build_catalog(poi_retriever.DATA_DIR)
+    retriever = poi_retriever.POIRetriever()
+    filters = poi_filters.POIFilter(open_weekday=6, open_time="20:00", max_cost="€")
+
+    assert retriever.filter_mask(filters=filters).tolist() == mock_poi_data.filter_mask(filters=filters).tolist()
+    assert not retriever.pois._decoded
+
+def test_nearby_cache_key_fixes_the_visit_weekday(mock_poi_data, monkeypatch):
+    """Tests that a filter without a weekday is cached per day of the visit, not shared across days."""
+    class FakeDateTime:
+        today = date(2024, 5, 15)  # A Wednesday
+
+        @classmethod
+        def now(cls):
+            return cls.today
+
+    monkeypatch.setattr(poi_retriever, "_poi_retriever_instance", mock_poi_data)
+    monkeypatch.setattr(poi_filters, "datetime", FakeDateTime)
+    filters = poi_filters.POIFilter(open_time="19:00")
+    assert filters.resolved().open_weekday == 2
+    assert poi_filters.POIFilter(open_time="19:00", open_weekday=6).resolved().open_weekday == 6
+
+    poi_retriever.retrieve_nearby_pois(56.9445, 24.1190, 5.0, filters=filters)
+    poi_retriever.retrieve_nearby_pois(56.9445, 24.1190, 5.0, filters=filters)
+    assert mock_poi_data.query_cache.stats()['hits'] == 1
+    FakeDateTime.today = date(2024, 5, 19)  # The Sunday after: not served Wednesday's POIs
+    poi_retriever.retrieve_nearby_pois(56.9445, 24.1190, 5.0, filters=filters)
+    assert mock_poi_data.query_cache.stats()['hits'] == 1
+    assert len(mock_poi_data.query_cache) == 2
+
+# --- Tests for Walking Tours ---
+
+def test_solve_orienteering_respects_budget_and_order():
+    """Tests that the solver picks the best-scoring POIs that fit and orders them along the way."""
+    # Start at 0 and end at 10 on a line; candidates at 2, 8, 5 and far off at 30.
+    positions = np.array([0, 10, 8, 2, 5, 30], dtype=np.float64)
+    travel = np.abs(positions[:, None] - positions[None, :])
+    visit = np.array([0, 0, 5, 5, 5, 5], dtype=np.float64)
+    score = np.array([0, 0, 1, 1, 3, 10], dtype=np.float64)
+
+    assert tour_planner.solve_orienteering(travel, visit, score, 9) == []
+    assert tour_planner.solve_orienteering(travel, visit, score, 15) == [4]
+    assert tour_planner.solve_orienteering(travel, visit, score, 25) == [3, 4, 2]
+    assert tour_planner.solve_orienteering(travel, visit, score, 5) == []
+
+def test_plan_tour_fits_budget(mock_poi_data):
+    """Tests that a planned tour visits the POIs in walking order within the budget."""
+    start = Coordinates(latitude=56.9440, longitude=24.1100)
+    end = Coordinates(latitude=56.9450, longitude=24.1280)
+
+    tour = tour_planner.plan_tour(start, end, budget_minutes=120, retriever=mock_poi_data)
+    assert [stop.poi_id for stop in tour.stops] == ["riga_central_market", "latvian_academy_of_sciences"]
+    assert tour.total_minutes <= 120
+    assert tour.visiting_minutes == 90
+    assert tour.stops[1].arrival_minute == tour.stops[0].walk_minutes + 60 + tour.stops[1].walk_minutes
+
+    short = tour_planner.plan_tour(start, end, budget_minutes=60, retriever=mock_poi_data)
+    assert [stop.poi_id for stop in short.stops] == ["latvian_academy_of_sciences"]
+    leg = short.to_walking_leg("Your Location", "Bus Stop")
+    assert [poi.poi_id for poi in leg.pois] == ["latvian_academy_of_sciences"]
+    assert type(leg.pois[0]) is POI
+    assert leg.pois[0] == mock_poi_data.get_poi_by_id("latvian_academy_of_sciences")
+    assert leg.duration_minutes == short.total_minutes
+
+    assert tour_planner.plan_tour(start, end, budget_minutes=5, retriever=mock_poi_data) is None
+
+# --- Tests for Internal Structs ---
+
+def test_struct_converters_match_validated_models(mock_poi_data):
+    """Tests that the unvalidated converters build the same models as validation does."""
+    poi = mock_poi_data.pois[0]
+    assert construct_poi(poi.dict()) == poi
+    nearby = extend_model(poi, poi_retriever.POIWithDistance, distance_km=0.5)
+    assert nearby == poi_retriever.POIWithDistance(**poi.dict(), distance_km=0.5)
+    assert nearby.dict()['practical_info']['type'] == "Indoor"
+
+def test_planned_legs_match_validated_models(mock_gtfs_network):
+    """Tests that the unvalidated legs of both journey planners equal validated TransitLegs."""
+    for engine in transit_planner.ENGINES:
+        planner = transit_planner.TransitPlanner(engine=engine)
+        plan = planner.plan_journey(CENTRAL, UNIVERSITY, departure_time_str="10:00")
+        assert plan
+        assert all(leg == TransitLeg(**leg.dict()) for leg in plan)
+
+# --- Tests for JSON Serialization ---
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_serialization_round_trips_models(mock_poi_data, monkeypatch, use_orjson):
+    """Tests that models encode like their dict() and decode straight back into models."""
+    if not use_orjson:
+        monkeypatch.setattr(serialization, "orjson", None)
+    elif serialization.orjson is None:
+        pytest.skip("orjson is not installed")
+    pois = mock_poi_data.find_nearby_pois(Coordinates(latitude=56.9445, longitude=24.1190), radius_km=1.0)
+
+    encoded = serialization.dumps(pois)
+    assert isinstance(encoded, bytes)
+    assert serialization.loads(encoded) == [json.loads(poi.json()) for poi in pois]
+    assert "Nēģu iela" in serialization.dumps_text(pois)
+    assert serialization.dumps_text(encoded) == serialization.dumps_text(pois)
+    assert serialization.decode_model(poi_retriever.POIWithDistance, serialization.dumps(pois[0])) == pois[0]
+
+def test_retrieve_nearby_pois_as_json_reuses_encoding(mock_poi_data, monkeypatch):
+    """Tests that the JSON tool output is encoded once and matches the dict output."""
+    monkeypatch.setattr(poi_retriever, "_poi_retriever_instance", mock_poi_data)
+    first = poi_retriever.retrieve_nearby_pois_as_json(56.9443, 24.1150, radius_km=5.0)
+    assert poi_retriever.retrieve_nearby_pois_as_json(56.9443, 24.1150, radius_km=5.0) is first
+    assert json.loads(first) == poi_retriever.retrieve_nearby_pois_as_dict(56.9443, 24.1150, radius_km=5.0)
+
+# --- Tests for the Query Cache ---
+
+def test_query_cache_lru_ttl_and_metrics():
+    """Tests LRU eviction, expiry after the TTL and the hit-rate counters."""
+    now = [0.0]
+    cache = QueryCache(max_entries=2, ttl_seconds=10, clock=lambda: now[0])
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == (True, 1)
+    cache.put("c", 3)  # Evicts "b", the least recently used.
+    assert cache.get("b") == (False, None)
+
+    now[0] = 11.0
+    assert cache.get("a") == (False, None)
+    assert cache.get_or_compute("a", lambda: 4) == 4
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions'], stats['expirations']) == (1, 3, 1, 1)
+    assert stats['hit_rate'] == 0.25
+
+def test_retrieve_nearby_pois_is_cached_until_reload(mock_poi_data, monkeypatch):
+    """Tests that nearby queries in the same grid cell hit the cache and reloads invalidate it."""
+    monkeypatch.setattr(poi_retriever, "_poi_retriever_instance", mock_poi_data)
+    first = poi_retriever.retrieve_nearby_pois(56.94430, 24.11500, radius_km=5.0)
+    second = poi_retriever.retrieve_nearby_pois(56.94432, 24.11502, radius_km=5.0)
+    assert [poi.poi_id for poi in second] == [poi.poi_id for poi in first]
+    assert mock_poi_data.query_cache.stats()['hits'] == 1
+
+    poi_file = Path(poi_retriever.DATA_DIR) / "poi-test-data.json"
+    poi_file.write_text(poi_file.read_text().replace("Riga Central Market", "Central Market of Riga"))
+    assert mock_poi_data.reload()
+    assert len(mock_poi_data.query_cache) == 0
+    titles = [poi.title for poi in poi_retriever.retrieve_nearby_pois(56.94430, 24.11500, radius_km=5.0)]
+    assert "Central Market of Riga" in titles
+
+def test_retrieve_nearby_pois_measures_from_the_query_point(mock_poi_data, monkeypatch):
+    """Tests that points sharing a grid cell share its candidates but are measured from their own location."""
+    monkeypatch.setattr(poi_retriever, "_poi_retriever_instance", mock_poi_data)
+    market = mock_poi_data.get_poi_by_id("riga_central_market").coordinates
+    locations = [Coordinates(latitude=56.94990 + offset, longitude=24.11010 + offset)
+                 for offset in (0.0001, 0.0, -0.0001)]
+    assert len({(snap_to_grid(location).latitude, snap_to_grid(location).longitude) for location in locations}) == 1
+    # Just far enough to include the market from the point closest to it.
+    radius_km = poi_retriever.haversine_distance(locations[0], market) + 1e-6
+
+    for location in locations:
+        expected = mock_poi_data.find_nearby_pois(location, radius_km)
+        assert poi_retriever.retrieve_nearby_pois(location.latitude, location.longitude, radius_km) == expected
+    assert [poi.poi_id for poi in mock_poi_data.find_nearby_pois(locations[0], radius_km)] == ["riga_central_market"]
+    assert mock_poi_data.query_cache.stats()['hits'] == len(locations) - 1
+
+def test_plan_transit_journey_is_cached_per_stop_pair(mock_csa_network, monkeypatch):
+    """Tests that journeys between the same nearest stops and minute share a cache entry."""
+    monkeypatch.setattr(transit_planner, "_transit_planner_instance", mock_csa_network)
+    first = transit_planner.plan_transit_journey(56.947, 24.113, 56.950, 24.105, departure_time="10:12")
+    second = transit_planner.plan_transit_journey(56.9471, 24.1131, 56.9501, 24.1049, departure_time="10:12")
+
+    assert [leg.dict() for leg in second] == [leg.dict() for leg in first]
+    assert mock_csa_network.query_cache.stats()['hits'] == 1
+    assert mock_csa_network.reload(force=True)
+    assert len(mock_csa_network.query_cache) == 0
+
+# --- Tests for Request Coalescing ---
+
+def test_single_flight_shares_concurrent_calls():
+    """Concurrent callers of a key wait for one call and share its result or error."""
+    import threading
+    flights = SingleFlight()
+    release = threading.Event()
+    calls, results = [], []
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return {"quest": "shared"}
+
+    threads = [threading.Thread(target=lambda: results.append(flights.do("key", compute))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    while flights.stats()['coalesced'] < 3:
+        release.wait(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False, True, True, True]
+    assert all(value is results[0][0] for value, _ in results)
+    assert flights.in_flight() == 0
+
+    # Nothing is kept after the call: the next caller computes again, and errors propagate.
+    def fail():
+        raise ValueError("failed")
+    with pytest.raises(ValueError):
+        flights.do("key", fail)
+    assert flights.do("key", lambda: 2) == (2, False)
+
+# --- Tests for the Quest Store ---
+
+def test_quest_store_versioning_expiry_and_eviction(tmp_path):
+    """Stored quests persist, are keyed per planned trip and dropped on version change, age or size."""
+    clock = [1000.0]
+    path = str(tmp_path / "quests.sqlite3")
+    store = QuestStore(path, max_entries=2, max_age_s=60, clock=lambda: clock[0])
+    quest = Quest(title="Commute", description="A stored quest.", legs=[], total_duration_minutes=15)
+
+    leg = {'vehicle_type': "Bus", 'route_short_name': "3", 'trip_headsign': "Centrs", 'start_stop_name': "A",
+           'end_stop_name': "B", 'departure_time': "15:05", 'arrival_time': "15:25", 'num_stops': 6}
+    key = quest_key("S1", "S2", [leg], "DISCOVERY")
+    assert key == quest_key("S1", "S2", [dict(leg)], "DISCOVERY")
+    store.put(key, "v1", quest)
+    store.close()
+
+    store = QuestStore(path, max_entries=2, max_age_s=60, clock=lambda: clock[0])
+    assert store.get(key, "v1").title == "Commute"
+    # Arrive-by 15:31 and 15:44 fall into the same quarter hour but are served by
+    # different trips; the later trip's quest must not be replayed for the earlier.
+    later_trip = dict(leg, departure_time="15:20", arrival_time="15:40")
+    assert quest_key("S1", "S2", [later_trip], "DISCOVERY") != key
+    assert store.get(quest_key("S1", "S2", [later_trip], "DISCOVERY"), "v1") is None
+    assert store.get(key, "v2") is None  # A new dataset version drops the old quests.
+    assert len(store) == 0
+
+    for name in ("a", "b", "c"):
+        clock[0] += 1
+        store.put(name, "v2", quest)
+    assert store.get("a", "v2") is None  # Least recently used beyond max_entries.
+    clock[0] += 61
+    assert store.get("c", "v2") is None  # Expired.
+    assert store.stats()['hits'] == 1
+    store.close()
+
+# --- Tests for Batch POI Retrieval ---
+
+def test_find_nearby_pois_batch_matches_single_queries(mock_poi_data, monkeypatch):
+    """A batch query returns, per point, exactly what a single query returns, and fills the cache."""
+    monkeypatch.setattr(poi_retriever, "_poi_retriever_instance", mock_poi_data)
+    retriever = mock_poi_data
+    points = [(56.9496, 24.1052), (56.9447, 24.1164), (56.9634, 24.1953), (0.0, 0.0)]
+    locations = [Coordinates(latitude=latitude, longitude=longitude) for latitude, longitude in points]
+
+    for category in (None, "Architecture"):
+        single = [retriever.find_nearby_pois(location, 2.0, 5, category) for location in locations]
+        batch = retriever.find_nearby_pois_batch(np.array(points), 2.0, 5, category)
+        assert [[poi.dict() for poi in pois] for pois in batch] == [[poi.dict() for poi in pois] for pois in single]
+    assert [len(pois) for pois in batch] == [1, 1, 0, 0]
+
+    monkeypatch.setattr(poi_retriever, "BATCH_CHUNK_ELEMENTS", 1)  # One query per chunk
+    assert ([len(pois) for pois in retriever.find_nearby_pois_batch(locations)]
+            == [len(retriever.find_nearby_pois(location)) for location in locations])
+
+    cached = poi_retriever.retrieve_nearby_pois_batch(points[:2], max_results=3)
+    assert retriever.query_cache.stats()['size'] == 2
+    assert poi_retriever.retrieve_nearby_pois(*points[0], max_results=3) == cached[0]
+    assert retriever.query_cache.stats()['hits'] == 1
+
+# --- Tests for Incremental POI Reloads ---
+
+def _write_poi_file(path, poi_id, title, latitude=56.95, longitude=24.11):
+    path.write_text(json.dumps({"pois": [{
+        "poi_id": poi_id, "title": title,
+        "coordinates": {"latitude": latitude, "longitude": longitude},
+        "address": "Riga", "category": "History", "description": "Test POI.",
+        "narrative_hooks": {"history": "Test hook."}, "media": {},
+        "practical_info": {"type": "Outdoor", "cost": "Free", "operating_hours": "00:00-24:00",
+                           "estimated_duration_minutes": 15},
+    }]}))
+
+def test_poi_reload_parses_only_changed_files(mock_poi_data, monkeypatch):
+    """Tests that a reload re-parses the edited file only and patches the indexes."""
+    pois_dir = Path(poi_retriever.DATA_DIR)
+    _write_poi_file(pois_dir / "poi-extra.json", "freedom_monument", "Freedom Monument")
+    assert mock_poi_data.reload()
+    assert mock_poi_data.get_poi_by_id("freedom_monument").title == "Freedom Monument"
+
+    parsed = []
+    load_poi_file = poi_retriever.load_poi_file
+    monkeypatch.setattr(poi_retriever, "load_poi_file",
+                        lambda path, content=None: parsed.append(os.path.basename(path)) or load_poi_file(path, content))
+    _write_poi_file(pois_dir / "poi-extra.json", "freedom_monument", "Brīvības piemineklis", latitude=56.9514)
+    assert mock_poi_data.reload()
+
+    assert parsed == ["poi-extra.json"]
+    assert len(mock_poi_data.pois) == 3
+    assert mock_poi_data.get_poi_by_id("freedom_monument").title == "Brīvības piemineklis"
+    assert mock_poi_data.get_poi_by_id("riga_central_market") is not None
+    nearby = mock_poi_data.find_nearby_pois(Coordinates(latitude=56.9514, longitude=24.11), radius_km=0.05)
+    assert [poi.poi_id for poi in nearby] == ["freedom_monument"]
+
+def test_poi_reload_skips_touched_and_drops_removed_files(mock_poi_data, monkeypatch):
+    """Tests that unchanged content is not re-parsed and deleted files disappear."""
+    pois_dir = Path(poi_retriever.DATA_DIR)
+    _write_poi_file(pois_dir / "poi-extra.json", "freedom_monument", "Freedom Monument")
+    mock_poi_data.reload()
+    monkeypatch.setattr(poi_retriever, "load_poi_file", lambda *args: pytest.fail("file was re-parsed"))
+
+    stat = os.stat(pois_dir / "poi-extra.json")
+    os.utime(pois_dir / "poi-extra.json", ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert not mock_poi_data.reload()
+
+    (pois_dir / "poi-extra.json").unlink()
+    assert mock_poi_data.reload()
+    assert mock_poi_data.get_poi_by_id("freedom_monument") is None
+    assert len(mock_poi_data.pois) == 2
+
+def test_poi_reload_patches_catalog_backed_index(mock_poi_data):
+    """Tests that a catalog-backed retriever keeps the unchanged files lazily decoded."""
+    pois_dir = Path(poi_retriever.DATA_DIR)
+    _write_poi_file(pois_dir / "poi-extra.json", "freedom_monument", "Freedom Monument")
+    poi_catalog.build_catalog(str(pois_dir))
+    retriever = poi_retriever.POIRetriever()
+
+    _write_poi_file(pois_dir / "poi-extra.json", "freedom_monument", "Brīvības piemineklis")
+    assert retriever.reload()
+    assert retriever.get_poi_by_id("freedom_monument").title == "Brīvības piemineklis"
+    assert isinstance(retriever._index.files[1].pois, poi_catalog.LazyPOIList)
+    assert retriever.get_poi_by_id("riga_central_market").title == "Riga Central Market"
+
 # --- Edge Case Tests ---
 
 def test_empty_coordinates_handling():